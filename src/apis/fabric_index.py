@@ -0,0 +1,201 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from json import loads
+from os import path
+from typing import Any, Optional
+from urllib.error import HTTPError
+
+from ..common.cache import CACHE_DIR
+from ..common.database import database
+from ..common.session import session, read_decoded, ACCEPT_ENCODING
+from ..typings import (
+    AllVersions, GameVersion, IntermediaryVersion, LoaderVersion, YarnVersion
+)
+
+# The full database of fabric versions, see `fabric_meta.versions.all()`
+all_versions_url = "https://meta.fabricmc.net/v2/versions/"
+
+# The file the index is stored in
+INDEX_FILE = path.join(CACHE_DIR, 'fabric-versions.db') if CACHE_DIR else ''
+
+# The columns of a version with their key in the api
+_FIELDS = (('version', 'version'), ('stable', 'stable'), ('maven', 'maven'),
+           ('separator', 'separator'), ('build', 'build'),
+           ('game_version', 'gameVersion'), ('url', 'url'))
+
+
+def _row(kind: str, position: int, version: dict[str, Any]) -> tuple[Any, ...]:
+    "Convert a version of the api to a row of the index"
+    return (kind, position, *(version.get(key) for _, key in _FIELDS))
+
+
+class fabric_index(database):
+    def __init__(self, fname: str = INDEX_FILE) -> None:
+        """
+        A local index of all fabric versions, made from `versions.all()`
+        with `sync()`. It can be queried without sending any requests.
+        It's safe to use from multiple threads.
+
+        :param fname: The sqlite file of the index, `''` keeps it in memory
+        """
+
+        super().__init__(fname, """
+            CREATE TABLE IF NOT EXISTS versions (
+                kind TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                version TEXT NOT NULL,
+                stable INTEGER NOT NULL,
+                maven TEXT,
+                separator TEXT,
+                build INTEGER,
+                game_version TEXT,
+                url TEXT,
+                PRIMARY KEY (kind, version)
+            );
+            CREATE INDEX IF NOT EXISTS versions_stable ON versions (kind, stable, position);
+            CREATE INDEX IF NOT EXISTS versions_game ON versions (kind, game_version, position);
+            CREATE INDEX IF NOT EXISTS versions_build ON versions (kind, build);
+            CREATE TABLE IF NOT EXISTS sync (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+    def sync(self) -> tuple[int, int, int]:
+        """
+        Update the index with `versions.all()`. It's only downloaded if it
+        changed since the last sync, and only the versions that changed are
+        written. Returns the amount of added, changed and removed versions.
+        """
+
+        req_headers = {'Accept-Encoding': ACCEPT_ENCODING}
+
+        with self._lock:
+            if (etag := self._db.execute(
+                    "SELECT value FROM sync WHERE key = 'etag'").fetchone()) is not None:
+                req_headers['If-None-Match'] = etag[0]
+
+        try:
+            with session.open(all_versions_url, req_headers) as resp:
+                all_versions: AllVersions = loads(read_decoded(resp))
+                etag = resp.headers.get('ETag')
+        except HTTPError as e:
+            e.close()
+            if e.code == 304:
+                return 0, 0, 0
+            raise
+
+        # Every list in it is a kind of version, like 'game' or 'loader'. They're
+        # newest first, so they're numbered from the end to keep the numbers
+        # of the older versions when new ones are added
+        rows: dict[tuple[str, str], tuple[Any, ...]] = {}
+        for kind, kind_versions in all_versions.items():
+            for index, version in enumerate(kind_versions):
+                rows[kind, version['version']] = _row(kind, len(kind_versions) - index, version)
+
+        with self._lock, self._db:
+            current = {(row[0], row[2]): row for row in self._db.execute(
+                "SELECT * FROM versions")}
+
+            changed = [row for key, row in rows.items() if current.get(key) != row]
+            removed = [key for key in current if key not in rows]
+
+            self._db.executemany("INSERT OR REPLACE INTO versions VALUES "
+                                 "(?, ?, ?, ?, ?, ?, ?, ?, ?)", changed)
+            self._db.executemany("DELETE FROM versions WHERE kind = ? AND version = ?", removed)
+
+            if etag is not None:
+                self._db.execute("INSERT OR REPLACE INTO sync VALUES ('etag', ?)", (etag,))
+
+        added = sum(key not in current for key in rows)
+        return added, len(changed) - added, len(removed)
+
+    def _select(self, kind: str, where: str = '', args: tuple[Any, ...] = (),
+                order: str = 'position DESC', limit: int = -1) -> list[dict[str, Any]]:
+        "Get the versions of a kind like the api lists them, newest first by default"
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(column for column, _ in _FIELDS)} FROM versions "
+                f"WHERE kind = ?{where} ORDER BY {order} LIMIT ?", (kind, *args, limit)
+            ).fetchall()
+
+        return [{key: bool(value) if key == 'stable' else value
+                 for (_, key), value in zip(_FIELDS, row) if value is not None}
+                for row in rows]
+
+    @staticmethod
+    def _stable(stable: Optional[bool]) -> tuple[str, tuple[Any, ...]]:
+        return ('', ()) if stable is None else (' AND stable = ?', (stable,))
+
+    def game(self, stable: Optional[bool] = None) -> list[GameVersion]:
+        """
+        List the game versions
+
+        :param stable: Only list (un)stable versions, or all of them if `None`
+        """
+
+        return self._select('game', *self._stable(stable))  # type: ignore
+
+    def intermediary(self, game_version: Optional[str] = None) -> list[IntermediaryVersion]:
+        """
+        List the intermediary versions
+
+        :param game_version: Only list the one of this game version
+        """
+
+        if game_version is None:
+            return self._select('intermediary')  # type: ignore
+        return self._select('intermediary', ' AND version = ?', (game_version,))  # type: ignore
+
+    def yarn(self, game_version: Optional[str] = None) -> list[YarnVersion]:
+        """
+        List the yarn versions
+
+        :param game_version: Only list the ones of this game version
+        """
+
+        if game_version is None:
+            return self._select('mappings')  # type: ignore
+        return self._select('mappings', ' AND game_version = ?', (game_version,))  # type: ignore
+
+    def loader(self, stable: Optional[bool] = None) -> list[LoaderVersion]:
+        """
+        List the loader versions
+
+        :param stable: Only list (un)stable versions, or all of them if `None`
+        """
+
+        return self._select('loader', *self._stable(stable))  # type: ignore
+
+    def latest_loader(self, game_version: str, stable: bool = True) -> Optional[LoaderVersion]:
+        """
+        Get the newest loader that can be used with a game version, or
+        `None` if fabric doesn't support it
+
+        :param game_version: The minecraft version
+        :param stable: Only use stable loaders
+        """
+
+        if not self.intermediary(game_version):
+            return None
+
+        # The build is only the last part of the version,
+        # so the newest is the first one the api lists
+        where, args = self._stable(True if stable else None)
+        loaders = self._select('loader', where, args, limit=1)
+
+        return loaders[0] if loaders else None  # type: ignore
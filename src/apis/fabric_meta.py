@@ -16,8 +16,6 @@
 
 from json import loads
 from typing import Literal, Optional, overload
-from urllib import request
-from http.client import HTTPResponse
 from ..typings import (
     # Versions
     GameVersion, IntermediaryVersion,
@@ -28,6 +26,12 @@ from ..typings import (
 )
 
 from ..common.maven_coords import maven_parse
+from ..common.response_cache import meta_cache
+
+# The seconds a response is used before asking if it changed. Lists
+# of versions change with every release, a single version doesn't
+LIST_TTL = 600.0
+VERSION_TTL = 7 * 24 * 3600.0
 
 
 def api_url(url: str, *paths: str) -> str:
@@ -53,9 +57,8 @@ class versions:
         "Full database, includes all the data. Warning: large JSON."
 
         url = api_url(self._base_url)
-        response: HTTPResponse = request.urlopen(url)
 
-        return loads(response.read())
+        return loads(meta_cache.get(url, LIST_TTL))
 
     def yarn(self) -> list[YarnVersion]:
         """
@@ -68,9 +71,7 @@ class versions:
         else:
             url = api_url(self._base_url, 'yarn', self.game_version)
 
-        response: HTTPResponse = request.urlopen(url)
-
-        return loads(response.read())
+        return loads(meta_cache.get(url, LIST_TTL))
 
     def intermediary(self) -> list[IntermediaryVersion]:
         """
@@ -83,9 +84,7 @@ class versions:
         else:
             url = api_url(self._base_url, 'intermediary', self.game_version)
 
-        response: HTTPResponse = request.urlopen(url)
-
-        return loads(response.read())
+        return loads(meta_cache.get(url, LIST_TTL))
 
 
 class game:
@@ -98,25 +97,22 @@ class game:
         "Lists all of the supported game versions."
 
         url = api_url(self._base_url)
-        response: HTTPResponse = request.urlopen(url)
 
-        return loads(response.read())
+        return loads(meta_cache.get(url, LIST_TTL))
 
     def yarn(self) -> list[GameVersion]:
         "Lists all of the compatible game versions for yarn."
 
         url = api_url(self._base_url, 'yarn')
-        response: HTTPResponse = request.urlopen(url)
 
-        return loads(response.read())
+        return loads(meta_cache.get(url, LIST_TTL))
 
     def intermediary(self) -> list[GameVersion]:
         "Lists all of the compatible game versions for intermediary."
 
         url = api_url(self._base_url, 'intermediary')
-        response: HTTPResponse = request.urlopen(url)
 
-        return loads(response.read())
+        return loads(meta_cache.get(url, LIST_TTL))
 
 
 class loader:
@@ -180,8 +176,8 @@ class loader:
                 "'loader_version' may not be passed when 'game_version' is None"
             )
 
-        response: HTTPResponse = request.urlopen(api_url(self._url))
-        self.result: LoaderJson = loads(response.read().decode('utf-8'))
+        self.result: LoaderJson = loads(meta_cache.get(
+            api_url(self._url), VERSION_TTL if self._complete else LIST_TTL))
 
         self.loader = self.result['loader']
         self.intermediary = self.result['intermediary']
@@ -220,9 +216,8 @@ class loader:
             )
 
         url = api_url(self._url, 'profile', 'json')
-        response: HTTPResponse = request.urlopen(url)
 
-        return loads(response.read().decode('utf-8'))
+        return loads(meta_cache.get(url, VERSION_TTL))
 
     def profile_zip(self) -> bytes:
         "Downloads a zip file with the launcher's profile json, and the dummy jar. To be extracted into .minecraft/versions"
@@ -233,9 +228,8 @@ class loader:
             )
 
         url = api_url(self._url, 'profile', 'zip')
-        response: HTTPResponse = request.urlopen(url)
 
-        return response.read()
+        return meta_cache.get(url, VERSION_TTL, archive=True)
 
     def server_json(self) -> bytes:
         "Returns the JSON file in format of the launcher JSON, but with the server's main class."
@@ -246,6 +240,5 @@ class loader:
             )
 
         url = api_url(self._url, 'server', 'json')
-        response: HTTPResponse = request.urlopen(url)
 
-        return response.read()
+        return meta_cache.get(url, VERSION_TTL)
@@ -14,22 +14,89 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from http.client import HTTPResponse
+from hashlib import sha1
 from json import loads
-from urllib import request
+from os import makedirs, path
+from threading import Lock
+from typing import Optional
 
-
-from ..typings import MinecraftJson
+from ..common.cache import CACHE_DIR, atomic_write
+from ..common.response_cache import meta_cache
+from ..common.session import session
+from ..typings import ManifestVersion, MinecraftJson, VersionManifest
 
 version_manifest_v2 = "https://piston-meta.mojang.com/mc/game/version_manifest_v2.json"
 
+# The seconds the version manifest is used before asking if it changed
+MANIFEST_TTL = 600.0
+
+# The version jsons are kept here by their sha1 hash,
+# an empty string doesn't keep them
+META_DIR = path.join(CACHE_DIR, 'piston-meta') if CACHE_DIR else ''
+
+# The versions of the manifest by their id
+_index: dict[str, ManifestVersion] = {}
+_manifest: Optional[bytes] = None
+_lock = Lock()
+
+
+def _write(fname: str, data: bytes) -> None:
+    "Write a file in the meta directory, without leaving it incomplete"
+    try:
+        makedirs(path.dirname(fname), exist_ok=True)
+        with atomic_write(fname) as temp, open(temp, 'wb') as fp:
+            fp.write(data)
+    except OSError:
+        pass  # It's downloaded again next time
+
+
+def version_index() -> dict[str, ManifestVersion]:
+    """
+    Get the versions of the version manifest by their id. The manifest
+    is cached, and only asked for again after `MANIFEST_TTL` seconds.
+    """
+
+    global _index, _manifest
+
+    data = meta_cache.get(version_manifest_v2, MANIFEST_TTL)
+
+    with _lock:
+        # Only index it again if it changed
+        if data is not _manifest:
+            manifest: VersionManifest = loads(data)
+            _index = {version['id']: version for version in manifest['versions']}
+            _manifest = data
+
+        return _index
+
 
 def get_minecraft_json(mc_version: str) -> MinecraftJson:
-    """Get the minecraft json from a minecraft"""
-    res: HTTPResponse = request.urlopen(version_manifest_v2)
-    for item in loads(res.read().decode('utf-8'))['versions']:
-        if item['id'] == mc_version:
-            res = request.urlopen(item['url'])
-            return loads(res.read().decode('utf-8'))
-
-    raise KeyError("Couldn't find minecraft version in version manifest")
+    """
+    Get the minecraft json of a minecraft version. It's stored by its
+    sha1 hash, and only downloaded if the stored one doesn't match it.
+
+    :param mc_version: The minecraft version
+    """
+
+    if (version := version_index().get(mc_version)) is None:
+        raise KeyError("Couldn't find minecraft version in version manifest")
+
+    fname = path.join(META_DIR, 'versions', version['sha1'][:2], version['sha1'] + '.json')
+
+    # Use the stored one if it's intact
+    if META_DIR:
+        try:
+            with open(fname, 'rb') as fp:
+                if sha1(data := fp.read()).hexdigest() == version['sha1']:
+                    return loads(data)
+        except OSError:
+            pass
+
+    data = session.read(version['url'])
+    if sha1(data).hexdigest() != version['sha1']:
+        raise ValueError(f"The minecraft json of {mc_version} doesn't match its hash")
+
+    if META_DIR:
+        _write(fname, data)
+
+    return loads(data)
@@ -0,0 +1,172 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from hashlib import sha1 as _sha1, sha256
+from os import path, getenv, link, makedirs, remove, replace
+from shutil import copyfile
+from sys import platform
+from typing import Iterator, Optional
+from uuid import uuid4
+
+# Define the cache directory
+_cache_dirs = {
+    "win32": path.join(getenv('LOCALAPPDATA', ''), "mcm-manager", "cache"),
+    "linux": path.join(getenv('XDG_CACHE_HOME', path.join(path.expanduser("~"), ".cache")), "mcm-manager"),
+    "darwin": path.join(path.expanduser("~"), "Library", "Caches", "mcm-manager"),
+}
+
+# It can be changed with MCM_CACHE_DIR, an empty string disables the cache
+CACHE_DIR = getenv('MCM_CACHE_DIR', _cache_dirs.get(platform, ''))
+
+
+def file_sha1(fname: str) -> str:
+    "Calculate the sha1 hash of a file"
+    hash = _sha1()
+
+    with open(fname, 'rb') as fp:
+        while data := fp.read(1024 ** 2):
+            hash.update(data)
+
+    return hash.hexdigest()
+
+
+@contextmanager
+def atomic_write(fname: str) -> Iterator[str]:
+    """
+    Get a temporary path to write `fname` to, which replaces `fname` once
+    the with-statement ends, so `fname` is never incomplete. The temporary
+    file is removed if writing it fails.
+
+    :param fname: The path of the file that's written
+    """
+
+    temp = f"{fname}.{uuid4().hex}.tmp"
+
+    try:
+        yield temp
+        replace(temp, fname)
+    except BaseException:
+        if path.isfile(temp):
+            remove(temp)
+        raise
+
+
+def place_file(src: str, dest: str) -> None:
+    "Hardlink or, if that isn't possible, copy a file to `dest`"
+    with atomic_write(dest) as temp:
+        try:
+            link(src, temp)
+        except OSError:
+            copyfile(src, temp)
+
+
+class download_cache:
+    def __init__(self, cache_dir: str = CACHE_DIR) -> None:
+        """
+        A content-addressed cache of downloaded files, shared by all
+        install paths. Files are stored by their sha1 hash and can be
+        found by their url or their hash. They're placed in an install
+        path using a hardlink, or by copying if that isn't possible.
+
+        :param cache_dir: The directory of the cache, `''` disables it
+        """
+
+        self.cache_dir = cache_dir
+        self.enabled = cache_dir != ''
+
+        self.objects_dir = path.join(cache_dir, 'objects')
+        self.urls_dir = path.join(cache_dir, 'urls')
+
+    def _object(self, sha1: str) -> str:
+        "The path of a file with a sha1 hash"
+        return path.join(self.objects_dir, sha1[:2], sha1)
+
+    def _url(self, url: str) -> str:
+        "The path of the index file of an url"
+        url_hash = sha256(url.encode('utf-8')).hexdigest()
+        return path.join(self.urls_dir, url_hash[:2], url_hash)
+
+    def lookup(self, url: str, sha1: Optional[str] = None,
+               by_url: bool = True) -> Optional[str]:
+        """
+        Find a cached file by its hash or url and return its path
+
+        :param url: The url the file was downloaded from
+        :param sha1: The sha1 hash of the file, if it's known
+        :param by_url: If it can be found by its url, which is only
+                       right for urls of which the file never changes
+        """
+
+        if not self.enabled:
+            return None
+
+        # Find it by hash
+        if sha1 is not None:
+            return obj if path.isfile(obj := self._object(sha1.lower())) else None
+
+        # Find it by url
+        if not by_url:
+            return None
+
+        try:
+            with open(self._url(url)) as fp:
+                obj = self._object(fp.read().strip())
+        except FileNotFoundError:
+            return None
+
+        return obj if path.isfile(obj) else None
+
+    def fill(self, url: str, fname: str, sha1: Optional[str] = None,
+             by_url: bool = True) -> Optional[str]:
+        """
+        Place a cached file at `fname`. Returns its sha1 hash if it was cached
+
+        :param url: The url the file was downloaded from
+        :param fname: The path the file is placed
+        :param sha1: The sha1 hash of the file, if it's known
+        :param by_url: If it can be found by its url, see `lookup()`
+        """
+
+        if (obj := self.lookup(url, sha1, by_url)) is None:
+            return None
+
+        place_file(obj, fname)
+        return path.basename(obj)
+
+    def add(self, url: str, fname: str, sha1: Optional[str] = None) -> None:
+        """
+        Add a downloaded file to the cache
+
+        :param url: The url the file was downloaded from
+        :param fname: The path of the downloaded file
+        :param sha1: The sha1 hash of the file, if it's already calculated
+        """
+
+        if not self.enabled:
+            return
+
+        sha1 = file_sha1(fname) if sha1 is None else sha1.lower()
+
+        # Add the file
+        if not path.isfile(obj := self._object(sha1)):
+            makedirs(path.dirname(obj), exist_ok=True)
+            place_file(fname, obj)
+
+        # Add the url to the index
+        makedirs(path.dirname(url_file := self._url(url)), exist_ok=True)
+        with atomic_write(url_file) as temp, open(temp, 'w') as fp:
+            fp.write(sha1)
@@ -0,0 +1,57 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sqlite3
+from os import makedirs, path
+from threading import Lock
+from typing import Any, TypeVar
+
+_T = TypeVar('_T', bound='database')
+
+
+class database:
+    def __init__(self, fname: str, schema: str) -> None:
+        """
+        A sqlite database that's safe to use from multiple threads,
+        as long as every use of `_db` holds `_lock`
+
+        :param fname: The sqlite file, `''` keeps it in memory
+        :param schema: The statements that create the tables if they don't exist
+        """
+
+        if fname:
+            makedirs(path.dirname(path.abspath(fname)), exist_ok=True)
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(fname or ':memory:', check_same_thread=False)
+
+        with self._db:
+            self._db.executescript(schema)
+
+    def close(self) -> None:
+        "Close the database"
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self: _T) -> _T:
+        "Allow a with-as statement"
+
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        "Close the database at the end of a with-as statement"
+
+        self.close()
@@ -0,0 +1,166 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from hashlib import sha256
+from http.client import HTTPException
+from json import dump, load
+from os import makedirs, path
+from threading import Lock
+from time import time
+from typing import Any, Optional
+from urllib.error import HTTPError
+
+from .cache import CACHE_DIR, atomic_write
+from .session import session, read_decoded, ACCEPT_ENCODING
+
+# The amount of responses kept in memory
+MAX_ENTRIES = 64
+
+
+class response_cache:
+    def __init__(self, cache_dir: str = path.join(CACHE_DIR, 'responses') if CACHE_DIR else '',
+                 max_entries: int = MAX_ENTRIES) -> None:
+        """
+        Caches api responses in memory and on the disk. A response is
+        used for as long as the ttl that's passed with it, after which
+        it's revalidated with its ETag and Last-Modified. When the host
+        can't be reached, or with `offline`, the cached response is used.
+
+        :param cache_dir: The directory of the cache, `''` only keeps them in memory
+        :param max_entries: The amount of responses kept in memory, the least
+                            recently used ones are only kept on the disk
+        """
+
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.offline = False
+
+        # The bodies and validators per url
+        self._memory: OrderedDict[str, tuple[bytes, dict[str, Any]]] = OrderedDict()
+        self._lock = Lock()
+
+    def _path(self, url: str) -> str:
+        "The path of the body of a url, the validators get a .json suffix"
+        url_hash = sha256(url.encode('utf-8')).hexdigest()
+        return path.join(self.cache_dir, url_hash[:2], url_hash)
+
+    def _load(self, url: str) -> tuple[Optional[bytes], dict[str, Any]]:
+        "Get a response from the disk"
+        if not self.cache_dir:
+            return None, {}
+
+        try:
+            with open(self._path(url), 'rb') as fp:
+                data = fp.read()
+            with open(self._path(url) + '.json') as fp:
+                return data, load(fp)
+        except (OSError, ValueError):
+            return None, {}
+
+    def _store(self, url: str, data: Optional[bytes], meta: dict[str, Any]) -> None:
+        "Write a response to the disk, only the validators if `data` is `None`"
+        if not self.cache_dir:
+            return
+
+        fname = self._path(url)
+
+        try:
+            makedirs(path.dirname(fname), exist_ok=True)
+            if data is not None:
+                with atomic_write(fname) as temp, open(temp, 'wb') as fp:
+                    fp.write(data)
+
+            with atomic_write(fname + '.json') as temp, open(temp, 'w') as fp:
+                dump(meta, fp)
+        except OSError:
+            pass  # It's requested again next time
+
+    def _remember(self, url: str, data: bytes, meta: dict[str, Any]) -> None:
+        "Keep a response in memory"
+        with self._lock:
+            self._memory[url] = (data, meta)
+            self._memory.move_to_end(url)
+
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, url: str, ttl: float, archive: bool = False) -> bytes:
+        """
+        Get the body of a url
+
+        :param url: The url to request
+        :param ttl: The seconds the response is used before it's revalidated
+        :param archive: If it's an archive like a zip, which is requested
+                        as it is and only kept on the disk
+        """
+
+        with self._lock:
+            data, meta = self._memory.get(url, (None, {}))
+
+        if data is None:
+            data, meta = self._load(url)
+
+        if data is not None and (self.offline or time() - meta.get('validated', 0) < ttl):
+            if not archive:
+                self._remember(url, data, meta)
+            return data
+
+        if self.offline:
+            raise LookupError(f"{url} isn't cached, and the cache is offline")
+
+        # Archives are already compressed
+        req_headers = {} if archive else {'Accept-Encoding': ACCEPT_ENCODING}
+        if data is not None and 'etag' in meta:
+            req_headers['If-None-Match'] = meta['etag']
+        if data is not None and 'last_modified' in meta:
+            req_headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            with session.open(url, req_headers) as resp:
+                new_data = resp.read() if archive else read_decoded(resp)
+                meta = {name: value for name, value in (
+                    ('etag', resp.headers.get('ETag')),
+                    ('last_modified', resp.headers.get('Last-Modified'))
+                ) if value is not None}
+        except HTTPError as e:
+            e.close()
+            if data is None or e.code != 304 and e.code < 500:
+                raise
+
+            # Keep using the cached one while the host is down
+            if e.code != 304:
+                return data
+
+            new_data = None  # It didn't change
+        except (HTTPException, OSError):
+            # Use the cached one while offline, and try again next time
+            if data is None:
+                raise
+            return data
+
+        meta['validated'] = time()
+        self._store(url, new_data, meta)
+
+        data = data if new_data is None else new_data
+        if not archive:
+            self._remember(url, data, meta)
+
+        return data
+
+
+# The cache shared by the api clients
+meta_cache = response_cache()
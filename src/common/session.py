@@ -0,0 +1,583 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http.client import BadStatusLine, HTTPConnection, HTTPResponse
+from socket import (
+    getaddrinfo, socket, SHUT_RDWR, SOCK_STREAM,
+    _GLOBAL_DEFAULT_TIMEOUT  # type: ignore
+)
+from ssl import create_default_context
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Optional
+from urllib import request, error
+from zlib import decompressobj, MAX_WBITS
+
+from .transport import transport
+
+# The user agent that's sent with every request
+USER_AGENT = "tygoee/mcm-manager"
+
+# The encodings `http_session.read()` decodes
+ACCEPT_ENCODING = "gzip, deflate"
+
+# The headers to mimic a common browser user agent. Files
+# are downloaded as they are, so nothing is compressed
+headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "identity",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1"
+}
+
+# The seconds to wait for a connection, and for data once it's connected
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 30.0
+
+# Transfers that stay slower than `LOW_SPEED_LIMIT` bytes
+# per second for `LOW_SPEED_TIME` seconds are aborted
+LOW_SPEED_LIMIT = 1024
+LOW_SPEED_TIME = 30.0
+
+# The size of the parts a complete response is read in
+_READ_SIZE = 64 * 1024
+
+# The amount of idle connections kept open per host
+MAX_IDLE = 16
+
+# The seconds an idle connection or resolved address is kept
+IDLE_TIMEOUT = 30.0
+DNS_TTL = 300.0
+
+
+class _resolver:
+    def __init__(self, ttl: float = DNS_TTL) -> None:
+        """
+        Resolves hostnames once and caches the addresses for `ttl` seconds
+
+        :param ttl: The seconds the addresses are kept
+        """
+
+        self.ttl = ttl
+        self._cache: dict[tuple[str, int], tuple[float, list[Any]]] = {}
+        self._lock = Lock()
+
+    def addresses(self, host: str, port: int) -> list[Any]:
+        "Get the (cached) address info of a host"
+        with self._lock:
+            if (cached := self._cache.get((host, port))) is not None \
+                    and monotonic() - cached[0] < self.ttl:
+                return cached[1]
+
+        # Resolve outside of the lock, as it can take a while
+        addresses = getaddrinfo(host, port, 0, SOCK_STREAM)
+
+        with self._lock:
+            self._cache[(host, port)] = (monotonic(), addresses)
+
+        return addresses
+
+    def forget(self, host: str, port: int) -> None:
+        "Remove the cached addresses of a host"
+        with self._lock:
+            self._cache.pop((host, port), None)
+
+    def create_connection(self, address: tuple[str, int],
+                          timeout: Any = _GLOBAL_DEFAULT_TIMEOUT,
+                          source_address: Optional[tuple[str, int]] = None) -> socket:
+        "A `socket.create_connection()` that uses the cached addresses"
+        host, port = address
+        last_error: Optional[OSError] = None
+
+        for family, sock_type, proto, _, sockaddr in self.addresses(host, port):
+            sock = socket(family, sock_type, proto)
+            try:
+                if timeout is not _GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address is not None:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+
+                return sock
+            except OSError as e:
+                sock.close()
+                last_error = e
+
+        # The host might have moved, so resolve it again next time
+        self.forget(host, port)
+        raise last_error or OSError(f"Could not resolve {host}")
+
+
+class StalledError(TimeoutError):
+    "A transfer was slower than the low speed limit for too long"
+
+
+class _guard:
+    def __init__(self, sock: socket, start: float, read_timeout: Optional[float],
+                 deadline: Optional[float], low_speed_limit: int,
+                 low_speed_time: float) -> None:
+        """
+        Aborts a response that takes longer than its deadline or stalls.
+        A read that blocks is stopped by the socket timeout, which is
+        shortened when the deadline is near.
+
+        :param sock: The socket of the response
+        :param start: When the request started, from `monotonic()`
+        :param read_timeout: The seconds to wait for data
+        :param deadline: The seconds the whole request may take, or `None`
+        :param low_speed_limit: The minimum bytes per second, `0` to disable
+        :param low_speed_time: The seconds the speed may stay below the limit
+        """
+
+        self.sock = sock
+        self.read_timeout = read_timeout
+        self.deadline = None if deadline is None else start + deadline
+        self.low_speed_limit = low_speed_limit
+        self.low_speed_time = low_speed_time
+
+        self._window_start = start
+        self._window_bytes = 0
+
+    def before_read(self) -> None:
+        "Raise `TimeoutError` if the deadline has passed"
+        if self.deadline is None:
+            return
+
+        if (remaining := self.deadline - monotonic()) <= 0:
+            raise TimeoutError("The request took longer than its deadline")
+
+        self.sock.settimeout(remaining if self.read_timeout is None
+                             else min(self.read_timeout, remaining))
+
+    def after_read(self, size: int) -> None:
+        "Raise `StalledError` if the speed stayed below the limit"
+        if self.low_speed_limit == 0:
+            return
+
+        self._window_bytes += size
+
+        # Check the average speed of every window
+        if (elapsed := monotonic() - self._window_start) >= self.low_speed_time:
+            if self._window_bytes < self.low_speed_limit * elapsed:
+                raise StalledError(
+                    f"The transfer was slower than {self.low_speed_limit} "
+                    f"bytes per second for {elapsed:.0f} seconds")
+
+            self._window_start += elapsed
+            self._window_bytes = 0
+
+    def pause(self, seconds: float) -> None:
+        "Leave time the reader spent waiting out of the speed window"
+        self._window_start += seconds
+
+
+class _response(HTTPResponse):
+    "A response that gives its connection back once it's read"
+    release: Optional[Callable[[bool], None]] = None
+    guard: Optional[_guard] = None
+    _closing = False
+
+    def readinto(self, b: Any) -> int:
+        if self.guard is None or self.fp is None or self._method == 'HEAD':
+            return super().readinto(b)
+
+        self.guard.before_read()
+
+        # Like super().readinto(), but with a single system call
+        # instead of filling `b`, so the guard checks regularly
+        if self.chunked:
+            data = self.read1(len(b))
+            size = len(data)
+            memoryview(b)[:size] = data
+        else:
+            if self.length is not None and len(b) > self.length:
+                b = memoryview(b)[:self.length]
+
+            size = self.fp.readinto1(b)
+            if size == 0 and len(b) != 0:
+                self._close_conn()
+            elif self.length is not None:
+                self.length -= size
+                if self.length == 0:
+                    self._close_conn()
+
+        self.guard.after_read(size)
+
+        return size
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if self.guard is None:
+            return super().read(amt)
+
+        # Read through readinto(), so the guard checks every part
+        data = bytearray()
+        buffer = memoryview(bytearray(_READ_SIZE if amt is None else min(amt, _READ_SIZE)))
+        while amt is None or len(data) < amt:
+            limit = len(buffer) if amt is None else min(len(buffer), amt - len(data))
+            if not (size := self.readinto(buffer[:limit])):
+                break
+            data += buffer[:size]
+
+        return bytes(data)
+
+    def close(self) -> None:
+        self._closing = True
+        super().close()
+
+    def _close_conn(self) -> None:
+        super()._close_conn()
+
+        if (release := self.release) is not None:
+            self.release = None
+
+            # The connection can only be reused if the body is read
+            # completely, otherwise the rest would be read as the next
+            # response. This is called on the end of the body as well
+            release(not self.will_close and (
+                not self._closing if self.chunked else self.length == 0))
+
+
+class _pool(transport):
+    def __init__(self, session: 'http_session', resolver: _resolver,
+                 max_idle: int = MAX_IDLE) -> None:
+        """
+        Sends requests over the network. Idle connections
+        are kept open per host so they can be reused
+
+        :param session: The session with the timeouts of the requests
+        :param resolver: The resolver new connections use
+        :param max_idle: The amount of idle connections kept per host
+        """
+
+        self.session = session
+        self.resolver = resolver
+        self.max_idle = max_idle
+        self._idle: dict[tuple[str, str], list[tuple[float, HTTPConnection]]] = {}
+        self._lock = Lock()
+
+    def get(self, key: tuple[str, str]) -> Optional[HTTPConnection]:
+        "Get an idle connection, or `None` if there is none"
+        with self._lock:
+            idle = self._idle.get(key, [])
+
+            while idle:
+                since, conn = idle.pop()
+                if monotonic() - since < IDLE_TIMEOUT:
+                    return conn
+
+                # The server has probably closed it already
+                conn.close()
+
+        return None
+
+    def put(self, key: tuple[str, str], conn: HTTPConnection) -> None:
+        "Return a connection that's done with its response"
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((monotonic(), conn))
+                return
+
+        conn.close()
+
+    def close(self) -> None:
+        "Close all idle connections"
+        with self._lock:
+            for idle in self._idle.values():
+                for _, conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def open(self, http_class: type[HTTPConnection],
+             req: request.Request, **http_conn_args: Any) -> HTTPResponse:
+        "Send a request over a pooled connection, like `do_open()` does"
+        key = (req.type, req.host)
+        start = monotonic()
+        deadline = self.session.deadline
+
+        def timeout(seconds: Optional[float]) -> Optional[float]:
+            "Shorten a timeout to the time that's left before the deadline"
+            if deadline is None:
+                return seconds
+
+            remaining = max(0.001, start + deadline - monotonic())
+            return remaining if seconds is None else min(seconds, remaining)
+
+        # Send the request headers the same way urllib does,
+        # except for 'Connection: close'
+        req_headers = dict(req.unredirected_hdrs)
+        req_headers.update({k: v for k, v in req.headers.items()
+                            if k not in req_headers})
+        req_headers = {name.title(): val for name, val in req_headers.items()}
+
+        while True:
+            conn = self.get(key)
+            if (reused := conn is not None) and conn.sock is not None:
+                conn.sock.settimeout(timeout(req.timeout))
+            elif conn is None:
+                conn = http_class(req.host, **http_conn_args)
+                conn._create_connection = self.resolver.create_connection  # type: ignore
+                conn.response_class = _response
+
+            try:
+                # Connect separately, as it has its own timeout
+                if conn.sock is None:
+                    conn.timeout = timeout(getattr(
+                        req, 'connect_timeout', self.session.connect_timeout))
+                    conn.connect()
+                    assert conn.sock is not None
+                    conn.sock.settimeout(timeout(req.timeout))
+
+                sock = conn.sock
+                conn.request(req.get_method(), req.selector, req.data, req_headers,
+                             encode_chunked=req.has_header('Transfer-encoding'))
+                resp = conn.getresponse()
+            except (ConnectionError, BadStatusLine) as e:
+                conn.close()
+
+                # An idle connection could've been closed by
+                # the server in the meantime, so try a new one
+                if reused:
+                    continue
+                raise error.URLError(e)
+            except OSError as e:
+                conn.close()
+                raise error.URLError(e)
+            except BaseException:
+                conn.close()
+                raise
+
+            break
+
+        def release(reusable: bool) -> None:
+            if reusable:
+                self.put(key, conn)
+            else:
+                conn.close()
+
+        assert isinstance(resp, _response)
+        resp.release = release
+        resp.guard = _guard(sock, start, req.timeout, deadline,
+                            self.session.low_speed_limit, self.session.low_speed_time)
+        resp.url = req.get_full_url()  # type: ignore
+        resp.msg = resp.reason  # type: ignore
+
+        return resp
+
+
+class _http_handler(request.HTTPHandler):
+    def __init__(self, session: 'http_session') -> None:
+        super().__init__()
+        self.session = session
+
+    def do_open(self, http_class: Any, req: request.Request,
+                **http_conn_args: Any) -> HTTPResponse:
+        # Connections through a proxy tunnel aren't pooled
+        if req._tunnel_host and self.session.transport is self.session._pool:  # type: ignore
+            return super().do_open(http_class, req, **http_conn_args)
+
+        return self.session.transport.open(http_class, req, **http_conn_args)
+
+
+class _https_handler(request.HTTPSHandler):
+    def __init__(self, session: 'http_session') -> None:
+        # Share the (slow to create) tls context between connections
+        super().__init__(context=create_default_context())
+        self.session = session
+
+    def do_open(self, http_class: Any, req: request.Request,
+                **http_conn_args: Any) -> HTTPResponse:
+        if req._tunnel_host and self.session.transport is self.session._pool:  # type: ignore
+            return super().do_open(http_class, req, **http_conn_args)
+
+        return self.session.transport.open(http_class, req, **http_conn_args)
+
+
+class _decoder:
+    def __init__(self, encoding: str) -> None:
+        """
+        Decodes a compressed response while it's read
+
+        :param encoding: The content encoding of the response
+        """
+
+        self.encoding = encoding.strip().lower()
+        if self.encoding not in ('', 'identity', 'gzip', 'x-gzip', 'deflate'):
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+
+        self._decompress: Any = None
+
+    def decode(self, data: bytes) -> bytes:
+        "Decode the next part of the response"
+        if self.encoding in ('', 'identity') or not data:
+            return data
+
+        if self._decompress is None:
+            if self.encoding != 'deflate':
+                wbits = 16 + MAX_WBITS
+            else:
+                # Some servers send deflate without the zlib header
+                wbits = MAX_WBITS if data[0] & 0x0f == 8 else -MAX_WBITS
+            self._decompress = decompressobj(wbits)
+
+        return self._decompress.decompress(data)
+
+    def flush(self) -> bytes:
+        "Decode what's left at the end of the response"
+        return b'' if self._decompress is None else self._decompress.flush()
+
+
+def read_decoded(resp: HTTPResponse) -> bytes:
+    """
+    Read a complete response that was requested with `ACCEPT_ENCODING`,
+    decoding it while it's read
+
+    :param resp: The response to read
+    """
+
+    parts: list[bytes] = []
+
+    decoder = _decoder(resp.headers.get('Content-Encoding', ''))
+    while data := resp.read(_READ_SIZE):
+        parts.append(decoder.decode(data))
+    parts.append(decoder.flush())
+
+    return b''.join(parts)
+
+
+def waited(resp: HTTPResponse, seconds: float) -> None:
+    """
+    Tell a response its reader waited instead of reading, like to
+    limit the bandwidth, so that isn't counted as a stalled transfer
+
+    :param resp: The response that's read
+    :param seconds: The time that was waited
+    """
+
+    if isinstance(resp, _response) and resp.guard is not None:
+        resp.guard.pause(seconds)
+
+
+def abort(resp: HTTPResponse) -> None:
+    """
+    Stop reading a response from another thread. Its socket is shut down,
+    so a read that's waiting for data ends right away instead of timing out.
+
+    :param resp: The response that's read
+    """
+
+    sock = getattr(getattr(resp.fp, 'raw', None), '_sock', None)
+    if isinstance(sock, socket):
+        try:
+            # Without the ssl layer, which isn't thread-safe
+            socket.shutdown(sock, SHUT_RDWR)
+        except OSError:
+            pass  # It's closed already
+
+
+class http_session:
+    def __init__(self, user_agent: str = USER_AGENT,
+                 timeout: float = READ_TIMEOUT,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 deadline: Optional[float] = None,
+                 low_speed_limit: int = LOW_SPEED_LIMIT,
+                 low_speed_time: float = LOW_SPEED_TIME,
+                 max_idle: int = MAX_IDLE,
+                 transport: Optional[transport] = None) -> None:
+        """
+        Sends requests over persistent connections. Idle connections
+        are kept open per host and hostnames are only resolved once,
+        so the following requests to a host skip the tcp and tls
+        handshakes. Redirects and errors work like `urlopen()`.
+
+        Reading a response raises `TimeoutError` when no data arrives
+        within `timeout` or when the request takes longer than `deadline`,
+        and `StalledError` when it's too slow. The settings can be changed
+        later on through the attributes with the same names.
+
+        :param user_agent: The user agent sent with every request
+        :param timeout: The seconds to wait for data
+        :param connect_timeout: The seconds to wait for a connection
+        :param deadline: The seconds a whole request may take, or `None`
+        :param low_speed_limit: The minimum bytes per second, `0` to disable
+        :param low_speed_time: The seconds the speed may stay below the limit
+        :param max_idle: The amount of idle connections kept per host
+        :param transport: Sends the requests instead of the network, like
+                          a `memory_transport` or a `cassette`
+        """
+
+        self.headers = {"User-Agent": user_agent}
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.deadline = deadline
+        self.low_speed_limit = low_speed_limit
+        self.low_speed_time = low_speed_time
+
+        self._pool = _pool(self, _resolver(), max_idle)
+        self.transport = self._pool if transport is None else transport
+
+        self._opener = request.build_opener(
+            _http_handler(self), _https_handler(self))
+        self._opener.addheaders = []
+
+    def open(self, url: str, req_headers: dict[str, str] = {},
+             method: Optional[str] = None,
+             timeout: Optional[float] = None,
+             connect_timeout: Optional[float] = None) -> HTTPResponse:
+        """
+        Send a request and return the response. Raises `HTTPError`
+        for error responses and `URLError` if the host can't be reached.
+        Close the response or read it completely to reuse the connection.
+
+        :param url: The url to request
+        :param req_headers: Extra headers, these replace the default ones
+        :param method: The request method, `GET` by default
+        :param timeout: The seconds to wait, `self.timeout` by default
+        :param connect_timeout: The seconds to wait for a new connection,
+                                `self.connect_timeout` by default
+        """
+
+        req = request.Request(url, headers=self.headers | req_headers, method=method)
+        if connect_timeout is not None:
+            # The pool reads it when it connects
+            req.connect_timeout = connect_timeout  # type: ignore
+
+        return self._opener.open(req, timeout=self.timeout if timeout is None else timeout)
+
+    def read(self, url: str, req_headers: dict[str, str] = {}) -> bytes:
+        """
+        Get the complete body of a url, like a json file. It's requested
+        compressed and decoded while it's read. Files like jars shouldn't
+        use this, as they're already compressed.
+
+        :param url: The url to request
+        :param req_headers: Extra headers, these replace the default ones
+        """
+
+        with self.open(url, {'Accept-Encoding': ACCEPT_ENCODING} | req_headers) as resp:
+            return read_decoded(resp)
+
+    def close(self) -> None:
+        "Close all idle connections, and the transport"
+        self._pool.close()
+        if self.transport is not self._pool:
+            self.transport.close()
+
+
+# The session shared by everything that downloads
+session = http_session()
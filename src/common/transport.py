@@ -0,0 +1,182 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from base64 import b64decode, b64encode
+from http.client import HTTPConnection, HTTPResponse, responses
+from io import BytesIO
+from json import dump, load
+from os import path
+from threading import Lock
+from typing import Any, Optional
+from urllib import request
+
+from .cache import atomic_write
+
+
+class transport:
+    """
+    Sends the requests of a session. `http_session.transport` can be
+    replaced with another one, for example to serve files from memory
+    in tests or to record and replay the requests of a real session.
+    """
+
+    def open(self, http_class: type[HTTPConnection],
+             req: request.Request, **http_conn_args: Any) -> HTTPResponse:
+        """
+        Send a request and return the response, like `do_open()` does.
+        Redirects and error responses are handled by the session.
+
+        :param http_class: The connection class of the url scheme
+        :param req: The request to send
+        """
+
+        raise NotImplementedError
+
+    def close(self) -> None:
+        "Release everything the transport holds on to"
+
+
+class _fake_socket:
+    def __init__(self, data: bytes) -> None:
+        "A socket that only contains a complete response"
+        self.data = data
+
+    def makefile(self, *args: Any, **kwargs: Any) -> BytesIO:
+        return BytesIO(self.data)
+
+
+def make_response(req: request.Request, status: int, headers: list[tuple[str, str]],
+                  body: bytes = b'', reason: Optional[str] = None) -> HTTPResponse:
+    """
+    Create a response to a request from memory
+
+    :param req: The request that's responded to
+    :param status: The status code
+    :param headers: The headers, the content length is added if it's missing
+    :param body: The body, left out for HEAD requests
+    :param reason: The reason phrase, the default one of the status if it's `None`
+    """
+
+    if not any(name.lower() == 'content-length' for name, _ in headers):
+        headers = headers + [('Content-Length', str(len(body)))]
+
+    raw = f"HTTP/1.1 {status} {responses.get(status, '') if reason is None else reason}\r\n"
+    raw += ''.join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n"
+
+    resp = HTTPResponse(_fake_socket(raw.encode('iso-8859-1') + body),  # type: ignore
+                        method=req.get_method(), url=req.get_full_url())
+    resp.begin()
+    resp.url = req.get_full_url()  # type: ignore
+    resp.msg = resp.reason  # type: ignore
+
+    return resp
+
+
+class memory_transport(transport):
+    def __init__(self, files: dict[str, bytes | int]) -> None:
+        """
+        Serves files from memory, with support for HEAD and range requests.
+        Unknown urls get a 404 response.
+
+        :param files: The contents per url, or a status code to respond with
+        """
+
+        self.files = files
+        self.requests: list[tuple[str, str]] = []
+        self._lock = Lock()
+
+    def open(self, http_class: type[HTTPConnection],
+             req: request.Request, **http_conn_args: Any) -> HTTPResponse:
+        url = req.get_full_url()
+        with self._lock:
+            self.requests.append((req.get_method(), url))
+
+        if isinstance(data := self.files.get(url, 404), int):
+            return make_response(req, data, [])
+
+        # Respond to a 'bytes=start-end' range with a part of the file
+        range_header: str = req.get_header('Range', '')  # type: ignore
+        if not range_header.startswith('bytes='):
+            return make_response(req, 200, [('Accept-Ranges', 'bytes')], data)
+
+        first, _, last = range_header[6:].partition('-')
+        start, end = int(first), min(int(last), len(data) - 1) if last else len(data) - 1
+
+        return make_response(req, 206, [
+            ('Accept-Ranges', 'bytes'),
+            ('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        ], data[start:end + 1])
+
+
+class cassette(transport):
+    def __init__(self, fname: str, record_from: Optional[transport] = None) -> None:
+        """
+        Records the responses of a transport to a file, or replays them.
+        Requests are matched by their method, url and range. A request
+        that isn't recorded raises a `LookupError` when replaying.
+
+        :param fname: The cassette file, a json file
+        :param record_from: The transport to record, or `None` to replay
+        """
+
+        self.fname = fname
+        self.record_from = record_from
+        self._lock = Lock()
+
+        # The responses per '(method) (url) (range)'
+        self.responses: dict[str, dict[str, Any]] = {}
+        if record_from is None or path.isfile(fname):
+            with open(fname) as fp:
+                self.responses = load(fp)
+
+    @staticmethod
+    def _key(req: request.Request) -> str:
+        return f"{req.get_method()} {req.get_full_url()} {req.get_header('Range', '')}".rstrip()
+
+    def open(self, http_class: type[HTTPConnection],
+             req: request.Request, **http_conn_args: Any) -> HTTPResponse:
+        if self.record_from is not None:
+            with self.record_from.open(http_class, req, **http_conn_args) as resp:
+                recorded = {
+                    'status': resp.status,
+                    'reason': resp.reason,
+                    'headers': resp.getheaders(),
+                    'body': b64encode(resp.read()).decode('ascii')
+                }
+
+            with self._lock:
+                self.responses[self._key(req)] = recorded
+
+        elif (recorded := self.responses.get(self._key(req))) is None:
+            raise LookupError(f"{self._key(req)} isn't in the cassette {self.fname}")
+
+        # Leave out the encoding of the transfer, as the body is complete
+        headers = [(name, value) for name, value in recorded['headers']
+                   if name.lower() != 'transfer-encoding']
+
+        return make_response(req, recorded['status'], headers,
+                             b64decode(recorded['body']), recorded['reason'])
+
+    def close(self) -> None:
+        "Write the recorded responses to the cassette file"
+        if self.record_from is None:
+            return
+
+        self.record_from.close()
+
+        with self._lock:
+            with atomic_write(self.fname) as temp, open(temp, 'w') as fp:
+                dump(self.responses, fp)
@@ -0,0 +1,729 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from os import close, path, remove, replace
+from shutil import copyfileobj
+from tempfile import mkstemp
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Optional, TYPE_CHECKING
+from urllib import error
+
+if TYPE_CHECKING:
+    from http.client import HTTPResponse
+
+from .loadingbar import loadingbar
+from .mirrors import alternatives
+from .retry import retry, retry_policy
+from .scheduler import download_scheduler, default_scheduler
+from .state import install_state
+from .writer import preallocate, stream
+
+from ..common.cache import download_cache, place_file
+from ..common.session import abort, session, waited
+
+# Files from this size are downloaded in multiple segments
+SEGMENT_THRESHOLD = 16 * 1024 ** 2
+
+# The default amount of segments a large file is split into
+DEFAULT_SEGMENTS = 4
+
+# Files from this size are written to the disk on a separate thread
+WRITE_BEHIND_THRESHOLD = 4 * 1024 ** 2
+
+# The seconds between checks if a transfer that doesn't receive anything should be hedged
+_HEDGE_INTERVAL = 0.1
+
+# The cache shared by all install paths
+cache = download_cache()
+
+
+class HashMismatchError(ValueError):
+    "A downloaded file doesn't match its expected hash"
+
+
+class _hashes:
+    def __init__(self, sha1: Optional[str], sha512: Optional[str]) -> None:
+        """
+        Hashes a file while it's downloaded. The sha1 hash is always
+        calculated, as it's also used by the cache.
+
+        :param sha1: The expected sha1 hash
+        :param sha512: The expected sha512 hash
+        """
+
+        self.expected = {name: value.lower() for name, value in (
+            ('sha1', sha1), ('sha512', sha512)) if value is not None}
+        self.reset()
+
+    def reset(self) -> None:
+        "Start over, like when the file is changed afterwards"
+        self.hashes = {'sha1': hashlib.sha1()}
+        if 'sha512' in self.expected:
+            self.hashes['sha512'] = hashlib.sha512()
+
+    def update(self, data: bytes | memoryview) -> None:
+        "Update the hashes with a part of the file"
+        for hash in self.hashes.values():
+            hash.update(data)
+
+    def update_file(self, fname: str) -> None:
+        "Update the hashes with the contents of a file"
+        with open(fname, 'rb') as fp:
+            while data := fp.read(1024 ** 2):
+                self.update(data)
+
+    def matches(self) -> bool:
+        "Check if all expected hashes match"
+        return all(self.hashes[name].hexdigest() == value
+                   for name, value in self.expected.items())
+
+    def sha1(self) -> str:
+        "The calculated sha1 hash"
+        return self.hashes['sha1'].hexdigest()
+
+
+def content_size(resp: 'HTTPResponse') -> int:
+    "Get the full size of a file from a (partial) response"
+
+    # A partial response has the full size in 'bytes (start)-(end)/(size)'
+    content_range: str = resp.headers.get('content-range', '')
+    if resp.status == 206 and content_range.rpartition('/')[2].isdigit():
+        return int(content_range.rpartition('/')[2])
+
+    return int(resp.headers.get('content-length', 0))
+
+
+def _throttle(resp: 'HTTPResponse', scheduler: download_scheduler) -> Optional[Callable[[int], None]]:
+    "The throttle of `stream()`, of which the waits don't count as a stalled transfer"
+    if not scheduler.throttled:
+        return None
+
+    def throttle(amount: int) -> None:
+        started = monotonic()
+        scheduler.throttle(amount)
+        waited(resp, monotonic() - started)
+
+    return throttle
+
+
+class _progress:
+    def __init__(self, bar: Optional[loadingbar[int]], fsize: int) -> None:
+        """
+        Updates the bar and remembers how much, so a failed attempt can be undone
+
+        :param bar: The loading bar to update
+        :param fsize: The expected size, `0` if it's unknown
+        """
+
+        self.bar = bar
+        self.fsize = fsize
+        self.done = 0
+        self._lock = Lock()
+
+    def add_total(self, size: int) -> None:
+        "Add the size to the bar's total if it wasn't known yet"
+        if self.fsize == 0:
+            self.fsize = size
+            if self.bar is not None:
+                self.bar.add_total(size)
+
+    def update(self, amount: int) -> None:
+        "Update the bar with the amount of downloaded bytes"
+        with self._lock:
+            self.done += amount
+        if self.bar is not None:
+            self.bar.update(amount)
+
+    def on_data(self, data: memoryview) -> None:
+        "A callback for `stream()`"
+        self.update(len(data))
+
+    def undo(self) -> None:
+        "Remove the progress of a failed attempt from the bar"
+        with self._lock:
+            done, self.done = self.done, 0
+        if self.bar is not None:
+            self.bar.update(-done)
+
+
+class _flight:
+    def __init__(self) -> None:
+        """
+        A download of a url that's in progress or done. Other downloads
+        of the same url wait for it and place its file instead.
+        """
+
+        self.done = Event()
+        self.fname: Optional[str] = None
+        self.size = 0
+        self.sha1: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class download_run:
+    def __init__(self) -> None:
+        """
+        The downloads of one run, like installing the media or a modloader.
+        A url is only downloaded once per run when it's passed to `download()`.
+        """
+
+        self._flights: dict[str, _flight] = {}
+        self._lock = Lock()
+
+    def join(self, url: str) -> tuple[_flight, bool]:
+        "Get the download of a url, and if the caller has to do it"
+        with self._lock:
+            if (flight := self._flights.get(url)) is not None:
+                return flight, False
+
+            flight = self._flights[url] = _flight()
+            return flight, True
+
+    def forget(self, url: str) -> None:
+        "Let the next download of a url that failed try again"
+        with self._lock:
+            del self._flights[url]
+
+
+class _Cancelled(Exception):
+    "Stops a request of a hedged transfer when the other one finished first"
+
+
+class _hedge:
+    def __init__(self, url: str, part: str, size: int, req_headers: dict[str, str],
+                 scheduler: download_scheduler, first: 'HTTPResponse') -> None:
+        """
+        A second request for the rest of a slow transfer, preferably from a
+        mirror. It's written to a separate file, which replaces the end of
+        the partial file if it finishes before the first request. The first
+        request is aborted then, even if it's stalled. A stalled request
+        doesn't call `check()`, so it's also checked every `_HEDGE_INTERVAL`.
+
+        :param url: The url of the first request
+        :param part: The partial file of the first request
+        :param size: The complete size of the file
+        :param req_headers: Extra headers sent with the request
+        :param scheduler: Decides when to hedge and limits the bandwidth
+        :param first: The response of the first request
+        """
+
+        self.url = next((alt for alt in alternatives(url) if alt != url), url)
+        self.part = part
+        self.size = size
+        self.req_headers = req_headers
+        self.scheduler = scheduler
+        self.first = first
+
+        self.start: Optional[int] = None  # The first byte of the hedge
+        self.file: Optional[str] = None
+        self.won = False
+
+        self._position = 0  # The bytes written by the first request
+        self._done = 0  # The bytes downloaded by the first request
+        self._stopped = False
+        self._started = monotonic()
+        self._finished = Event()
+        self._lock = Lock()
+
+        Thread(target=self._watch, daemon=True).start()
+
+    def check(self, position: int, done: int) -> None:
+        """
+        Start the hedge if the first request is slow. Raises `_Cancelled`
+        once the hedge is complete, which stops the first request.
+
+        :param position: The bytes written by the first request
+        :param done: The bytes downloaded by the first request
+        """
+
+        if self.won:
+            raise _Cancelled()
+
+        self._position, self._done = position, done
+        self._consider()
+
+    def _watch(self) -> None:
+        "Check the first request while it doesn't receive anything"
+        while not self._finished.wait(_HEDGE_INTERVAL):
+            self._consider()
+
+    def _consider(self) -> None:
+        "Start the hedge if the first request is slow"
+        with self._lock:
+            if self.start is not None or self._stopped or not self.scheduler.should_hedge(
+                    self._done, monotonic() - self._started, self.size - self._position):
+                return
+
+            # Only hedge when the host has a connection to spare
+            if not self.scheduler.acquire(self.url, wait=False):
+                return
+
+            self.start = self._position
+            fd, self.file = mkstemp('.hedge', path.basename(self.part), path.dirname(self.part))
+            close(fd)
+
+        Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        assert self.start is not None and self.file is not None
+        complete = False
+
+        def on_data(_: memoryview) -> None:
+            if self._stopped:
+                raise _Cancelled()
+
+        try:
+            with session.open(self.url, self.req_headers | {
+                'Range': f'bytes={self.start}-{self.size - 1}'
+            }) as resp, open(self.file, 'wb') as fp:
+                if resp.status == 206 and content_size(resp) == self.size:
+                    complete = stream(resp, fp, self.size - self.start, on_data,
+                                      throttle=_throttle(resp, self.scheduler)) == self.size - self.start
+        except Exception:
+            pass  # The first request just continues
+        finally:
+            self.scheduler.release(self.url)
+
+            with self._lock:
+                self.won = complete and not self._stopped
+                if not self.won:
+                    remove(self.file)
+
+            if self.won:
+                abort(self.first)
+
+    def finish(self) -> bool:
+        """
+        Stop the hedge unless it already won, as the first request
+        finished or failed. Returns if the hedge won.
+        """
+
+        self._finished.set()
+
+        with self._lock:
+            self._stopped = True
+            return self.won
+
+    def merge(self) -> None:
+        "Replace the end of the partial file with the hedge"
+        assert self.start is not None and self.file is not None
+
+        with open(self.part, 'r+b') as fp, open(self.file, 'rb') as hedge:
+            fp.truncate(self.start)
+            fp.seek(self.start)
+            copyfileobj(hedge, fp, 1024 ** 2)
+
+        remove(self.file)
+
+
+def _write_range(resp: 'HTTPResponse', fname: str, start: int, end: int,
+                 progress: _progress, scheduler: download_scheduler) -> None:
+    "Write bytes `start` to `end` (inclusive) of a preallocated file"
+
+    with open(fname, 'r+b') as fp:
+        fp.seek(start)
+
+        # Stop if the connection closed early
+        if stream(resp, fp, end - start + 1, progress.on_data,
+                  throttle=_throttle(resp, scheduler)) != end - start + 1:
+            raise error.ContentTooShortError(
+                f"Segment {start}-{end} of {fname} is incomplete", '')
+
+
+def _download_segments(resp: 'HTTPResponse', url: str, part: str, size: int,
+                       segments: int, req_headers: dict[str, str],
+                       progress: _progress, scheduler: download_scheduler) -> None:
+    """
+    Download a file in multiple segments at the same time. The first
+    segment is read from `resp`, which was requested from byte 0.
+    """
+
+    # Preallocate the file
+    with open(part, 'wb') as fp:
+        preallocate(fp, size)
+        fp.truncate(size)
+
+    # Split the file in (start, end) ranges
+    segment_size = -(-size // segments)
+    ranges = [(start, min(start + segment_size, size) - 1)
+              for start in range(0, size, segment_size)]
+    completed = [False] * len(ranges)
+
+    def download_segment(index: int) -> None:
+        start, end = ranges[index]
+        with session.open(url, req_headers | {
+            'Range': f'bytes={start}-{end}'
+        }) as segment_resp:
+            if segment_resp.status != 206:
+                raise error.URLError(f"{url} stopped accepting ranges")
+
+            _write_range(segment_resp, part, start, end, progress, scheduler)
+
+        completed[index] = True
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges) - 1) as executor:
+            futures = [executor.submit(download_segment, index)
+                       for index in range(1, len(ranges))]
+
+            # Continue the first segment with the original response
+            _write_range(resp, part, *ranges[0], progress, scheduler)
+            completed[0] = True
+
+            for future in futures:
+                future.result()
+    except BaseException:
+        # Keep the completed segments at the start of the
+        # file, so the download can be resumed later on
+        resumable = 0
+        for (_, end), done in zip(ranges, completed):
+            if not done:
+                break
+            resumable = end + 1
+
+        with open(part, 'r+b') as fp:
+            fp.truncate(resumable)
+
+        raise
+
+
+def _fetch(url: str, part: str, progress: _progress, req_headers: dict[str, str], segments: int, hashes: _hashes,
+           write_behind: Optional[bool], scheduler: download_scheduler) -> int:
+    """
+    Download or resume `part` while hashing it. Returns the size the
+    server sent, which the file is checked against, or `0` if it's unknown
+    """
+
+    # Resume from the end of the partial file. When there is none,
+    # ask for a range anyway to know if segments are possible
+    offset = path.getsize(part) if path.isfile(part) else 0
+    if offset != 0 or segments > 1:
+        range_headers = req_headers | {'Range': f'bytes={offset}-'}
+    else:
+        range_headers = req_headers
+
+    resp: 'HTTPResponse'
+    try:
+        resp = session.open(url, range_headers)
+    except error.HTTPError as e:
+        if e.code != 416 or offset == 0:
+            raise
+
+        # The partial file is invalid if the range can't be satisfied
+        remove(part)
+        return _fetch(url, part, progress, req_headers, segments,
+                      hashes, write_behind, scheduler)
+
+    with resp:
+        # Start over if the server doesn't support ranges
+        if resp.status != 206:
+            offset = 0
+
+        size = content_size(resp)
+
+        # Add the size to the total if it wasn't known yet
+        progress.add_total(size)
+
+        # The part that's already downloaded counts as progress
+        progress.update(offset)
+
+        # Segments need connections to the host that aren't in use
+        extra = 0
+        if resp.status == 206 and offset == 0 and size >= SEGMENT_THRESHOLD and segments > 1:
+            extra = scheduler.acquire(url, segments - 1, wait=False)
+
+        if extra != 0:
+            try:
+                _download_segments(resp, url, part, size, extra + 1,
+                                   req_headers, progress, scheduler)
+            finally:
+                scheduler.release(url, extra)
+
+            # Segments arrive out of order, so hash the complete file
+            hashes.update_file(part)
+        else:
+            # Hash the part that was already downloaded
+            if offset != 0:
+                hashes.update_file(part)
+
+            # A slow transfer can get a second request for the rest
+            hedge: Optional[_hedge] = None
+            if scheduler.hedge and size != 0 and (
+                    resp.status == 206 or resp.headers.get('accept-ranges') == 'bytes'):
+                hedge = _hedge(url, part, size, req_headers, scheduler, resp)
+            position = offset
+            started = monotonic()
+            written = 0
+
+            def on_data(data: memoryview) -> None:
+                nonlocal position
+
+                # Update the bar and hashes
+                hashes.update(data)
+                progress.update(len(data))
+
+                position += len(data)
+                if hedge is not None:
+                    hedge.check(position, position - offset)
+
+            with open(part, 'r+b' if offset != 0 else 'wb') as fp:
+                fp.seek(offset)
+                preallocate(fp, size)
+
+                try:
+                    written = stream(resp, fp, on_data=on_data, write_behind=(
+                        size - offset >= WRITE_BEHIND_THRESHOLD
+                        if write_behind is None else write_behind
+                    ), throttle=_throttle(resp, scheduler))
+                except _Cancelled:
+                    pass  # The hedge won
+                except BaseException:
+                    # A stalled request fails when the hedge aborts it
+                    if hedge is None or not hedge.finish():
+                        raise
+                finally:
+                    # Remove the preallocated space that isn't used
+                    fp.truncate()
+
+            won = hedge is not None and hedge.finish()
+
+            # Stop if the connection closed early, the partial
+            # file is resumed when it's downloaded again
+            if not won and size != 0 and offset + written != size:
+                raise error.ContentTooShortError(
+                    f"{url} ended after {offset + written} of {size} bytes", '')
+
+            if hedge is not None and won:
+                # Use the hedge for the bytes the first request didn't get
+                hedge.merge()
+                progress.update(size - position)
+
+                hashes.reset()
+                hashes.update_file(part)
+            else:
+                scheduler.record_rate(position - offset, monotonic() - started, url)
+
+    return size
+
+
+def verify(fname: str, sha1: Optional[str] = None, sha512: Optional[str] = None) -> bool:
+    """
+    Check if a file matches its hashes. Without hashes, this is always true
+
+    :param fname: The path of the file
+    :param sha1: The expected sha1 hash
+    :param sha512: The expected sha512 hash
+    """
+
+    if sha1 is None and sha512 is None:
+        return True
+
+    hashes = _hashes(sha1, sha512)
+    hashes.update_file(fname)
+
+    return hashes.matches()
+
+
+def download(url: str, fname: str,
+             bar: Optional[loadingbar[int]] = None,
+             fsize: int = 0,
+             req_headers: dict[str, str] = {},
+             segments: int = DEFAULT_SEGMENTS,
+             sha1: Optional[str] = None,
+             sha512: Optional[str] = None,
+             state: Optional[install_state] = None,
+             write_behind: Optional[bool] = None,
+             scheduler: Optional[download_scheduler] = None,
+             policy: Optional[retry_policy] = None,
+             immutable: bool = True,
+             run: Optional[download_run] = None) -> str:
+    """
+    Download a file and return its sha1 hash. It's written to `(fname).part` first, which gets
+    resumed if an earlier download was interrupted, and it's moved to
+    `fname` once it's complete. Files larger than `SEGMENT_THRESHOLD`
+    are downloaded in segments if the server accepts ranges and the
+    scheduler has connections to spare. Files that are in the download
+    cache aren't downloaded again.
+
+    If a hash is given, the file is hashed while it's downloaded. When
+    it doesn't match, the file is downloaded once more before raising
+    a `HashMismatchError`.
+
+    Errors like timeouts or a 503 are retried with `retry()`, which
+    switches to the mirrors of the url from `mirrors.add_mirrors()`.
+
+    A url is only downloaded once per `run`. Downloads of a url that's
+    already downloading wait for it, and place the same file at their
+    own path, like later downloads of it do.
+
+    :param url: The url of the file
+    :param fname: The path the file is written to
+    :param bar: The loading bar to update
+    :param fsize: The expected size. If it's `0`, the size
+                  of the response is added to the bar's total
+    :param req_headers: Extra headers sent with the requests
+    :param segments: The maximum amount of segments downloaded at once
+    :param sha1: The expected sha1 hash, also used to find it in the cache
+    :param sha512: The expected sha512 hash
+    :param state: The index the installed file is recorded in
+    :param write_behind: Write to the disk on a separate thread. By default,
+                         this is done from `WRITE_BEHIND_THRESHOLD` bytes
+    :param scheduler: Limits the connections per host and the bandwidth.
+                      Without one, only the global bandwidth limit applies
+    :param policy: Decides which errors are retried and how often
+    :param immutable: If the file at the url never changes, so a file
+                      cached for the url can be used without its hash
+    :param run: The run the download is shared in
+    """
+
+    if run is None:
+        return _download(url, fname, bar, fsize, req_headers, segments, sha1,
+                         sha512, state, write_behind, scheduler, policy, immutable)
+
+    # Share one download between everything that needs the url
+    flight, leader = run.join(url)
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+
+        if (shared_sha1 := _share(flight, fname, sha1, sha512)) is not None:
+            _placed(url, fname, shared_sha1, bar, fsize, state)
+            return shared_sha1
+
+        # The file changed since, so it's downloaded separately
+        return _download(url, fname, bar, fsize, req_headers, segments, sha1,
+                         sha512, state, write_behind, scheduler, policy, immutable)
+
+    try:
+        file_sha1 = _download(url, fname, bar, fsize, req_headers, segments, sha1,
+                              sha512, state, write_behind, scheduler, policy, immutable)
+    except BaseException as e:
+        run.forget(url)
+        flight.error = e
+        raise
+    else:
+        flight.fname = fname
+        flight.size = path.getsize(fname)
+        flight.sha1 = file_sha1
+    finally:
+        flight.done.set()
+
+    return file_sha1
+
+
+def _share(flight: _flight, fname: str, sha1: Optional[str],
+           sha512: Optional[str]) -> Optional[str]:
+    """
+    Place the file of a finished download at `fname`. Returns its
+    sha1 hash, or `None` if it was changed or doesn't match the hashes.
+
+    :param flight: The finished download of the url
+    :param fname: The path the file is placed
+    :param sha1: The expected sha1 hash
+    :param sha512: The expected sha512 hash
+    """
+
+    assert flight.fname is not None and flight.sha1 is not None
+
+    if sha1 is not None and sha1.lower() != flight.sha1:
+        return None
+
+    # Only the size is checked, hashing it again would cost as much as downloading
+    try:
+        if path.getsize(flight.fname) != flight.size:
+            return None
+        if path.realpath(flight.fname) != path.realpath(fname):
+            place_file(flight.fname, fname)
+    except OSError:
+        return None
+
+    if sha512 is not None and not verify(fname, None, sha512):
+        remove(fname)
+        return None
+
+    return flight.sha1
+
+
+def _download(url: str, fname: str, bar: Optional[loadingbar[int]], fsize: int,
+              req_headers: dict[str, str], segments: int, sha1: Optional[str],
+              sha512: Optional[str], state: Optional[install_state],
+              write_behind: Optional[bool], scheduler: Optional[download_scheduler],
+              policy: Optional[retry_policy], immutable: bool) -> str:
+    "Download a file like `download()` does, without sharing it. Returns its sha1 hash"
+
+    # Copy the file from the cache if it's there. A file found by
+    # its sha1 hash is already verified, other hashes aren't
+    if (cached_sha1 := cache.fill(url, fname, sha1, by_url=immutable)) is not None:
+        if sha512 is None or verify(fname, sha1, sha512):
+            _placed(url, fname, cached_sha1, bar, fsize, state)
+            return cached_sha1
+
+        remove(fname)
+
+    part = fname + '.part'
+    scheduler = scheduler or default_scheduler
+    progress = _progress(bar, fsize)
+    verified = False
+
+    def fetch(current: str) -> _hashes:
+        "Download from the url or one of its mirrors"
+        nonlocal verified
+
+        with scheduler.slot(current):
+            for _ in range(2):
+                hashes = _hashes(sha1, sha512)
+                verified = _fetch(current, part, progress, req_headers, segments,
+                                  hashes, write_behind, scheduler) != 0
+
+                if hashes.matches():
+                    return hashes
+
+                # Start over, as the partial file can't be trusted either
+                remove(part)
+                progress.undo()
+
+        raise HashMismatchError(f"{current} doesn't match its hash")
+
+    # The next attempt counts the partial file again
+    hashes = retry(fetch, alternatives(url), policy, lambda _: progress.undo())
+
+    # Move the file in place when it's complete
+    replace(part, fname)
+
+    # Share it with other install paths, if it's known to be complete
+    if verified or sha1 is not None:
+        cache.add(url, fname, hashes.sha1())
+
+    if state is not None:
+        state.record(fname, url, hashes.sha1())
+
+    return hashes.sha1()
+
+
+def _placed(url: str, fname: str, sha1: str, bar: Optional[loadingbar[int]],
+            fsize: int, state: Optional[install_state]) -> None:
+    "Count a file that was placed instead of downloaded"
+    if bar is not None:
+        if fsize == 0:
+            bar.add_total(path.getsize(fname))
+        bar.update(path.getsize(fname))
+    if state is not None:
+        state.record(fname, url, sha1)
@@ -15,6 +15,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from os import get_terminal_size
+from threading import RLock
 from typing import (
     Collection, Generic, Literal, TypeVar,
     Optional, overload, TYPE_CHECKING
@@ -105,8 +106,8 @@ class loadingbar(Generic[_T]):
             self.iterator = iterator
             self.iterable = iter(iterator)
             self.iterator_len = len(iterator)
-        elif iterator is None and total != 0:
-            # total
+        elif iterator is None:
+            # total (it can also be grown later with add_total())
             self.iterator = None
             self.iterable = None
             self.total = total
@@ -119,6 +120,13 @@ class loadingbar(Generic[_T]):
 
         self.idx = 0
 
+        # Allow updates from multiple threads
+        self._lock = RLock()
+
+        # If the total can still grow, the bar
+        # isn't cleared when it reaches the total
+        self.growing = False
+
         self.unit: Literal['it', 'B'] = unit
         self.bar_format = bar_format
         self.title = title
@@ -200,12 +208,18 @@ class loadingbar(Generic[_T]):
     def refresh(self) -> None:
         "Refresh the loading bar, called automatically"
 
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        "Refresh the loading bar, the caller holds the lock"
+
         # Calculate progress
         if hasattr(self, 'total'):  # both, total
             if TYPE_CHECKING and not isinstance(self.total, int):
                 raise TypeError
 
-            percent = round(self.idx / self.total * 100, 0)
+            percent = round(self.idx / self.total * 100, 0) if self.total else 0
         else:
             percent = round(self.idx / self.iterator_len * 100, 0)
 
@@ -249,7 +263,8 @@ class loadingbar(Generic[_T]):
         ), end=end)
 
         # Clear the loading bar at the end
-        if self.idx == self.total if hasattr(self, 'total') else self.iterator_len:
+        if not self.growing and (
+                self.idx == self.total if hasattr(self, 'total') else self.iterator_len):
             if self.disappear and self.show_desc:
                 print('\r\033[K\033[F\r\033[K', end='')
             elif self.disappear:
@@ -259,19 +274,36 @@ class loadingbar(Generic[_T]):
 
     def update(self, amount: int) -> None:
         "Add 'n' amount of iterations to the loading bar"
-        if not hasattr(self, 'total'):
-            i = 0
+        with self._lock:
+            if not hasattr(self, 'total'):
+                i = 0
+
+                # Call next(self) while less than amount
+                while i < amount:
+                    try:
+                        next(self)
+                    except StopIteration:
+                        break
+
+                    i += 1
+            else:
+                self.idx += amount
+                self.refresh()
 
-            # Call next(self) while less than amount
-            while i < amount:
-                try:
-                    next(self)
-                except StopIteration:
-                    break
+    def add_total(self, amount: int, growing: bool = True) -> None:
+        """
+        Add 'n' to the total, used if it isn't known beforehand
 
-                i += 1
-        else:
-            self.idx += amount
+        :param amount: The amount added to the total
+        :param growing: If the total can still grow after this
+        """
+
+        with self._lock:
+            if TYPE_CHECKING and not isinstance(self.total, int):
+                raise TypeError
+
+            self.total += amount
+            self.growing = growing
             self.refresh()
 
     def set_desc(self, description: str) -> None:
@@ -282,9 +314,10 @@ class loadingbar(Generic[_T]):
             description = description[:self.max_terminal_width]
 
         # Set the description
-        self._new_desc = True
-        self.desc = description
+        with self._lock:
+            self._new_desc = True
+            self.desc = description
 
-        # Refresh the loading bar
-        self.refresh()
-        self._new_desc = False
+            # Refresh the loading bar
+            self.refresh()
+            self._new_desc = False
@@ -14,31 +14,118 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from json import load
-from os import path, mkdir
-from urllib import parse, request, error
-
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, Future
+from http.client import HTTPException, HTTPResponse
+from json import dump, load
+from os import path, mkdir, remove
+from tempfile import TemporaryDirectory
+from time import time
+from typing import Optional
+from urllib import parse, error
+
+from .downloader import content_size, download, download_run, verify, HashMismatchError
 from .urls import media_url
 from .loadingbar import loadingbar
+from .mirrors import add_mirrors, alternatives, rank_mirrors
+from .probes import probe_cache, url_metadata, IMMUTABLE_TYPES, REVALIDATE_TTL
+from .retry import retry
+from .scheduler import download_scheduler, set_bandwidth, DEFAULT_HOST_CONNECTIONS, MAX_HOST_CONNECTIONS
+from .state import install_state
+from .update import changes, load_record, save_record
 from .modloaders import inst_modloader, MINECRAFT_DIR
 from .filesize import size, alternative
 
+from ..common.cache import atomic_write
+from ..common.session import session, headers
 from ..typings import Manifest, URLMedia, Media, MediaList, Side
 
-# The headers to mimic a common browser user agent
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    "Accept-Language": "en-US,en;q=0.5",
-    "Accept-Encoding": "gzip, deflate, br",
-    "Connection": "keep-alive",
-    "Upgrade-Insecure-Requests": "1"
-}
+# The default amount of files downloaded at the same time
+DEFAULT_THREADS = 8
+
+
+def probe_url(url: str) -> url_metadata:
+    """
+    Get the size, ETag, Last-Modified and redirected url of a file without
+    downloading it. This sends a HEAD request and falls back to requesting
+    only the first byte if the server refuses it. Raises `HTTPError` if
+    every request fails.
+
+    :param url: The url of the file
+    """
+
+    # When returning an HTTP error, try again
+    # while mimicking a common browser user agent
+    try:
+        try:
+            resp = session.open(url, method='HEAD')
+        except error.HTTPError:
+            resp = session.open(url, headers, method='HEAD')
+    except error.HTTPError:
+        # Some servers don't allow HEAD requests, so
+        # only request the first byte of the file
+        resp = session.open(url, headers | {'Range': 'bytes=0-0'})
+
+    with resp:
+        return _metadata(resp)
+
+
+def probe_size(url: str) -> int:
+    """
+    Get the size of a file without downloading it, see `probe_url()`
+
+    :param url: The url of the file
+    """
+
+    return probe_url(url).size
+
+
+def revalidate(cached: url_metadata) -> Optional[url_metadata]:
+    """
+    Check if a probed file changed with a conditional HEAD request to the
+    url it redirected to. Returns `cached` if it didn't change, the new
+    metadata if it did, or `None` if it has to be probed again.
+
+    :param cached: The metadata from an earlier probe
+    """
+
+    req_headers = {}
+    if cached.etag is not None:
+        req_headers['If-None-Match'] = cached.etag
+    if cached.last_modified is not None:
+        req_headers['If-Modified-Since'] = cached.last_modified
+
+    try:
+        with session.open(cached.final_url, req_headers, method='HEAD') as resp:
+            return _metadata(resp)
+    except error.HTTPError as e:
+        e.close()
+
+        # Redirects to signed urls can expire
+        return cached if e.code == 304 else None
+    except (error.URLError, HTTPException, OSError):
+        return None
+
+
+def _metadata(resp: HTTPResponse) -> url_metadata:
+    "Get the metadata of a file from the response of a probe"
+    return url_metadata(content_size(resp), resp.headers.get('ETag'),
+                        resp.headers.get('Last-Modified'), resp.url)
 
 
 class prepare:
-    def __init__(self, install_path: str, side: Side, manifest: Manifest) -> None:
-        "Get the file size and check media validity while listing all media"
+    def __init__(self, install_path: str, side: Side, manifest: Manifest,
+                 threads: int = DEFAULT_THREADS, probe: bool = True) -> None:
+        """
+        Get the file size and check media validity while listing all media
+
+        :param install_path: The path it's going to be installed to
+        :param side: The side; `'client'` or `'server'`
+        :param manifest: The manifest data from `prepare.load_manifest()`
+        :param threads: The amount of sizes requested at the same time
+        :param probe: If the sizes should be requested. If not, they are
+                      `0` and get requested while downloading instead
+        """
 
         # Define the class variables
         self.install_path = install_path
@@ -46,6 +133,7 @@ class prepare:
 
         # Prepare the media
         self.total_size = 0
+        self.media: MediaList = []
 
         for media_type, media_list in {
             'mod': manifest.get('mods', []),
@@ -54,6 +142,9 @@ class prepare:
         }.items():
             self._prepare_media(media_type, media_list)
 
+        if probe:
+            self.total_size = self.probe(self.media, threads)
+
     @classmethod
     def load_manifest(cls, filename: str) -> Manifest:
         "Load a manifest file and validate it's general contents"
@@ -74,7 +165,8 @@ class prepare:
 
         return manifest
 
-    def _check_media_validity(self, media_list: MediaList, media_type: str) -> None:
+    @staticmethod
+    def _check_media_validity(media_list: MediaList, media_type: str) -> None:
         "Check for the modpack file validity"
         for media in media_list:
             for key in ['type', 'slug', 'name']:
@@ -93,34 +185,68 @@ class prepare:
             if 'sides' not in media.keys():
                 media['sides'] = sides
 
-    def _get_headers(self, media: Media, url: str) -> None:
-        "Recieve the content-length headers"
+    def probe(self, media_list: MediaList, threads: int = DEFAULT_THREADS) -> int:
+        """
+        Get the sizes of prepared media at the same time and return the total
+
+        :param media_list: The media to probe, from `self.media`
+        :param threads: The amount of sizes requested at the same time
+        """
+
+        with probe_cache() as probes, ThreadPoolExecutor(max_workers=threads) as executor:
+            return sum(executor.map(lambda media: self._get_headers(media, probes), media_list))
+
+    def _get_headers(self, media: Media, probes: probe_cache) -> int:
+        "Recieve the content-length headers and return the size"
+        url = media['_dl'][0]
+
+        # Locked media already have their size
+        if 'size' in media:
+            return media['size']
+
         try:
-            size = int(request.urlopen(
-                url).headers.get('content-length', 0))
-        except error.HTTPError:
-            try:
-                # When returning an HTTP error, try again
-                # while mimicking a common browser user agent
-                size = int(request.urlopen(request.Request(
-                    url, headers=headers)).headers.get('content-length', 0))
-            except error.HTTPError as e:
-                print(f"! WARNING: Could not download {media['name']}: \n{e}")
-
-                return
+            size = self._probe(url, media['type'] in IMMUTABLE_TYPES, probes)
+        except error.HTTPError as e:
+            print(f"! WARNING: Could not download {media['name']}: \n{e}")
+
+            return 0
         except error.URLError as e:
             if e.reason.__str__() in ("[Errno -2] Name or service not known", "[Errno 11001] getaddrinfo failed"):
                 print(f"! WARNING: The mod {media['name']}" +
                       f"was not found: {e.reason}")
-                return
+                return 0
             else:
                 raise e
 
-        # Add the size to the tuple and the total size
-        if '_dl' in media:
-            media['_dl'] = media['_dl'][:-1] + (size,)
+        # Add the size to the tuple
+        media['_dl'] = media['_dl'][:-1] + (size,)
+
+        return size
+
+    @staticmethod
+    def _probe(url: str, immutable: bool, probes: probe_cache) -> int:
+        """
+        Get the size of a file from the probe cache when it can be trusted,
+        otherwise revalidate or probe it and store the result
+
+        :param url: The url of the file
+        :param immutable: If the file at the url never changes
+        :param probes: The cache of earlier probes
+        """
+
+        cached = probes.get(url)
+        if cached is not None and (immutable or time() - cached.probed < REVALIDATE_TTL):
+            return cached.size
 
-        self.total_size += size
+        metadata = revalidate(cached) if cached is not None else None
+        if metadata is None:
+            metadata = retry(probe_url, alternatives(url))
+
+        # An unknown size is probed again next time
+        if metadata.size > 0:
+            probes.put(url, metadata)
+
+        return metadata.size
 
     def _prepare_media(self, media_type: str, media_list: MediaList) -> None:
         if len(media_list) == 0:
@@ -141,60 +267,79 @@ class prepare:
                 parse.unquote(media['name'])
             )
 
-            media['_dl'] = (url, dl_path, 0)
+            media['_dl'] = (url, dl_path, media.get('size', 0))
 
-            # Get the headers for appending the total size
-            self._get_headers(media, url)
+            # Get the headers for appending the total size later
+            self.media.append(media)
 
             # Print the media name
             print(f"  {media['slug']} ({parse.unquote(media['name'])})")
 
 
-def download_file(url: str, fname: str, bar: loadingbar[int]) -> None:
+def download_file(url: str, fname: str, bar: loadingbar[int], fsize: int = 0,
+                  sha1: Optional[str] = None, sha512: Optional[str] = None,
+                  state: Optional[install_state] = None,
+                  scheduler: Optional[download_scheduler] = None,
+                  immutable: bool = True,
+                  run: Optional[download_run] = None) -> Optional[Exception]:
+    """
+    Download a file while updating the loading bar. For the details,
+    look at `downloader.download()`. Returns the error if the download
+    still failed after retrying, or `None` if it succeeded.
+
+    :param url: The url of the file
+    :param fname: The path the file is written to
+    :param bar: The loading bar to update
+    :param fsize: The expected size. If it's `0`, the size
+                  of the response is added to the bar's total
+    :param sha1: The expected sha1 hash
+    :param sha512: The expected sha512 hash
+    :param state: The index the installed file is recorded in
+    :param scheduler: Limits the connections per host and the bandwidth
+    :param immutable: If the file at the url never changes
+    :param run: The run the download is shared in
+    """
+
     try:
         # Download and write the file
-        with request.urlopen(url) as resp, open(fname, 'wb') as media_file:
-            while True:
-                # Read the response data
-                data = resp.read(1024)
-
-                # Break if it's complete
-                if not data:
-                    break
-
-                # Update the bar
-                part_size = media_file.write(data)
-                bar.update(part_size)
-
-    except error.HTTPError:
-        # If the file is denied, it tries again while
-        # mimicking a common browser user agent
         try:
-            with request.urlopen(
-                    request.Request(url, headers=headers)
-            ) as resp, open(fname, 'wb') as media_file:
-                while True:
-                    data = resp.read(1024)
-                    if not data:
-                        break
-                    part_size = media_file.write(data)
-                    bar.update(part_size)
+            download(url, fname, bar, fsize, sha1=sha1, sha512=sha512, state=state,
+                     scheduler=scheduler, immutable=immutable, run=run)
         except error.HTTPError:
-            pass  # The user has already been warned
-    except error.URLError:
-        pass  # The user has already been warned
+            # If the file is denied, it tries again while
+            # mimicking a common browser user agent
+            download(url, fname, bar, fsize, headers, sha1=sha1, sha512=sha512, state=state,
+                     scheduler=scheduler, immutable=immutable, run=run)
+    except (error.URLError, HTTPException, ConnectionError, TimeoutError,
+            HashMismatchError) as e:
+        return e  # Retrying didn't help
+
+    return None
 
 
-def download_files(total_size: int, install_path: str, side: Side, manifest: Manifest) -> None:
+def download_files(total_size: int, install_path: str, side: Side,
+                   manifest: Manifest, threads: int = DEFAULT_THREADS,
+                   scheduler: Optional[download_scheduler] = None) -> None:
     """
     Download all files with a loading bar
 
-    :param total_size: The total size of all media
+    :param total_size: The total size of all media. Sizes that are already
+                       known from `media['_dl']` are counted as well
     :param install_path: The path it's going to be installed to
     :param side: The side; `'client'` or `'server'`
     :param manifest: The manifest data from `prepare.load_manifest()`
+    :param threads: The amount of files downloaded at the same time. With
+                    adaptive limits, the scheduler decides this per host
+    :param scheduler: Limits the connections per host and the bandwidth,
+                      by default `DEFAULT_HOST_CONNECTIONS` per host
     """
 
+    if threads < 1:
+        raise ValueError("The amount of threads must be at least 1")
+
+    if scheduler is None:
+        scheduler = download_scheduler()
+
     mods: MediaList = manifest.get('mods', [])
     resourcepacks: MediaList = manifest.get('resourcepacks', [])
     shaderpacks: MediaList = manifest.get('shaderpacks', [])
@@ -209,48 +354,96 @@ def download_files(total_size: int, install_path: str, side: Side, manifest: Man
 
     print('\033[?25l')  # Hide the cursor
     skipped_files = 0
+    failed: list[tuple[str, Exception]] = []
+
+    # Media with the same url are downloaded once
+    run = download_run()
 
     # Genereate the iterator
-    iterator: list[tuple[str, str, int, list[Side]]] = []
+    iterator: list[tuple[str, str, int, list[Side], Optional[str], Optional[str], bool]] = []
 
     for media in mods + resourcepacks + shaderpacks:
         if "_dl" not in media:
             continue
-        item: tuple[str, str, int, list[Side]] = (
-            *media['_dl'], media['sides'])
+        item: tuple[str, str, int, list[Side], Optional[str], Optional[str], bool] = (
+            *media['_dl'], media['sides'], media.get('sha1'), media.get('sha512'),
+            media['type'] in IMMUTABLE_TYPES)
         iterator.append(item)
 
+    def download_media(url: str, fname: str, fsize: int, sha1: Optional[str], sha512: Optional[str],
+                       immutable: bool, bar: loadingbar[int], state: install_state) -> bool:
+        "Download a single file in a worker thread. Returns if it's skipped"
+
+        file = parse.unquote(path.basename(fname))
+
+        if path.isfile(fname):
+            # Only trust installed files that are recorded
+            # as intact or otherwise match their hash
+            if state.intact(fname, url, sha1) or verify(fname, sha1, sha512):
+                # Inform it's already installed
+                bar.update(fsize)
+                bar.set_desc(file + " is already installed, skipping...")
+
+                return True
+
+            remove(fname)
+
+        # Set the description, with the connections to the host if they adapt
+        bar.set_desc(f"Downloading {file}..." + (
+            f" ({scheduler.status(url)})" if scheduler.adaptive else ''))
+
+        if (e := download_file(url, fname, bar, fsize, sha1, sha512,
+                               state, scheduler, immutable, run)) is not None:
+            failed.append((file, e))
+
+        return False
+
+    # Locked media and media that weren't probed for an update
+    # already have their size, which wasn't always counted
+    known_size = sum(fsize for _, _, fsize, sides, *_ in iterator if side in sides)
+
+    # Adaptive limits can only grow with enough threads to use them
+    if scheduler.adaptive:
+        hosts = {parse.urlparse(url).netloc for url, *_ in iterator}
+        threads = max(threads, min(len(iterator), MAX_HOST_CONNECTIONS * len(hosts)))
+
     # Download everything with a loading bar
     with loadingbar(
-        total=total_size,
+        total=max(total_size, known_size),
         unit='B',
         show_desc=True,
         disappear=True
-    ) as bar:
-        for url, fname, fsize, sides in iterator:
+    ) as bar, install_state(install_path) as state, \
+            ThreadPoolExecutor(max_workers=threads) as executor:
+        futures: list[Future[bool]] = []
+
+        # Files with an unknown size grow the total while downloading
+        bar.growing = any(fsize == 0 for _, _, fsize, *_ in iterator)
+
+        for url, fname, fsize, sides, sha1, sha512, immutable in iterator:
             if side not in sides:
                 # As the size isn't calculated, it
                 # doesn't have to update the bar
                 continue
 
-            if path.isfile(fname):
-                skipped_files += 1
+            futures.append(executor.submit(
+                download_media, url, fname, fsize, sha1, sha512, immutable, bar, state))
 
-                # Inform it's already installed
-                bar.update(fsize)
-                bar.set_desc(parse.unquote(path.basename(fname)) +
-                             " is already installed, skipping...")
-
-                continue
+        # Wait for all downloads and raise unexpected errors
+        for future in futures:
+            skipped_files += future.result()
 
-            # Set the description
-            file = parse.unquote(path.basename(fname))
-            bar.set_desc(f"Downloading {file}...")
-
-            download_file(url, fname, bar)
+        # All sizes are known now
+        if bar.growing:
+            bar.add_total(0, growing=False)
 
     print('\033[?25h')  # Show the cursor
 
+    # Warn about the files that are missing, they're
+    # downloaded again when installing the next time
+    for file, e in failed:
+        print(f"! WARNING: Could not download {file}: \n{e}")
+
     total_files = len([media for media in mods +
                       resourcepacks + shaderpacks if side in media.get('sides', [])])
 
@@ -268,7 +461,16 @@ def install(
     side: Side = 'client',
     install_modloader: bool = True,
     launcher_path: str = MINECRAFT_DIR,
-    confirm: bool = True
+    confirm: bool = True,
+    threads: int = DEFAULT_THREADS,
+    pipeline: bool = False,
+    update: bool = False,
+    host_connections: Optional[int] = DEFAULT_HOST_CONNECTIONS,
+    bandwidth: Optional[int] = None,
+    install_bandwidth: Optional[int] = None,
+    mirrors: dict[str, list[str]] = {},
+    hedge: bool = False,
+    adaptive: bool = False
 ) -> None:
     """
     Install a list of mods, resourcepacks, shaderpacks and config files. Arguments:
@@ -280,8 +482,35 @@ def install(
     :param inst_modloader: If you want to install the modloader
     :param launcher_path: The path of your launcher directory
     :param confirm: If the user should confirm the download
+    :param threads: The amount of files downloaded at the same time
+    :param pipeline: If files should start downloading without knowing \
+                     the total size, which is then calculated on the fly
+    :param update: If only the changes since the last install should be \
+                   downloaded, and files that were removed should be deleted
+    :param host_connections: The amount of connections to one host \
+                             at the same time, or `None` for no limit
+    :param bandwidth: The bytes per second of all downloads together. \
+                      This limit stays after installing, see `set_bandwidth()`
+    :param install_bandwidth: The bytes per second of the files of this install
+    :param mirrors: The base urls of mirrors per origin base url. The fastest \
+                    is used, the others when it fails. These stay after installing
+    :param hedge: If slow downloads should get a second request, \
+                  of which the fastest one is used
+    :param adaptive: If the connections per host start at `host_connections` \
+                     and grow while downloads succeed, but halve on congestion
     """
 
+    # Limit the downloads before anything is downloaded
+    if bandwidth is not None:
+        set_bandwidth(bandwidth)
+    scheduler = download_scheduler(host_connections, install_bandwidth, hedge, adaptive)
+
+    for origin, urls in mirrors.items():
+        add_mirrors(origin, *urls)
+
+    # Download from the fastest mirrors
+    rank_mirrors()
+
     # Import the manifest file
     manifest = prepare.load_manifest(manifest_file)
 
@@ -300,7 +529,15 @@ def install(
     resourcepacks: MediaList = manifest.get('resourcepacks', [])
     shaderpacks: MediaList = manifest.get('shaderpacks', [])
 
-    total_size = prepare(install_path, side, manifest).total_size
+    prepared = prepare(install_path, side, manifest, threads, probe=False)
+
+    # Only the changes since the last install have to be downloaded
+    if update:
+        diff = changes(install_path, load_record(install_path), prepared.media)
+        diff.print()
+
+    total_size = 0 if pipeline else prepared.probe(
+        diff.added + diff.changed if update else prepared.media, threads)
 
     # Give warnings for external sources
     external_media: list[URLMedia] = [_media for _media in [mod for mod in mods] +
@@ -317,7 +554,8 @@ def install(
     print(
         f"\n{len(mods)} mods, {len(resourcepacks)} "
         f"recourcepacks, {len(shaderpacks)} shaderpacks\n"
-        f"Total file size: {size(total_size, system=alternative)}"
+        "Total file size: " + (size(total_size, system=alternative)
+                               if not pipeline else "calculated while downloading")
     )
 
     # Ask for confirmation if confirm is True and install all modpacks
@@ -333,7 +571,113 @@ def install(
     # Download and install the modloader
     if install_modloader:
         inst_modloader(modloader, modpack_version, modloader_version,
-                       side, install_path, launcher_path)
+                       side, install_path, launcher_path, scheduler)
 
     # Download all files
-    download_files(total_size, install_path, side, manifest)
+    if update:
+        diff.clear_changed()
+
+    download_files(total_size, install_path, side, manifest, threads, scheduler)
+
+    # Remove the files that aren't used anymore
+    if update:
+        diff.prune()
+
+    save_record(install_path, manifest, prepared.media)
+
+
+def lock(manifest_file: str, threads: int = DEFAULT_THREADS) -> int:
+    """
+    Fill in the size, sha1 and sha512 of all media in a manifest, so installs
+    of it can skip probing. Every file is downloaded once to hash it, which
+    puts it in the download cache as well, and hashes that are already in the
+    manifest are verified. Returns the amount of media that changed.
+
+    :param manifest_file: The path of the manifest file, which is rewritten
+    :param threads: The amount of files downloaded at the same time
+    """
+
+    manifest = prepare.load_manifest(manifest_file)
+
+    # Validate copies, so the defaults it adds aren't written
+    media_list: MediaList = []
+    for media_type, key in (('mod', 'mods'), ('resourcepack', 'resourcepacks'),
+                            ('shaderpack', 'shaderpacks')):
+        prepare._check_media_validity([media.copy() for media in manifest.get(key, [])],
+                                      media_type)
+        media_list += manifest.get(key, [])
+
+    # Media with the same url are locked once
+    groups: dict[str, MediaList] = {}
+    for media in media_list:
+        groups.setdefault(media_url(media), []).append(media)
+
+    failed: list[tuple[str, Exception]] = []
+
+    def probe(url: str) -> int:
+        "Resolve the redirects and size of one file"
+        try:
+            return prepare._probe(url, groups[url][0]['type'] in IMMUTABLE_TYPES, probes)
+        except (error.URLError, HTTPException, OSError):
+            return 0  # The download reports the error
+
+    def lock_url(url: str) -> int:
+        "Download and hash one file, and return the amount of media that changed"
+        media = groups[url][0]
+        fname = path.join(directory, hashlib.sha1(url.encode()).hexdigest())
+
+        try:
+            file_sha1 = download(url, fname, bar, sizes[url], sha1=media.get('sha1'),
+                                 sha512=media.get('sha512'),
+                                 immutable=media['type'] in IMMUTABLE_TYPES)
+        except (error.URLError, HTTPException, OSError, ValueError) as e:
+            failed.append((media['name'], e))
+            return 0
+
+        # The download already verified the sha512 hash if it was given
+        if (file_sha512 := media.get('sha512')) is None:
+            hash = hashlib.sha512()
+            with open(fname, 'rb') as fp:
+                while chunk := fp.read(1024 ** 2):
+                    hash.update(chunk)
+            file_sha512 = hash.hexdigest()
+
+        locked = {'size': path.getsize(fname), 'sha1': file_sha1,
+                  'sha512': file_sha512.lower()}
+        remove(fname)
+
+        changed = 0
+        for media in groups[url]:
+            changed += any(media.get(key) != value for key, value in locked.items())
+            media.update(locked)  # type: ignore[typeddict-item]
+
+        return changed
+
+    # Probe everything first, for the total of the bar
+    with probe_cache() as probes, ThreadPoolExecutor(max_workers=threads) as executor:
+        sizes = dict(zip(groups, executor.map(probe, groups)))
+
+    with loadingbar(
+        total=sum(sizes.values()),
+        unit='B',
+        show_desc=True,
+        desc="Locking...",
+        disappear=True
+    ) as bar, TemporaryDirectory() as directory, \
+            ThreadPoolExecutor(max_workers=threads) as executor:
+        # Files with an unknown size grow the total while downloading
+        bar.growing = 0 in sizes.values()
+
+        changed = sum(executor.map(lock_url, groups))
+
+        if bar.growing:
+            bar.add_total(0, growing=False)
+
+    for file, e in failed:
+        print(f"! WARNING: Could not lock {file}: \n{e}")
+
+    with atomic_write(manifest_file) as temp, open(temp, 'w') as fp:
+        dump(manifest, fp, indent=4)
+        fp.write('\n')
+
+    return changed
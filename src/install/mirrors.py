@@ -0,0 +1,180 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from json import dump, load
+from os import makedirs, path
+from threading import Lock
+from time import monotonic, time
+from urllib.error import HTTPError
+
+from ..common.cache import CACHE_DIR, atomic_write
+from ..common.session import session
+
+# Alternative base urls per origin base url, like
+# {'https://maven.minecraftforge.net/': ['https://example.com/maven/']}
+mirrors: dict[str, list[str]] = {}
+_lock = Lock()
+
+# The seconds a mirror gets to respond to the latency probe
+PROBE_TIMEOUT = 3.0
+
+# The seconds a ranking of the mirrors is used before probing again
+RANK_TTL = 3600.0
+
+# The base urls per origin, fastest first, with the time they expire.
+# They're kept in the cache directory as well, so they last between runs
+rankings: dict[str, tuple[float, list[str]]] = {}
+RANKINGS_FILE = path.join(CACHE_DIR, 'mirrors.json') if CACHE_DIR else ''
+
+
+def _base(url: str) -> str:
+    "Make sure a base url ends with a slash"
+    return url if url.endswith('/') else url + '/'
+
+
+def parse_mirror(arg: str) -> tuple[str, str]:
+    """
+    Parse a mirror in the `'ORIGIN=MIRROR'` format
+
+    :param arg: The origin and mirror base urls
+    """
+
+    origin, sep, mirror = arg.partition('=')
+    if not sep or not origin or not mirror:
+        raise ValueError(f"A mirror must be in the ORIGIN=MIRROR format: {arg}")
+
+    return origin, mirror
+
+
+def add_mirrors(origin: str, *urls: str) -> None:
+    """
+    Add mirrors of an origin, which are tried when it fails
+
+    :param origin: The base url of the origin, like `'https://maven.minecraftforge.net/'`
+    :param urls: The base urls of the mirrors
+    """
+
+    with _lock:
+        known = mirrors.setdefault(_base(origin), [])
+        known.extend(url for url in map(_base, urls)
+                     if url not in known and url != _base(origin))
+
+
+def alternatives(url: str) -> list[str]:
+    """
+    Get the same url on the origin and on every mirror of the origin. If the
+    mirrors are ranked, the fastest one comes first, otherwise the url itself.
+
+    :param url: The url of the file
+    """
+
+    urls: list[str] = []
+
+    with _lock:
+        for origin, bases in mirrors.items():
+            if not url.startswith(origin):
+                continue
+
+            # New mirrors go after the ranked ones
+            ranking = rankings[origin][1] if origin in rankings else []
+            ranked = sorted([origin, *bases], key=lambda base: (
+                ranking.index(base) if base in ranking else len(ranking)))
+
+            urls.extend(base + url[len(origin):] for base in ranked)
+
+    return list(dict.fromkeys(urls)) if urls else [url]
+
+
+def probe(base: str, timeout: float = PROBE_TIMEOUT) -> float:
+    """
+    Measure the seconds it takes a host to respond to a
+    request, or infinity if it can't be reached in time
+
+    :param base: The base url of the origin or mirror
+    :param timeout: The seconds to wait for a connection and a response
+    """
+
+    start = monotonic()
+
+    try:
+        session.open(base, method='HEAD', timeout=timeout, connect_timeout=timeout).close()
+    except HTTPError as e:
+        e.close()  # Any response means it's reachable
+    except (HTTPException, OSError):
+        return float('inf')
+
+    return monotonic() - start
+
+
+def _load_rankings() -> None:
+    "Load the rankings that haven't expired from the cache directory"
+    try:
+        with open(RANKINGS_FILE) as fp:
+            stored: dict[str, list] = load(fp)
+    except (OSError, ValueError):
+        return
+
+    for origin, (expires, ranking) in stored.items():
+        if expires > time() and origin not in rankings:
+            rankings[origin] = (expires, ranking)
+
+
+def _save_rankings() -> None:
+    "Write the rankings to the cache directory"
+    try:
+        makedirs(path.dirname(RANKINGS_FILE), exist_ok=True)
+        with atomic_write(RANKINGS_FILE) as temp, open(temp, 'w') as fp:
+            dump(rankings, fp)
+    except OSError:
+        pass  # They're ranked again next time
+
+
+def rank_mirrors(force: bool = False) -> None:
+    """
+    Probe the latency of every origin with mirrors and its mirrors
+    at the same time, so `alternatives()` puts the fastest first.
+    Rankings younger than `RANK_TTL` are kept, unless the
+    mirrors of the origin changed.
+
+    :param force: Probe again, even if the rankings haven't expired
+    """
+
+    with _lock:
+        if RANKINGS_FILE and not force:
+            _load_rankings()
+
+        # Only probe the origins with outdated rankings
+        outdated = {origin: [origin, *bases] for origin, bases in mirrors.items()
+                    if bases and (force or origin not in rankings
+                                  or rankings[origin][0] <= time()
+                                  or sorted(rankings[origin][1]) != sorted([origin, *bases]))}
+
+    if not outdated:
+        return
+
+    hosts = sorted({base for bases in outdated.values() for base in bases})
+    with ThreadPoolExecutor(max_workers=len(hosts)) as executor:
+        latencies = dict(zip(hosts, executor.map(probe, hosts)))
+
+    with _lock:
+        for origin, bases in outdated.items():
+            # The origin stays first if it's as fast as the rest
+            rankings[origin] = (time() + RANK_TTL, sorted(bases, key=latencies.__getitem__))
+
+        if RANKINGS_FILE:
+            _save_rankings()
@@ -15,29 +15,31 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from atexit import register
-from json import load, dump
+from http.client import HTTPException
+from json import load, loads, dump
 from os import path, getenv, mkdir, makedirs, rename
 from shutil import rmtree, copyfile
 from subprocess import check_call, DEVNULL
 from sys import platform
-from typing import TYPE_CHECKING
-from urllib import request
+from typing import Optional
 from zipfile import ZipFile
 
-if TYPE_CHECKING:
-    from http.client import HTTPResponse
-
+from .downloader import download, download_run, verify
 from .loadingbar import loadingbar
-from .urls import forge as forge_urls
+from .mirrors import add_mirrors, rank_mirrors
+from .scheduler import download_scheduler
+from .state import install_state
+from .urls import fabric as fabric_urls, forge as forge_urls
 
 from ..common.maven_coords import maven_parse
+from ..common.session import session
 from ..apis import fabric_meta, piston_meta
 
 from ..typings import (
     Side, Modloader,
     ForgeLibrary, OSLibrary,
     InstallProfile, Libraries,
-    ForgeVersionJson
+    ForgeVersionJson, ForgeMirror
 )
 
 # Define the minecraft directory
@@ -57,7 +59,8 @@ class forge:
                  forge_version: str,
                  side: Side = 'client',
                  install_dir: str = MINECRAFT_DIR,
-                 launcher_dir: str = MINECRAFT_DIR) -> None:
+                 launcher_dir: str = MINECRAFT_DIR,
+                 scheduler: Optional[download_scheduler] = None) -> None:
         """
         Installs a specified forge version
 
@@ -66,6 +69,7 @@ class forge:
         :param side: The side; `'client'` or `'server'`
         :param install_dir: The directory minecraft forge gets installed
         :param launcher_dir: The launcher dir (ignored if on server side)
+        :param scheduler: Limits the connections per host and the bandwidth
         """
 
         # Define the class variables
@@ -76,6 +80,8 @@ class forge:
         self.side: Side = side
         self.install_dir = install_dir
         self.launcher_dir = launcher_dir
+        self.scheduler = scheduler
+        self.run = download_run()
 
         self.temp_dir = path.join(launcher_dir, '.temp')
         self.minecraft_json = piston_meta.get_minecraft_json(mc_version)
@@ -142,7 +148,8 @@ class forge:
                 }
                 dump(launcher_profiles, fp, indent=2)
 
-        # Install all libraries
+        # Install all libraries, with the forge mirrors as fallback
+        self.add_mirrors()
         self.install_libraries()
 
         # Build the processors
@@ -199,24 +206,39 @@ class forge:
                                 f"{self.mc_version}.json"), 'w') as fp:
                 dump(self.minecraft_json, fp, indent=2)
 
-        # Define the download urls
-        downloads = {
-            self.installer: forge_urls.forge_installer_url(self.mc_version, self.forge_version),
-            self.minecraft_jar: self.minecraft_json['downloads'][self.side]['url']
+        # Define the download urls and hashes
+        downloads: dict[str, tuple[str, Optional[str]]] = {
+            self.installer: (forge_urls.forge_installer_url(self.mc_version, self.forge_version), None),
+            self.minecraft_jar: (self.minecraft_json['downloads'][self.side]['url'],
+                                 self.minecraft_json['downloads'][self.side]['sha1'])
         }
 
-        # Download everything
-        for fname, url in downloads.items():
-            resp: 'HTTPResponse'
-            with request.urlopen(url) as resp, open(path.join(fname), 'wb') as mod_file:
-                while True:
-                    resp_data = resp.read(1024)
-                    if not resp_data:
-                        break
-                    mod_file.write(resp_data)
-
-    def download_library(self, bar: loadingbar[ForgeLibrary | OSLibrary], library: ForgeLibrary) -> None:
-        """Download a library"""
+        # Download everything, large files in segments, and record it in the launcher dir
+        with install_state(self.launcher_dir) as state:
+            for fname, (url, sha1) in downloads.items():
+                # Skip the files that are already installed and intact
+                if state.intact(fname, url, sha1):
+                    continue
+
+                download(url, fname, sha1=sha1, state=state,
+                         scheduler=self.scheduler, run=self.run)
+
+    def add_mirrors(self) -> None:
+        """Add the mirrors from the install profile's mirror list"""
+        if not (mirror_list := self.install_profile.get('mirrorList')):
+            return
+
+        try:
+            mirrors: list[ForgeMirror] = loads(session.read(mirror_list))
+        except (HTTPException, OSError, ValueError):
+            return  # The mirrors are only a fallback
+
+        add_mirrors(forge_urls.MAVEN, *(mirror['url'] for mirror in mirrors if 'url' in mirror))
+        rank_mirrors()
+
+    def download_library(self, bar: loadingbar[ForgeLibrary | OSLibrary], library: ForgeLibrary,
+                         state: Optional[install_state] = None) -> None:
+        """Download a library and record it in `state`"""
         # Define the java os names
         osdict = {
             "windows": "win32",
@@ -259,22 +281,23 @@ class forge:
                                  library_path), full_library_path)  # Move to the right dir
             return
 
-        # Check if the files don't already exist
-        if path.isfile(full_library_path):
+        # Check if the files are already installed and intact. If they
+        # aren't in the index yet, check their hash and record them
+        if state is not None and state.intact(full_library_path, sha1=library['sha1']):
+            intact = True
+        elif intact := path.isfile(full_library_path) and verify(full_library_path, library['sha1']):
+            if state is not None:
+                state.record(full_library_path, library['url'], library['sha1'])
+
+        if intact:
             # Just update the bar and return if they exist
             bar.update(library['size'])
             bar.refresh()
             return
 
-        # Download the files
-        # TODO: Check the sha1
-        with request.urlopen(library['url']) as resp, open(full_library_path, 'wb') as mod_file:
-            while True:
-                resp_data = resp.read(1024)
-                if not resp_data:
-                    break
-                size = mod_file.write(resp_data)
-                bar.update(size)
+        # Download and verify the files
+        download(library['url'], full_library_path, bar, library['size'],
+                 sha1=library['sha1'], state=state, scheduler=self.scheduler, run=self.run)
 
     def install_libraries(self) -> None:
         """Installs all libraries"""
@@ -300,15 +323,16 @@ class forge:
         total_size = sum([library['size']
                          for library in self.libraries.values()])
 
-        # Download all libraries
-        for library in (bar := loadingbar(
-            self.libraries.values(),
-            unit='B',
-            title="Downloading Forge:",
-            disappear=True,
-            total=total_size,
-        )):
-            self.download_library(bar, library)
+        # Download all libraries and record them in the launcher dir
+        with install_state(self.launcher_dir) as state:
+            for library in (bar := loadingbar(
+                self.libraries.values(),
+                unit='B',
+                title="Downloading Forge:",
+                disappear=True,
+                total=total_size,
+            )):
+                self.download_library(bar, library, state)
 
     def build_processors(self) -> None:
         """Build the processors"""
@@ -380,7 +404,8 @@ class fabric:
         fabric_version: str,
         side: Side,
         install_dir: str = MINECRAFT_DIR,
-        launcher_dir: str = MINECRAFT_DIR
+        launcher_dir: str = MINECRAFT_DIR,
+        scheduler: Optional[download_scheduler] = None
     ) -> None:
         """
         Installs a specified fabric version
@@ -390,6 +415,7 @@ class fabric:
         :param side: The side; `'client'` or `'server'`
         :param install_dir: The directory minecraft fabric gets installed
         :param launcher_dir: The launcher dir (ignored if on server side)
+        :param scheduler: Limits the connections per host and the bandwidth
         """
 
         # Define the class variables
@@ -400,13 +426,15 @@ class fabric:
         self.side: Side = side
         self.install_dir = install_dir
         self.launcher_dir = launcher_dir
+        self.scheduler = scheduler
+        self.run = download_run()
 
         loader = fabric_meta.loader(mc_version, fabric_version)
 
         self.version_json = loader.profile_json()
         self.libraries = loader.libraries(launcher_dir, side, [{
-            'name': loader.loader['maven'], 'url': "https://maven.fabricmc.net/"}, {
-            'name': loader.intermediary['maven'], 'url': "https://maven.fabricmc.net/"
+            'name': loader.loader['maven'], 'url': fabric_urls.MAVEN}, {
+            'name': loader.intermediary['maven'], 'url': fabric_urls.MAVEN
         }])
 
         # Exit if the launcher hasn't launched once
@@ -427,20 +455,19 @@ class fabric:
     def download_jar_files(self) -> None:
         """Download the jar files"""
 
-        # Download everything
-        for library in self.libraries:
-            # Make the appropiate directories
-            makedirs(path.dirname(library['file']), exist_ok=True)
-
-            # Download the resource
-            resp: 'HTTPResponse'
-            with (request.urlopen(library['url']) as resp,
-                  open(path.join(library['file']), 'wb') as mod_file):
-                while True:
-                    resp_data = resp.read(1024)
-                    if not resp_data:
-                        break
-                    mod_file.write(resp_data)
+        # Download everything and record it in the launcher dir
+        with install_state(self.launcher_dir) as state:
+            for library in self.libraries:
+                # Skip the libraries that are already installed and intact
+                if state.intact(library['file'], library['url']):
+                    continue
+
+                # Make the appropiate directories
+                makedirs(path.dirname(library['file']), exist_ok=True)
+
+                # Download the resource
+                download(library['url'], library['file'], state=state,
+                         scheduler=self.scheduler, run=self.run)
 
     def update_version_info(self) -> None:
         """Update version info and inject launcher profiles"""
@@ -485,7 +512,8 @@ def inst_modloader(
     modloader_version: str,
     side: Side,
     install_path: str,
-    launcher_path: str
+    launcher_path: str,
+    scheduler: Optional[download_scheduler] = None
 ) -> None:
     """
     Installs the modloader. Used internally by media.py
@@ -495,14 +523,15 @@ def inst_modloader(
     :param side: The side; `'client'` or `'server'`
     :param install_dir: The directory the modloader gets installed
     :param launcher_dir: The launcher dir (ignored if on server side)
+    :param scheduler: Limits the connections per host and the bandwidth
     """
 
     match modloader:
         case 'forge':
             forge(modpack_version, modloader_version,
-                  side, install_path, launcher_path)
+                  side, install_path, launcher_path, scheduler)
         case 'fabric':
             fabric(modpack_version, modloader_version,
-                   side, install_path, launcher_path)
+                   side, install_path, launcher_path, scheduler)
         case _:
             print("WARNING: Couldn't install modloader because it isn't supported.")
@@ -0,0 +1,90 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from dataclasses import dataclass
+from os import path
+from time import time
+from typing import Optional
+
+from ..common.cache import CACHE_DIR
+from ..common.database import database
+
+# The file the probed urls are stored in
+PROBES_FILE = path.join(CACHE_DIR, 'probes.db') if CACHE_DIR else ''
+
+# The media types of which the files never change after they're uploaded
+IMMUTABLE_TYPES = ('cf', 'mr')
+
+# The seconds before the probe of another url is revalidated
+REVALIDATE_TTL = 24 * 3600.0
+
+
+@dataclass
+class url_metadata:
+    "What's known about a url without downloading it"
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    final_url: str  # After following the redirects
+    probed: float = 0.0
+
+
+class probe_cache(database):
+    def __init__(self, fname: str = PROBES_FILE) -> None:
+        """
+        Remembers the size, ETag, Last-Modified and redirected url of
+        probed urls between runs. It's safe to use from multiple threads.
+
+        :param fname: The sqlite file of the cache, `''` keeps it in memory
+        """
+
+        super().__init__(fname, """
+            CREATE TABLE IF NOT EXISTS probes (
+                url TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                final_url TEXT NOT NULL,
+                probed REAL NOT NULL
+            );
+        """)
+
+    def get(self, url: str) -> Optional[url_metadata]:
+        "Get the stored probe of a url"
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, etag, last_modified, final_url, probed FROM probes WHERE url = ?",
+                (url,)
+            ).fetchone()
+
+        return None if row is None else url_metadata(*row)
+
+    def put(self, url: str, metadata: url_metadata) -> None:
+        """
+        Store the probe of a url, as probed now
+
+        :param url: The url that was probed
+        :param metadata: The result of probing it
+        """
+
+        metadata.probed = time()
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?)",
+                (url, metadata.size, metadata.etag, metadata.last_modified,
+                 metadata.final_url, metadata.probed)
+            )
@@ -0,0 +1,148 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from email.utils import parsedate_to_datetime
+from http.client import HTTPException
+from random import uniform
+from time import sleep, time
+from typing import Callable, Optional, TypeVar
+from urllib import error
+
+_T = TypeVar('_T')
+
+# The default amount of attempts before giving up
+DEFAULT_ATTEMPTS = 4
+
+# The delay before the first retry, which doubles every retry (seconds)
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+
+# The longest 'Retry-After' that's waited for (seconds)
+MAX_RETRY_AFTER = 300.0
+
+# The http errors that can disappear by trying again
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class retry_policy:
+    def __init__(self, attempts: int = DEFAULT_ATTEMPTS,
+                 base_delay: float = BASE_DELAY,
+                 max_delay: float = MAX_DELAY) -> None:
+        """
+        Decides which errors are retried and how long to wait before that.
+        The delay doubles every retry with a random jitter, so parallel
+        downloads don't retry at the same time. A 'Retry-After' header
+        on 429 and 503 responses is used instead.
+
+        :param attempts: The amount of attempts before giving up
+        :param base_delay: The maximum delay before the first retry
+        :param max_delay: The maximum delay before any retry
+        """
+
+        if attempts < 1:
+            raise ValueError("The amount of attempts must be at least 1")
+
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def retryable(self, e: Exception) -> bool:
+        "If an error can disappear by trying again"
+        if isinstance(e, error.HTTPError):
+            return e.code in RETRY_STATUS
+
+        # Connection errors, timeouts and responses that ended early
+        return isinstance(e, (error.URLError, HTTPException, ConnectionError, TimeoutError))
+
+    def delay(self, failures: int, e: Exception) -> float:
+        """
+        The seconds to wait before the next attempt
+
+        :param failures: The amount of failed attempts so far
+        :param e: The error of the last attempt
+        """
+
+        if isinstance(e, error.HTTPError) and e.code in (429, 503) \
+                and (retry_after := _retry_after(e)) is not None:
+            return min(retry_after, MAX_RETRY_AFTER)
+
+        return uniform(0, min(self.max_delay, self.base_delay * 2 ** (failures - 1)))
+
+
+def _retry_after(e: error.HTTPError) -> Optional[float]:
+    "Get the seconds of a 'Retry-After' header, which is a delay or a date"
+    value: Optional[str] = e.headers.get('retry-after') if e.headers else None
+    if value is None:
+        return None
+
+    if value.strip().isdigit():
+        return float(value)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+# The policy used when none is given
+default_policy = retry_policy()
+
+
+def retry(func: Callable[[str], _T], urls: list[str],
+          policy: Optional[retry_policy] = None,
+          on_retry: Optional[Callable[[Exception], None]] = None) -> _T:
+    """
+    Call `func` with a url until it succeeds. After an error that can
+    disappear, it waits and tries again with the next url, so mirrors
+    take turns. Other errors (like a 404) only move on to the next url.
+    The last error is raised if every attempt or url failed.
+
+    :param func: The function that downloads from a url
+    :param urls: The url and its mirrors, in order of preference
+    :param policy: The retry policy, `default_policy` by default
+    :param on_retry: Called with the error before every retry
+    """
+
+    policy = default_policy if policy is None else policy
+    usable = list(urls)
+    failures = 0
+    index = 0
+
+    while True:
+        url = usable[index % len(usable)]
+
+        try:
+            return func(url)
+        except Exception as e:
+            if policy.retryable(e):
+                failures += 1
+                if failures >= policy.attempts:
+                    raise
+
+                wait = policy.delay(failures, e)
+                index += 1
+            else:
+                # Only another url can fix this
+                usable.remove(url)
+                if not usable:
+                    raise
+
+                wait = 0
+
+            if on_retry is not None:
+                on_retry(e)
+
+            sleep(wait)
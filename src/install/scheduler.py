@@ -0,0 +1,360 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import deque
+from contextlib import contextmanager
+from statistics import median
+from threading import Condition, Lock
+from time import monotonic, sleep
+from typing import Iterator, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+
+# The default amount of connections to one host at the same time
+DEFAULT_HOST_CONNECTIONS = 6
+
+# Adaptive limits grow by one connection after as many successful
+# transfers as there are connections, up to `MAX_HOST_CONNECTIONS`,
+# and are halved when the host is congested
+MAX_HOST_CONNECTIONS = 16
+
+# Responses that mean the host gets too many requests
+CONGESTION_STATUS = {429, 503}
+
+# Failures that happen at the same time are one congestion,
+# so a host is backed off once per this many seconds
+_BACKOFF_INTERVAL = 2.0
+
+# The throughput of a host collapsed if it's less than
+# its average divided by this
+_COLLAPSE_FACTOR = 4
+
+# Transfers slower than the median rate divided by `HEDGE_FACTOR`
+# after `HEDGE_DELAY` seconds get a second request, if it's worth it
+HEDGE_FACTOR = 4
+HEDGE_DELAY = 3.0
+HEDGE_MIN_SIZE = 1024 ** 2
+
+# The amount of recent transfers the median rate is taken from,
+# and the least amount needed before anything is hedged
+_RATE_SAMPLES = 32
+_MIN_RATE_SAMPLES = 3
+
+# Smaller transfers mostly measure the latency, not the rate
+_MIN_RATE_SIZE = 256 * 1024
+
+# The suffixes accepted by `parse_rate()`
+_RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(rate: str) -> int:
+    """
+    Parse a bandwidth like `'500K'` or `'2M'` to bytes per second
+
+    :param rate: The amount of bytes, optionally followed by K, M or G
+    """
+
+    value = rate.strip().upper().removesuffix('/S').removesuffix('B')
+    number, unit = value.rstrip('KMG'), value[len(value.rstrip('KMG')):]
+
+    try:
+        amount = float(number) * _RATE_UNITS[unit]
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid bandwidth: {rate}") from None
+
+    if amount < 1:
+        raise ValueError(f"The bandwidth must be at least 1 byte per second: {rate}")
+
+    return int(amount)
+
+
+class token_bucket:
+    def __init__(self, rate: int, burst: Optional[int] = None) -> None:
+        """
+        Limits the amount of bytes per second. The bucket fills with
+        `rate` tokens per second, up to `burst`, and taking more tokens
+        than there are waits until they would have been filled.
+
+        :param rate: The amount of bytes per second
+        :param burst: The amount of bytes that can be taken at once
+                      after being idle, `rate` by default
+        """
+
+        if rate < 1:
+            raise ValueError("The rate must be at least 1 byte per second")
+
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+
+        self._tokens = float(self.burst)
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def consume(self, amount: int) -> None:
+        "Take `amount` tokens, waiting if there aren't enough"
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+
+            # Go into debt, so the threads that come
+            # after this one wait for it as well
+            self._tokens -= amount
+            wait = -self._tokens / self.rate
+
+        if wait > 0:
+            sleep(wait)
+
+
+# The limit of all downloads together, set with `set_bandwidth()`
+_bandwidth: Optional[token_bucket] = None
+
+
+def set_bandwidth(rate: Optional[int]) -> None:
+    """
+    Limit the bandwidth of all downloads together
+
+    :param rate: The amount of bytes per second, or `None` for no limit
+    """
+
+    global _bandwidth
+    _bandwidth = None if rate is None else token_bucket(rate)
+
+
+def congested(e: BaseException) -> bool:
+    """
+    Check if an error means the host can't handle more connections
+
+    :param e: The error of a download
+    """
+
+    if isinstance(e, HTTPError):
+        return e.code in CONGESTION_STATUS
+
+    # Connection errors are wrapped in an `URLError`
+    if isinstance(e, URLError) and isinstance(e.reason, BaseException):
+        e = e.reason
+
+    return isinstance(e, (ConnectionResetError, TimeoutError))
+
+
+class _host_state:
+    def __init__(self, limit: Optional[int]) -> None:
+        "The connections to one host and their limit"
+        self.active = 0
+        self.limit = None if limit is None else float(limit)
+
+        self.backed_off = 0.0  # The last time it was backed off
+        self.throughput: Optional[float] = None  # The average bytes per second
+
+
+class download_scheduler:
+    def __init__(self, host_connections: Optional[int] = DEFAULT_HOST_CONNECTIONS,
+                 bandwidth: Optional[int] = None, hedge: bool = False,
+                 adaptive: bool = False) -> None:
+        """
+        Limits the connections per host and the bandwidth of downloads.
+        The global bandwidth from `set_bandwidth()` always applies as well.
+
+        :param host_connections: The amount of connections to one host
+                                 at the same time, or `None` for no limit
+        :param bandwidth: The bytes per second of the downloads
+                          using this scheduler, or `None` for no limit
+        :param hedge: Start a second request for transfers that are far
+                      behind the median rate, and keep the fastest one
+        :param adaptive: Start every host at `host_connections` and grow it
+                         while transfers succeed, but halve it on congestion
+        """
+
+        if host_connections is not None and host_connections < 1:
+            raise ValueError("The amount of connections per host must be at least 1")
+        if adaptive and host_connections is None:
+            raise ValueError("Adaptive limits need a starting amount of connections")
+
+        self.host_connections = host_connections
+        self.bandwidth = None if bandwidth is None else token_bucket(bandwidth)
+        self.hedge = hedge
+        self.adaptive = adaptive
+
+        self._rates: deque[float] = deque(maxlen=_RATE_SAMPLES)
+
+        self._hosts: dict[str, _host_state] = {}
+        self._condition = Condition()
+
+    def _host(self, url: str) -> _host_state:
+        "Get the state of the host of `url`, the caller holds the lock"
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = _host_state(self.host_connections)
+
+        return self._hosts[host]
+
+    @property
+    def throttled(self) -> bool:
+        "If any bandwidth limit applies"
+        return self.bandwidth is not None or _bandwidth is not None
+
+    def acquire(self, url: str, amount: int = 1, wait: bool = True) -> int:
+        """
+        Take connection slots for the host of `url`. Returns the amount taken,
+        which can be less than `amount` (or `0`) if `wait` is false.
+
+        :param url: The url that's downloaded
+        :param amount: The amount of slots to take
+        :param wait: Wait until all slots are free
+        """
+
+        with self._condition:
+            host = self._host(url)
+
+            if host.limit is None:
+                free = amount
+            elif wait:
+                self._condition.wait_for(lambda: host.limit is not None and (
+                    host.active + amount <= int(host.limit) or host.active == 0))
+                free = amount
+            else:
+                free = max(0, min(amount, int(host.limit) - host.active))
+
+            host.active += free
+
+        return free
+
+    def release(self, url: str, amount: int = 1) -> None:
+        "Give back slots taken with `acquire()`"
+        with self._condition:
+            self._host(url).active -= amount
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """
+        Hold one connection slot for the host of `url`. With
+        adaptive limits, the outcome changes the limit of the host.
+        """
+
+        self.acquire(url)
+        try:
+            yield
+        except BaseException as e:
+            if congested(e):
+                self.back_off(url)
+            raise
+        else:
+            self.grow(url)
+        finally:
+            self.release(url)
+
+    def grow(self, url: str) -> None:
+        "Increase the adaptive limit of the host of `url` after a success"
+        if not self.adaptive:
+            return
+
+        with self._condition:
+            host = self._host(url)
+            assert host.limit is not None
+
+            host.limit = min(MAX_HOST_CONNECTIONS, host.limit + 1 / host.limit)
+            self._condition.notify_all()
+
+    def back_off(self, url: str) -> None:
+        "Halve the adaptive limit of the host of `url` after congestion"
+        if not self.adaptive:
+            return
+
+        with self._condition:
+            host = self._host(url)
+            assert host.limit is not None
+
+            if monotonic() - host.backed_off >= _BACKOFF_INTERVAL:
+                host.limit = max(1.0, host.limit / 2)
+                host.backed_off = monotonic()
+
+    def status(self, url: str) -> str:
+        "Describe the connections to the host of `url`, like `'a.com 3/6'`"
+        with self._condition:
+            host = self._host(url)
+            limit = '-' if host.limit is None else int(host.limit)
+
+            return f"{urlparse(url).netloc} {host.active}/{limit}"
+
+    def record_rate(self, size: int, seconds: float, url: Optional[str] = None) -> None:
+        """
+        Remember the rate of a completed transfer. With adaptive limits,
+        the host is backed off if its throughput collapsed.
+
+        :param size: The amount of bytes transferred
+        :param seconds: The time it took
+        :param url: The url that's downloaded
+        """
+
+        if size < _MIN_RATE_SIZE or seconds <= 0:
+            return
+
+        with self._condition:
+            self._rates.append(size / seconds)
+
+            if not self.adaptive or url is None:
+                return
+
+            # The other connections to the host are about as fast
+            host = self._host(url)
+            throughput = size / seconds * max(1, host.active)
+            collapsed = host.throughput is not None and \
+                throughput < host.throughput / _COLLAPSE_FACTOR
+
+            host.throughput = throughput if host.throughput is None \
+                else host.throughput * 0.7 + throughput * 0.3
+
+        if collapsed:
+            self.back_off(url)
+
+    def expected_rate(self) -> Optional[float]:
+        "The median rate of the recent transfers, if there are enough"
+        with self._condition:
+            if len(self._rates) < _MIN_RATE_SAMPLES:
+                return None
+
+            return median(self._rates)
+
+    def should_hedge(self, done: int, seconds: float, left: int) -> bool:
+        """
+        Check if a transfer is slow enough to start a second request
+
+        :param done: The bytes transferred so far
+        :param seconds: The time the transfer has been running
+        :param left: The bytes that are left
+        """
+
+        if not self.hedge or seconds < HEDGE_DELAY or left < HEDGE_MIN_SIZE:
+            return False
+
+        if (expected := self.expected_rate()) is None:
+            return False
+
+        return done / seconds < expected / HEDGE_FACTOR
+
+    def throttle(self, amount: int) -> None:
+        "Wait until `amount` bytes may be downloaded"
+        if self.bandwidth is not None:
+            self.bandwidth.consume(amount)
+        if _bandwidth is not None:
+            _bandwidth.consume(amount)
+
+
+# The scheduler used for downloads without one
+default_scheduler = download_scheduler(host_connections=None)
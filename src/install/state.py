@@ -0,0 +1,109 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from os import path, stat
+from typing import Optional
+
+from ..common.database import database
+
+# The file in the install and launcher directories with the index
+STATE_FILE = '.mcm-state.db'
+
+
+class install_state(database):
+    def __init__(self, directory: str) -> None:
+        """
+        An index of the files that were installed in a directory. It
+        records the url, size, modification time and sha1 hash of every
+        file, so it can tell if a file is still intact without hashing
+        it or sending any requests. It's safe to use from multiple threads.
+
+        :param directory: The install or launcher directory
+        """
+
+        self.directory = directory
+
+        super().__init__(path.join(directory, STATE_FILE), """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha1 TEXT NOT NULL
+            );
+        """)
+
+    def _relpath(self, fname: str) -> str:
+        "The path of a file relative to the directory, with '/' as separator"
+        return path.relpath(fname, self.directory).replace(path.sep, '/')
+
+    def record(self, fname: str, url: str, sha1: str) -> None:
+        """
+        Record a file that's completely installed
+
+        :param fname: The path of the file
+        :param url: The url it was downloaded from
+        :param sha1: The sha1 hash of the file
+        """
+
+        info = stat(fname)
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (self._relpath(fname), url, info.st_size, info.st_mtime_ns, sha1.lower())
+            )
+
+    def forget(self, *fnames: str) -> None:
+        "Remove files from the index"
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM files WHERE path = ?",
+                [(self._relpath(fname),) for fname in fnames]
+            )
+
+    def intact(self, fname: str, url: Optional[str] = None,
+               sha1: Optional[str] = None) -> bool:
+        """
+        Check if a file is installed and unmodified since it was recorded
+
+        :param fname: The path of the file
+        :param url: The url it should be downloaded from, if it matters
+        :param sha1: The sha1 hash it should have, if it's known
+        """
+
+        with self._lock:
+            row: Optional[tuple[str, int, int, str]] = self._db.execute(
+                "SELECT url, size, mtime_ns, sha1 FROM files WHERE path = ?",
+                (self._relpath(fname),)
+            ).fetchone()
+
+        if row is None:
+            return False
+
+        try:
+            info = stat(fname)
+        except FileNotFoundError:
+            return False
+
+        return (info.st_size, info.st_mtime_ns) == row[1:3] \
+            and url in (None, row[0]) and (sha1 is None or sha1.lower() == row[3])
+
+    def installed(self) -> dict[str, tuple[str, int, str]]:
+        "List all recorded files by their relative path with their url, size and sha1"
+        with self._lock:
+            return {relpath: (url, size, sha1) for relpath, url, size, sha1 in self._db.execute(
+                "SELECT path, url, size, sha1 FROM files")}
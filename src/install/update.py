@@ -0,0 +1,144 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from json import load, dump
+from os import path, remove
+from typing import Optional
+
+from .state import install_state
+
+from ..common.cache import atomic_write
+from ..typings import AppliedFile, AppliedManifest, Manifest, Media, MediaList
+
+# The file in the install path that records the last applied manifest
+RECORD_FILE = '.mcm-manifest.json'
+
+
+def _relpath(install_path: str, fname: str) -> str:
+    "The path of a file relative to the install path, with '/' as separator"
+    return path.relpath(fname, install_path).replace(path.sep, '/')
+
+
+def _applied_file(media: Media) -> AppliedFile:
+    "Get the recorded information of prepared media"
+    applied: AppliedFile = {'url': media['_dl'][0]}
+
+    if 'sha1' in media:
+        applied['sha1'] = media['sha1']
+    if 'sha512' in media:
+        applied['sha512'] = media['sha512']
+
+    return applied
+
+
+def load_record(install_path: str) -> Optional[AppliedManifest]:
+    "Load the last applied manifest of an install path, if there is one"
+    try:
+        with open(path.join(install_path, RECORD_FILE)) as fp:
+            return load(fp)
+    except FileNotFoundError:
+        return None
+
+
+def save_record(install_path: str, manifest: Manifest, media_list: MediaList) -> None:
+    """
+    Record the applied manifest in the install path
+
+    :param install_path: The path it was installed to
+    :param manifest: The manifest data from `prepare.load_manifest()`
+    :param media_list: The prepared media, from `prepare.media`
+    """
+
+    record: AppliedManifest = {
+        'minecraft': manifest['minecraft'],
+        'files': {
+            _relpath(install_path, media['_dl'][1]): _applied_file(media)
+            for media in media_list
+        }
+    }
+
+    with atomic_write(path.join(install_path, RECORD_FILE)) as temp, open(temp, 'w') as fp:
+        dump(record, fp, indent=2)
+
+
+class changes:
+    def __init__(self, install_path: str, record: Optional[AppliedManifest],
+                 media_list: MediaList) -> None:
+        """
+        Compare prepared media with the last applied manifest. Media that's
+        the same doesn't have to be probed or downloaded again, and files
+        that aren't in the manifest anymore can be removed.
+
+        :param install_path: The path it's installed to
+        :param record: The last applied manifest from `load_record()`
+        :param media_list: The prepared media, from `prepare.media`
+        """
+
+        self.install_path = install_path
+
+        self.added: MediaList = []
+        self.changed: MediaList = []
+        self.unchanged: MediaList = []
+
+        files = record['files'] if record is not None else {}
+        current: set[str] = set()
+
+        for media in media_list:
+            current.add(relpath := _relpath(install_path, media['_dl'][1]))
+
+            if relpath not in files:
+                self.added.append(media)
+            elif files[relpath] != _applied_file(media):
+                self.changed.append(media)
+            else:
+                self.unchanged.append(media)
+
+        # Only remove files that were installed by a manifest
+        self.removed = [relpath for relpath in files if relpath not in current
+                        and not path.normpath(relpath).startswith('..')]
+
+    def print(self) -> None:
+        "List all changes"
+        if not (self.added or self.changed or self.removed):
+            print("\nNo changes since the last install")
+            return
+
+        print("\nChanges since the last install:")
+        for sign, media_list in (('+', self.added), ('~', self.changed)):
+            for media in media_list:
+                print(f"  {sign} {media['slug']} ({path.basename(media['_dl'][1])})")
+        for relpath in self.removed:
+            print(f"  - {relpath}")
+
+    def clear_changed(self) -> None:
+        "Remove the old versions of changed files, so they're downloaded again"
+        for media in self.changed:
+            for fname in (media['_dl'][1], media['_dl'][1] + '.part'):
+                if path.isfile(fname):
+                    remove(fname)
+
+    def prune(self) -> None:
+        "Remove the files that aren't in the manifest anymore"
+        fnames = [path.join(self.install_path, path.normpath(relpath))
+                  for relpath in self.removed]
+
+        for fname in fnames:
+            if path.isfile(fname):
+                remove(fname)
+
+        # Remove them from the index as well
+        with install_state(self.install_path) as state:
+            state.forget(*fnames)
@@ -38,7 +38,15 @@ def media_url(media: Media) -> str:
 
 
 class forge:
+    # The maven repository of forge and its libraries
+    MAVEN = "https://maven.minecraftforge.net/"
+
     @staticmethod
     def forge_installer_url(mc_version: str, forge_version: str) -> str:
-        return "https://maven.minecraftforge.net/net/minecraftforge/forge/" \
+        return forge.MAVEN + "net/minecraftforge/forge/" \
             f"{mc_version}-{forge_version}/forge-{mc_version}-{forge_version}-installer.jar"
+
+
+class fabric:
+    # The maven repository of fabric and its libraries
+    MAVEN = "https://maven.fabricmc.net/"
@@ -0,0 +1,155 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from queue import Queue
+from threading import Thread
+from time import monotonic
+from typing import BinaryIO, Callable, Optional, Protocol
+
+try:
+    from os import posix_fallocate
+except ImportError:
+    posix_fallocate = None  # Windows and macOS
+
+# The buffer size grows from the minimum to the maximum while
+# reads are fast, and shrinks when they're slow, so progress
+# is still updated regularly on slow connections
+MIN_BUFFER_SIZE = 64 * 1024
+MAX_BUFFER_SIZE = 1024 ** 2
+
+# Grow if filling the buffer took less, shrink if it took more (seconds)
+_FAST_READ = 0.05
+_SLOW_READ = 0.5
+
+
+class Readable(Protocol):
+    "Anything that supports readinto(), like an `HTTPResponse`"
+
+    def readinto(self, b: memoryview, /) -> Optional[int]: ...
+
+
+def preallocate(fp: BinaryIO, size: int) -> None:
+    """
+    Reserve the disk space for a file of `size` bytes, where it's
+    supported. This also sets the file size, so truncate the file
+    afterwards if it's smaller than expected.
+
+    :param fp: The opened file
+    :param size: The complete size of the file
+    """
+
+    if posix_fallocate is None or size <= 0:
+        return
+
+    try:
+        posix_fallocate(fp.fileno(), 0, size)
+    except OSError:
+        pass  # The file system doesn't support it
+
+
+def stream(resp: Readable, fp: BinaryIO,
+           length: Optional[int] = None,
+           on_data: Optional[Callable[[memoryview], None]] = None,
+           write_behind: bool = False,
+           throttle: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Copy a response to a file using reused buffers. Returns the amount of
+    bytes written, which is less than `length` if the response ended early.
+
+    :param resp: The response that's read from
+    :param fp: The file that's written to, at its current position
+    :param length: The maximum amount of bytes, or `None` to read everything
+    :param on_data: Called with every written part, like to update a bar
+    :param write_behind: Write to the disk on a separate thread,
+                         so reading and writing happens at the same time
+    :param throttle: Called with the size of every read, and can wait
+                     to limit the bandwidth. This keeps the buffer small
+    """
+
+    # With write-behind, one buffer is read into while the other is written
+    free: Queue[memoryview] = Queue()
+    for _ in range(2 if write_behind else 1):
+        free.put(memoryview(bytearray(MAX_BUFFER_SIZE)))
+
+    filled: Queue[Optional[tuple[memoryview, int]]] = Queue()
+    errors: list[BaseException] = []
+
+    def write(data: memoryview) -> None:
+        fp.write(data)
+        if on_data is not None:
+            on_data(data)
+
+    def writer() -> None:
+        while (item := filled.get()) is not None:
+            buffer, size = item
+            try:
+                # Skip the writes after an error, but keep returning buffers
+                if not errors:
+                    write(buffer[:size])
+            except BaseException as e:
+                errors.append(e)
+
+            free.put(buffer)
+
+    if write_behind:
+        thread = Thread(target=writer, daemon=True)
+        thread.start()
+
+    written = 0
+    buffer_size = MIN_BUFFER_SIZE
+
+    try:
+        while length is None or written < length:
+            buffer = free.get()
+            if errors:
+                break
+
+            # Read the response data
+            limit = buffer_size if length is None else min(buffer_size, length - written)
+            start = monotonic()
+            size = resp.readinto(buffer[:limit]) or 0
+
+            # Break if it's complete
+            if size == 0:
+                break
+
+            if throttle is not None:
+                throttle(size)
+
+            if write_behind:
+                filled.put((buffer, size))
+            else:
+                write(buffer[:size])
+                free.put(buffer)
+
+            written += size
+
+            # Adapt the buffer size to the speed. Throttled
+            # reads stay small to keep the bandwidth even
+            elapsed = monotonic() - start
+            if throttle is None and size == limit and elapsed < _FAST_READ:
+                buffer_size = min(buffer_size * 2, MAX_BUFFER_SIZE)
+            elif elapsed > _SLOW_READ:
+                buffer_size = max(buffer_size // 2, MIN_BUFFER_SIZE)
+    finally:
+        if write_behind:
+            filled.put(None)
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return written
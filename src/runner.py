@@ -15,11 +15,17 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from argparse import ArgumentParser
+from atexit import register
 from dataclasses import dataclass, fields
 from os import path, makedirs
 from typing import Any, Literal, Optional, TypedDict, TypeVar
 
-from .install.media import install
+from .apis.fabric_index import fabric_index
+from .common.session import session, READ_TIMEOUT
+from .common.transport import cassette
+from .install.media import install, lock, DEFAULT_THREADS
+from .install.mirrors import parse_mirror
+from .install.scheduler import parse_rate, DEFAULT_HOST_CONNECTIONS
 from .install.modloaders import MINECRAFT_DIR
 from .typings import Side
 
@@ -31,6 +37,15 @@ class Options(TypedDict):
     install_modloader: bool
     launcher_path: str
     confirm: bool
+    threads: int
+    pipeline: bool
+    update: bool
+    host_connections: int
+    bandwidth: Optional[int]
+    install_bandwidth: Optional[int]
+    mirrors: dict[str, list[str]]
+    hedge: bool
+    adaptive: bool
 
 
 @dataclass(init=False)
@@ -41,10 +56,23 @@ class _Args:
     # Options
     y: bool            # confirm installation
     o: bool            # install modloader
+    p: bool            # pipeline downloads
+    u: bool            # update
     m: Optional[str]   # manifest
     i: Optional[str]   # install path
     s: Optional[Side]  # side
     l: Optional[str]   # launcher path
+    t: Optional[int]   # threads
+    c: Optional[int]   # connections per host
+    b: Optional[int]   # bandwidth
+    install_bandwidth: Optional[int]
+    mirror: Optional[list[tuple[str, str]]]
+    timeout: Optional[float]
+    deadline: Optional[float]
+    hedge: bool
+    adaptive: bool
+    record: Optional[str]
+    replay: Optional[str]
 
     def __init__(self, **kwargs: Any) -> None:
         """Ignore non-existent names"""
@@ -76,6 +104,16 @@ class parse:
             help='install a package directly'
         )
 
+        cls.parser.add_argument(
+            'sync', nargs='?', default=False,
+            help='update the local index of fabric versions'
+        )
+
+        cls.parser.add_argument(
+            'lock', nargs='?', default=False,
+            help='fill in the sizes and hashes of the manifest'
+        )
+
         # Define optional arguments
         optional_args: list[tuple[tuple[str, ...], str, str] | tuple[tuple[str, ...], str]] = [
             (('-y', '--yes'), "continue installation without confirmation"),
@@ -84,6 +122,8 @@ class parse:
             (('-s',), 'SIDE', "specify the side to be installed (client or server)"),
             (('-l',), 'LAUNCHERPATH', "specify the path of the launcher"),
             (('-o',), "install the modloader"),
+            (('-p',), "start downloading before all file sizes are known"),
+            (('-u',), "only install changes since the last install and remove old files"),
         ]
 
         # Add optional arguments
@@ -99,9 +139,76 @@ class parse:
                     dest=arg[0][0][1], help=arg[1]
                 )
 
+        # Add optional arguments that aren't strings
+        cls.parser.add_argument(
+            '-t', metavar='THREADS', type=int,
+            help=f"specify the amount of simultaneous downloads (default: {DEFAULT_THREADS})"
+        )
+
+        cls.parser.add_argument(
+            '-c', metavar='CONNECTIONS', type=int,
+            help="specify the amount of simultaneous connections "
+            f"to one host (default: {DEFAULT_HOST_CONNECTIONS})"
+        )
+
+        cls.parser.add_argument(
+            '-b', metavar='BANDWIDTH', type=parse_rate,
+            help="limit the download speed of all downloads together in bytes per second, like 500K or 2M"
+        )
+
+        cls.parser.add_argument(
+            '--install-bandwidth', metavar='BANDWIDTH', type=parse_rate,
+            help="limit the download speed of the files of this install, like -b"
+        )
+
+        cls.parser.add_argument(
+            '--mirror', metavar='ORIGIN=MIRROR', type=parse_mirror, action='append',
+            help="add a mirror of an origin base url, the fastest of them is used"
+        )
+
+        cls.parser.add_argument(
+            '--timeout', metavar='SECONDS', type=float,
+            help=f"specify how long to wait for data before retrying (default: {READ_TIMEOUT:g})"
+        )
+
+        cls.parser.add_argument(
+            '--deadline', metavar='SECONDS', type=float,
+            help="specify how long a single request may take before retrying"
+        )
+
+        cls.parser.add_argument(
+            '--hedge', action='store_true',
+            help="start a second request for downloads that are much slower than the others"
+        )
+
+        cls.parser.add_argument(
+            '--adaptive', action='store_true',
+            help="grow the connections per host while downloads succeed, and halve them when the host is congested. "
+            "The connections decide the amount of simultaneous downloads instead of -t"
+        )
+
+        cls.parser.add_argument(
+            '--record', metavar='CASSETTE',
+            help="record all responses to a file, to replay them later"
+        )
+
+        cls.parser.add_argument(
+            '--replay', metavar='CASSETTE',
+            help="replay the responses recorded with --record instead of using the network"
+        )
+
         # Get the args and execute the right function
         return _Args(**vars(cls.parser.parse_args()))
 
+    @staticmethod
+    def _mirrors(args: _Args) -> dict[str, list[str]]:
+        """Group the mirrors by origin"""
+        mirrors: dict[str, list[str]] = {}
+        for origin, mirror in args.mirror or []:
+            mirrors.setdefault(origin, []).append(mirror)
+
+        return mirrors
+
     @classmethod
     def _cli(cls, args: _Args) -> None:
         """Ask questions and execute `install()` with the answers"""
@@ -134,7 +241,16 @@ class parse:
                 "side": 'server' if ask(args.s, questions[2]) == 'server' else 'client',
                 "install_modloader": (inst_modl := ask_yes(args.o, questions[3])),
                 "launcher_path": ask(args.l, questions[4]) if inst_modl else '',
-                "confirm": not args.y
+                "confirm": not args.y,
+                "threads": DEFAULT_THREADS if args.t is None else args.t,
+                "pipeline": args.p,
+                "update": args.u,
+                "host_connections": DEFAULT_HOST_CONNECTIONS if args.c is None else args.c,
+                "bandwidth": args.b,
+                "install_bandwidth": args.install_bandwidth,
+                "mirrors": cls._mirrors(args),
+                "hedge": args.hedge,
+                "adaptive": args.adaptive
             }
         except KeyboardInterrupt:
             print(end='\n')
@@ -167,6 +283,35 @@ class parse:
             raise TypeError(
                 "side has to be either 'client', 'server' or None.")
 
+        if args.t is not None and args.t < 1:
+            raise ValueError("threads has to be at least 1.")
+
+        if args.c is not None and args.c < 1:
+            raise ValueError("connections has to be at least 1.")
+
+        if args.timeout is not None and args.timeout <= 0:
+            raise ValueError("timeout has to be more than 0.")
+
+        if args.deadline is not None and args.deadline <= 0:
+            raise ValueError("deadline has to be more than 0.")
+
+        # Apply the timeouts to all requests
+        if args.timeout is not None:
+            session.timeout = args.timeout
+        if args.deadline is not None:
+            session.deadline = args.deadline
+
+        if args.record is not None and args.replay is not None:
+            raise ValueError("record and replay can't be used at the same time.")
+
+        # Send the requests through a cassette, which
+        # writes the recorded responses when exiting
+        if args.record is not None:
+            session.transport = cassette(args.record, session.transport)
+            register(session.close)
+        elif args.replay is not None:
+            session.transport = cassette(args.replay)
+
         match args.pos:
             case 'cli':
                 cls._cli(args)
@@ -179,11 +324,34 @@ class parse:
                     "side": 'server' if args.s == 'server' else 'client',
                     "install_modloader": (inst_modl := args.o),
                     "launcher_path": args.l if args.l is not None and inst_modl else MINECRAFT_DIR,
-                    "confirm": not args.y
+                    "confirm": not args.y,
+                    "threads": DEFAULT_THREADS if args.t is None else args.t,
+                    "pipeline": args.p,
+                    "update": args.u,
+                    "host_connections": DEFAULT_HOST_CONNECTIONS if args.c is None else args.c,
+                    "bandwidth": args.b,
+                    "install_bandwidth": args.install_bandwidth,
+                    "mirrors": cls._mirrors(args),
+                    "hedge": args.hedge,
+                    "adaptive": args.adaptive
                 }
 
                 install(**options)
 
+            case 'sync':
+                with fabric_index() as index:
+                    added, changed, removed = index.sync()
+
+                print(f"Synced the fabric versions: {added} added, "
+                      f"{changed} changed, {removed} removed")
+
+            case 'lock':
+                manifest_file = args.m or path.join(cls.current_dir, '..', 'share',
+                                                    'modpacks', 'example-manifest.json')
+                changed = lock(manifest_file, DEFAULT_THREADS if args.t is None else args.t)
+
+                print(f"Locked {manifest_file}: {changed} media changed")
+
             case _:
                 # TODO else, execute the gui (not finished)
                 raise NotImplementedError(
@@ -55,6 +55,13 @@ class _Media(Generic[_T], TypedDict):
     sides: list[Literal['client', 'server']]
     info: NotRequired[_Info]
 
+    # Optional hashes to verify the file
+    sha1: NotRequired[str]
+    sha512: NotRequired[str]
+
+    # The size of the file, filled in by `lock()`
+    size: NotRequired[int]
+
     # Download info: url, path, size
     _dl: NotRequired[tuple[str, str, int]]
 
@@ -92,6 +99,22 @@ class Manifest(TypedDict):
     shaderpacks: MediaList
 
 
+# ============================ #
+#       install/update.py      #
+# ============================ #
+class AppliedFile(TypedDict):
+    "A file that was installed from the manifest"
+    url: str
+    sha1: NotRequired[str]
+    sha512: NotRequired[str]
+
+
+class AppliedManifest(TypedDict):
+    "A record of the last applied manifest"
+    minecraft: _Minecraft
+    files: dict[str, AppliedFile]
+
+
 # ============================ #
 #     install/modloaders.py    #
 # ============================ #
@@ -261,6 +284,27 @@ class ForgeVersionJson(_JavaJson[_ForgeLibrary]):
     inheritsFrom: str
 
 
+class ManifestVersion(TypedDict):
+    id: str
+    type: str
+    url: str
+    time: str
+    releaseTime: str
+    sha1: str
+    complianceLevel: int
+
+
+class _Latest(TypedDict):
+    release: str
+    snapshot: str
+
+
+class VersionManifest(TypedDict):
+    "Minecraft version_manifest_v2.json file"
+    latest: _Latest
+    versions: list[ManifestVersion]
+
+
 # Install profile
 class _Data(TypedDict):
     client: str
@@ -291,6 +335,13 @@ class InstallProfile(TypedDict):
     welcome: str
 
 
+class ForgeMirror(TypedDict):
+    name: str
+    image: NotRequired[str]
+    homepage: NotRequired[str]
+    url: str
+
+
 # ========== #
 #   Fabric   #
 # ========== #
@@ -0,0 +1,94 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from json import dumps
+from typing import Any
+from unittest.mock import patch
+from urllib import request
+
+from src.apis.fabric_index import all_versions_url, fabric_index
+from src.common.session import session
+from src.common.transport import make_response, transport
+
+
+def all_versions(loaders: int) -> dict[str, list[dict[str, Any]]]:
+    return {
+        'game': [{'version': '1.20.2-pre1', 'stable': False},
+                 {'version': '1.20.1', 'stable': True}],
+        'mappings': [{'gameVersion': '1.20.1', 'separator': '+build.', 'build': 10,
+                      'maven': 'net.fabricmc:yarn:1.20.1+build.10',
+                      'version': '1.20.1+build.10', 'stable': False}],
+        'intermediary': [{'maven': 'net.fabricmc:intermediary:1.20.1',
+                          'version': '1.20.1', 'stable': True}],
+        'loader': [{'separator': '.', 'build': build, 'maven': f'net.fabricmc:fabric-loader:0.14.{build}',
+                    'version': f'0.14.{build}', 'stable': build < 22}
+                   for build in range(loaders, 0, -1)] +
+                  # An older minor version with a higher build
+                  [{'separator': '.', 'build': 30, 'maven': 'net.fabricmc:fabric-loader:0.13.30',
+                    'version': '0.13.30', 'stable': True}]
+    }
+
+
+class _fabric(transport):
+    "Serves the versions with their amount of loaders as ETag"
+
+    def __init__(self, loaders: int) -> None:
+        self.loaders = loaders
+        self.requests = 0
+
+    def open(self, http_class: Any, req: request.Request, **http_conn_args: Any):
+        self.requests += 1
+        assert req.get_full_url() == all_versions_url
+
+        if req.get_header('If-none-match') == str(self.loaders):
+            return make_response(req, 304, [])
+
+        return make_response(req, 200, [('ETag', str(self.loaders))],
+                             dumps(all_versions(self.loaders)).encode())
+
+
+class FabricIndex(unittest.TestCase):
+    def test_index(self):
+        fabric = _fabric(22)
+
+        with fabric_index('') as index, patch.object(session, 'transport', fabric):
+            self.assertEqual(index.sync(), (27, 0, 0))
+
+            self.assertEqual(index.game(stable=True), [{'version': '1.20.1', 'stable': True}])
+            self.assertEqual(index.yarn('1.20.1')[0]['build'], 10)
+            self.assertEqual(index.loader()[0]['version'], '0.14.22')
+            self.assertEqual(index.latest_loader('1.20.1')['version'], '0.14.21')  # type: ignore
+            self.assertEqual(index.latest_loader('1.20.1', stable=False)['version'], '0.14.22')  # type: ignore
+            self.assertIsNone(index.latest_loader('1.20.2-pre1'))
+
+            # Nothing is written if it didn't change
+            self.assertEqual(index.sync(), (0, 0, 0))
+            self.assertEqual(fabric.requests, 2)
+
+            # Only the new loader is written
+            fabric.loaders = 23
+            self.assertEqual(index.sync(), (1, 0, 0))
+            self.assertEqual(index.loader()[0]['version'], '0.14.23')
+
+            # And versions that disappeared are removed
+            fabric.loaders = 21
+            self.assertEqual(index.sync(), (0, 0, 2))
+            self.assertEqual(index.loader()[0]['version'], '0.14.21')
+
+
+if __name__ == '__main__':
+    unittest.main()
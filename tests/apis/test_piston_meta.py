@@ -0,0 +1,86 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from hashlib import sha1
+from json import dumps
+from os import path
+from typing import Any
+from unittest.mock import patch
+from urllib import request
+
+from ..config import TMPDIR
+from ..globalfuncs import cleanup
+from ..install.setup import maketemp
+
+from src.apis import piston_meta
+from src.common.response_cache import response_cache
+from src.common.session import session
+from src.common.transport import make_response, transport
+
+version_json = dumps({'id': '1.20.1', 'libraries': []}).encode()
+manifest = dumps({'latest': {}, 'versions': [{
+    'id': '1.20.1', 'url': 'https://piston-meta.mojang.com/v1/1.20.1.json',
+    'sha1': sha1(version_json).hexdigest()
+}]}).encode()
+
+
+class _mojang(transport):
+    "Serves the version manifest with an ETag"
+
+    def __init__(self) -> None:
+        self.requests: list[str] = []
+
+    def open(self, http_class: Any, req: request.Request, **http_conn_args: Any):
+        self.requests.append(req.get_full_url())
+
+        if req.get_full_url() != piston_meta.version_manifest_v2:
+            return make_response(req, 200, [], version_json)
+        if req.get_header('If-none-match') == '"1"':
+            return make_response(req, 304, [])
+
+        return make_response(req, 200, [('ETag', '"1"')], manifest)
+
+
+class PistonMeta(unittest.TestCase):
+    @cleanup
+    @patch.object(piston_meta, 'META_DIR', path.join(TMPDIR, 'piston-meta'))
+    @patch.object(piston_meta, 'meta_cache', response_cache(path.join(TMPDIR, 'responses')))
+    def test_cache(self):
+        maketemp()
+        mojang = _mojang()
+
+        with patch.object(session, 'transport', mojang):
+            self.assertEqual(piston_meta.get_minecraft_json('1.20.1')['id'], '1.20.1')
+            self.assertEqual(len(mojang.requests), 2)
+
+            # Everything is stored, in memory and on the disk
+            piston_meta.get_minecraft_json('1.20.1')
+            piston_meta.meta_cache = response_cache(path.join(TMPDIR, 'responses'))
+            piston_meta.get_minecraft_json('1.20.1')
+            self.assertEqual(len(mojang.requests), 2)
+
+            # After the ttl, the manifest is validated with its ETag
+            with patch.object(piston_meta, 'MANIFEST_TTL', 0):
+                piston_meta.get_minecraft_json('1.20.1')
+            self.assertEqual(len(mojang.requests), 3)
+
+            with self.assertRaises(KeyError):
+                piston_meta.get_minecraft_json('1.0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from os import listdir, makedirs, path
+
+from ..config import TMPDIR
+from ..globalfuncs import cleanup
+
+from src.common.cache import atomic_write, download_cache, file_sha1
+
+CACHEDIR = path.join(TMPDIR, 'cache')
+FILEDIR = path.join(TMPDIR, 'files')
+
+
+class DownloadCache(unittest.TestCase):
+    @cleanup
+    def test_cache(self):
+        makedirs(FILEDIR)
+        cache = download_cache(CACHEDIR)
+
+        # Add a downloaded file
+        with open(fname := path.join(FILEDIR, 'file.jar'), 'wb') as fp:
+            fp.write(b'file contents')
+        sha1 = file_sha1(fname)
+
+        self.assertIsNone(cache.lookup('https://example.com/file.jar'))
+        cache.add('https://example.com/file.jar', fname)
+
+        # Find it by url and by hash
+        self.assertIsNotNone(cache.lookup('https://example.com/file.jar'))
+        self.assertIsNotNone(cache.lookup('https://example.com/other.jar', sha1))
+        self.assertIsNone(cache.lookup('https://example.com/other.jar'))
+        self.assertIsNone(cache.lookup('https://example.com/file.jar', '0' * 40))
+
+        # Files that can change are only found by their hash
+        self.assertIsNone(cache.lookup('https://example.com/file.jar', by_url=False))
+        self.assertIsNotNone(cache.lookup('https://example.com/file.jar', sha1, by_url=False))
+
+        # Place it in another install path, also over an existing file
+        for dest in ('copy.jar', 'copy.jar'):
+            self.assertTrue(cache.fill('https://example.com/file.jar',
+                                       path.join(FILEDIR, dest)))
+
+            with open(path.join(FILEDIR, dest), 'rb') as fp:
+                self.assertEqual(fp.read(), b'file contents')
+
+    def test_disabled(self):
+        cache = download_cache('')
+
+        self.assertFalse(cache.enabled)
+        self.assertFalse(cache.fill('https://example.com/file.jar', 'file.jar'))
+
+    @cleanup
+    def test_atomic_write(self):
+        makedirs(FILEDIR)
+        fname = path.join(FILEDIR, 'file.json')
+
+        with atomic_write(fname) as temp, open(temp, 'w') as fp:
+            fp.write('first')
+
+        # A failed write leaves the file as it was
+        with self.assertRaises(ValueError):
+            with atomic_write(fname) as temp, open(temp, 'w') as fp:
+                fp.write('second')
+                raise ValueError
+
+        with open(fname) as fp:
+            self.assertEqual(fp.read(), 'first')
+        self.assertEqual(listdir(FILEDIR), ['file.json'])
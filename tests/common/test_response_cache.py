@@ -0,0 +1,94 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from os import path
+from unittest.mock import patch
+from urllib import error
+
+from ..config import TMPDIR
+from ..globalfuncs import cleanup
+from ..install.server import FileServer
+from ..install.setup import maketemp
+
+from src.apis import fabric_meta
+from src.common.response_cache import response_cache
+from src.common.session import session
+from src.common.transport import memory_transport
+
+url = 'https://meta.fabricmc.net/v2/versions/game'
+
+
+class ResponseCache(unittest.TestCase):
+    @cleanup
+    def test_cache(self):
+        maketemp()
+        cache = response_cache(path.join(TMPDIR, 'responses'), max_entries=1)
+        transport = memory_transport({url: b'[]', url + '/yarn': b'[1]'})
+
+        with patch.object(session, 'transport', transport):
+            self.assertEqual(cache.get(url, 60), b'[]')
+            self.assertEqual(cache.get(url + '/yarn', 60), b'[1]')
+
+            # The first one only stays on the disk
+            self.assertEqual(list(cache._memory), [url + '/yarn'])
+            self.assertEqual(cache.get(url, 60), b'[]')
+            self.assertEqual(len(transport.requests), 2)
+
+            # An outdated response is used while the host is down
+            transport.files[url] = 503
+            self.assertEqual(cache.get(url, 0), b'[]')
+            with self.assertRaises(error.HTTPError):
+                cache.get(url + '/intermediary', 0)
+
+        # And without any network at all
+        cache.offline = True
+        self.assertEqual(cache.get(url, 0), b'[]')
+        with self.assertRaises(LookupError):
+            cache.get(url + '/intermediary', 0)
+
+    @cleanup
+    def test_archive(self):
+        maketemp()
+        cache = response_cache(path.join(TMPDIR, 'responses'))
+
+        # Archives are requested as they are, and only kept on the disk
+        with FileServer({'/profile.zip': b'zip' * 1000}, gzip=True) as server:
+            self.assertEqual(cache.get(server.url('/profile.zip'), 60, archive=True), b'zip' * 1000)
+            self.assertEqual(cache.get(server.url('/profile.zip'), 60, archive=True), b'zip' * 1000)
+            self.assertEqual(len(server.requests), 1)
+
+        self.assertEqual(list(cache._memory), [])
+
+    def test_fabric_meta(self):
+        base = 'https://meta.fabricmc.net/v2/versions/loader/1.20.1/0.14.22'
+        transport = memory_transport({
+            base + '/': b'{"loader": {}, "intermediary": {}, "launcherMeta": {}}',
+            base + '/profile/json': b'{"id": "fabric-loader-0.14.22-1.20.1"}'
+        })
+
+        # Installing twice requests every endpoint once
+        with patch.object(session, 'transport', transport), \
+                patch.object(fabric_meta, 'meta_cache', response_cache('')):
+            for _ in range(2):
+                loader = fabric_meta.loader('1.20.1', '0.14.22')
+                self.assertEqual(loader.profile_json()['id'], 'fabric-loader-0.14.22-1.20.1')
+
+        self.assertEqual(len(transport.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
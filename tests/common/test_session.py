@@ -0,0 +1,165 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from gzip import compress
+from http.client import HTTPConnection
+from socket import socketpair
+from time import sleep
+from unittest.mock import patch
+from zlib import compress as zlib_compress
+from urllib import error
+
+from ..install.server import FileServer
+
+from src.common.session import _decoder, headers, http_session, waited, StalledError
+
+
+class Session(unittest.TestCase):
+    def test_keep_alive(self):
+        session = http_session()
+
+        with FileServer({'/a.jar': b'a' * 1000, '/b.jar': b'b' * 10}) as server:
+            # Read responses completely, partially and not at all
+            self.assertEqual(session.open(server.url('/a.jar')).read(), b'a' * 1000)
+            with session.open(server.url('/b.jar')) as resp:
+                self.assertEqual(resp.read(), b'b' * 10)
+            with session.open(server.url('/a.jar'), method='HEAD') as resp:
+                self.assertEqual(resp.headers['content-length'], '1000')
+
+            self.assertEqual(server.connections, 1)
+
+            # A connection with unread data can't be reused
+            with session.open(server.url('/a.jar')) as resp:
+                resp.read(10)
+            self.assertEqual(session.open(server.url('/b.jar')).read(), b'b' * 10)
+            self.assertEqual(server.connections, 2)
+
+            # Errors are raised like urlopen
+            with self.assertRaises(error.HTTPError):
+                session.open(server.url('/missing.jar'))
+
+        session.close()
+
+    def test_decode(self):
+        session = http_session()
+        data = b'{"versions": []}' * 1000
+
+        with FileServer({'/versions.json': data}, gzip=True) as server:
+            self.assertEqual(session.read(server.url('/versions.json')), data)
+
+            # Files are downloaded as they are
+            with session.open(server.url('/versions.json'), headers) as resp:
+                self.assertNotIn('Content-Encoding', resp.headers)
+                self.assertEqual(resp.read(), data)
+
+        # Deflate with and without the zlib header
+        for encoded in (zlib_compress(data), zlib_compress(data)[2:-4]):
+            decoder = _decoder('deflate')
+            decoded = b''.join(decoder.decode(encoded[i:i + 100])
+                               for i in range(0, len(encoded), 100))
+            self.assertEqual(decoded + decoder.flush(), data)
+
+        self.assertEqual(_decoder('x-gzip').decode(compress(data)), data)
+        with self.assertRaises(ValueError):
+            _decoder('br')
+
+        session.close()
+
+    def test_stale_connection(self):
+        session = http_session()
+
+        with FileServer({'/a.jar': b'a'}) as server:
+            session.open(server.url('/a.jar')).read()
+
+            # Replace the idle connection with one that's closed on the other end
+            for _, conn in session._pool._idle[('http', server.url('')[7:])]:
+                conn.sock.close()  # type: ignore
+                conn.sock, other = socketpair()
+                other.close()
+
+            self.assertEqual(session.open(server.url('/a.jar')).read(), b'a')
+
+        session.close()
+
+    def test_headers(self):
+        session = http_session(user_agent='test-agent')
+
+        with FileServer({'/a.jar': b'a'}) as server:
+            session.open(server.url('/a.jar')).read()
+            session.open(server.url('/a.jar'), {'User-Agent': 'other'}).read()
+
+        self.assertEqual(server.user_agents, ['test-agent', 'other'])
+
+    def test_connect_timeout(self):
+        session = http_session(connect_timeout=10)
+
+        timeouts: list[float] = []
+        connect = HTTPConnection.connect
+
+        def recorded(conn: HTTPConnection) -> None:
+            timeouts.append(conn.timeout)
+            connect(conn)
+
+        with FileServer({'/a.jar': b'a'}) as server, \
+                patch.object(HTTPConnection, 'connect', recorded):
+            session.open(server.url('/a.jar'), connect_timeout=2).close()
+            session._pool.close()
+            session.open(server.url('/a.jar')).close()
+
+        self.assertEqual(timeouts, [2, 10])
+        session.close()
+
+    def test_deadline(self):
+        session = http_session(deadline=0.3)
+
+        with FileServer({'/a.jar': b'a' * 10240}, delay=0.1) as server:
+            with self.assertRaises(TimeoutError):
+                session.open(server.url('/a.jar')).read()
+
+        session.close()
+
+    def test_low_speed(self):
+        session = http_session(low_speed_limit=100_000, low_speed_time=0.3)
+
+        with FileServer({'/a.jar': b'a' * 10240}, delay=0.1) as server:
+            with self.assertRaises(StalledError):
+                session.open(server.url('/a.jar')).read()
+
+            # Fast transfers aren't affected
+            server.delay = 0
+            self.assertEqual(session.open(server.url('/a.jar')).read(), b'a' * 10240)
+
+        session.close()
+
+    def test_low_speed_waits(self):
+        session = http_session(low_speed_limit=100_000, low_speed_time=0.3)
+
+        # Waiting between reads, like to limit the bandwidth, isn't stalling
+        with FileServer({'/a.jar': b'a' * 10240}) as server, \
+                session.open(server.url('/a.jar')) as resp:
+            data = b''
+            while part := resp.read(1024):
+                data += part
+                sleep(0.05)
+                waited(resp, 0.05)
+
+        self.assertEqual(data, b'a' * 10240)
+        session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
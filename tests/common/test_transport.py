@@ -0,0 +1,86 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from os import path
+from urllib import error
+
+from ..config import TMPDIR
+from ..globalfuncs import cleanup
+from ..install.server import FileServer
+from ..install.setup import maketemp
+
+from src.common.session import http_session
+from src.common.transport import cassette, memory_transport
+
+
+class Transport(unittest.TestCase):
+    def test_memory(self):
+        transport = memory_transport({'https://a.com/file.jar': b'abcdef',
+                                      'https://a.com/busy.jar': 503})
+        session = http_session(transport=transport)
+
+        self.assertEqual(session.open('https://a.com/file.jar').read(), b'abcdef')
+        with session.open('https://a.com/file.jar', {'Range': 'bytes=2-3'}) as resp:
+            self.assertEqual(resp.status, 206)
+            self.assertEqual(resp.headers['Content-Range'], 'bytes 2-3/6')
+            self.assertEqual(resp.read(), b'cd')
+        with session.open('https://a.com/file.jar', method='HEAD') as resp:
+            self.assertEqual(resp.headers['Content-Length'], '6')
+            self.assertEqual(resp.read(), b'')
+
+        for url, code in (('https://a.com/busy.jar', 503), ('https://a.com/missing.jar', 404)):
+            with self.assertRaises(error.HTTPError) as cm:
+                session.open(url)
+            self.assertEqual(cm.exception.code, code)
+
+        self.assertEqual(len(transport.requests), 5)
+
+    @cleanup
+    def test_cassette(self):
+        maketemp()
+        fname = path.join(TMPDIR, 'cassette.json')
+
+        # Record a real session
+        with FileServer({'/file.jar': b'a' * 1000}) as server:
+            session = http_session()
+            session.transport = cassette(fname, session.transport)
+
+            self.assertEqual(session.open(server.url('/file.jar')).read(), b'a' * 1000)
+            with session.open(server.url('/file.jar'), {'Range': 'bytes=0-9'}) as resp:
+                self.assertEqual(resp.read(), b'a' * 10)
+            with self.assertRaises(error.HTTPError):
+                session.open(server.url('/missing.jar'))
+
+            session.close()
+
+        # Replay it without the server
+        session = http_session(transport=cassette(fname))
+
+        self.assertEqual(session.open(server.url('/file.jar')).read(), b'a' * 1000)
+        with session.open(server.url('/file.jar'), {'Range': 'bytes=0-9'}) as resp:
+            self.assertEqual(resp.status, 206)
+            self.assertEqual(resp.read(), b'a' * 10)
+        with self.assertRaises(error.HTTPError):
+            session.open(server.url('/missing.jar'))
+
+        # Requests that weren't recorded aren't sent
+        with self.assertRaises(LookupError):
+            session.open(server.url('/other.jar'))
+
+
+if __name__ == '__main__':
+    unittest.main()
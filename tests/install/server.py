@@ -0,0 +1,153 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from gzip import compress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sys import exc_info
+from threading import Event, Thread
+from time import sleep
+from typing import Any
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: 'FileServer'
+    protocol_version = 'HTTP/1.1'  # Keep connections open
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Don't clutter the test output
+
+    def do_HEAD(self) -> None:
+        if not self.server.allow_head:
+            self.send_error(405)
+            return
+
+        self._send(head=True)
+
+    def do_GET(self) -> None:
+        self._send(head=False)
+
+    def _send(self, head: bool) -> None:
+        self.server.requests.append((self.command, self.path))
+        self.server.user_agents.append(self.headers.get('User-Agent', ''))
+
+        if (data := self.server.files.get(self.path)) is None:
+            self.send_error(404)
+            return
+
+        # Compress the whole file if the client accepts it
+        gzipped = self.server.gzip and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            data = compress(data)
+
+        # Parse a 'bytes=start-end' range header
+        start, end = 0, len(data) - 1
+        partial = False
+        if self.server.accept_ranges and not gzipped and (
+                range_header := self.headers.get('Range', '')).startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start = int(first)
+            end = min(int(last), end) if last else end
+            partial = True
+
+        self.send_response(206 if partial else 200)
+        self.send_header('Content-Length', str(end - start + 1))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if partial:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+
+        if not head and self.server.cut and self.server.cut_times > 0:
+            # End the response early without sending the rest
+            self.server.cut_times -= 1
+            self.wfile.write(data[start:min(start + self.server.cut, end + 1)])
+            self.close_connection = True
+        elif not head and self.server.stall:
+            # Stop sending after the first 1024 bytes
+            self.wfile.write(data[start:min(start + 1024, end + 1)])
+            self.wfile.flush()
+            self.server.closing.wait(self.server.stall)
+        elif not head and self.server.delay == 0:
+            self.wfile.write(data[start:end + 1])
+        elif not head:
+            # Send the data slowly
+            for index in range(start, end + 1, 1024):
+                sleep(self.server.delay)
+                self.wfile.write(data[index:min(index + 1024, end + 1)])
+                self.wfile.flush()
+
+
+class FileServer(ThreadingHTTPServer):
+    def __init__(self, files: dict[str, bytes],
+                 allow_head: bool = True,
+                 accept_ranges: bool = True,
+                 delay: float = 0,
+                 gzip: bool = False,
+                 cut: int = 0,
+                 stall: float = 0) -> None:
+        """
+        A local http server that serves files from memory
+
+        :param files: The paths and contents of the served files
+        :param allow_head: If HEAD requests are allowed
+        :param accept_ranges: If Range requests are supported
+        :param delay: The seconds to wait before sending every 1024 bytes
+        :param gzip: If files are compressed for clients that accept gzip
+        :param cut: Close the connection after this many bytes of
+                    the body, for the first `cut_times` responses
+        :param stall: The seconds to wait after the first 1024 bytes
+                      of the body, or until the server is closed
+        """
+
+        super().__init__(('127.0.0.1', 0), _Handler)
+
+        self.files = files
+        self.allow_head = allow_head
+        self.accept_ranges = accept_ranges
+        self.delay = delay
+        self.gzip = gzip
+        self.cut = cut
+        self.cut_times = 1
+        self.stall = stall
+        self.closing = Event()
+        self.requests: list[tuple[str, str]] = []
+        self.user_agents: list[str] = []
+        self.connections = 0
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients closing kept-alive connections isn't an error
+        if not isinstance(exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def url(self, file: str) -> str:
+        "Get the url of a served file"
+        return f"http://127.0.0.1:{self.server_address[1]}{file}"
+
+    def __enter__(self) -> 'FileServer':
+        Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.closing.set()
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,167 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1, sha512
+from os import path
+from unittest.mock import patch
+
+from ..config import TMPDIR
+from ..globalfuncs import cleanup, quiet
+from .server import FileServer
+from .setup import maketemp
+
+from src.install import downloader
+from src.install.downloader import download, download_run, HashMismatchError
+from src.common.cache import download_cache
+from src.install.loadingbar import loadingbar
+from src.install.retry import retry_policy
+from urllib.error import ContentTooShortError
+
+fname = path.join(TMPDIR, 'file.jar')
+data = bytes(range(256)) * 400
+
+
+class Downloader(unittest.TestCase):
+    def assertDownloaded(self):
+        with open(fname, 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+
+        self.assertFalse(path.isfile(fname + '.part'))
+
+    @cleanup
+    def test_download(self):
+        maketemp()
+
+        with FileServer({'/file.jar': data}) as server:
+            download(server.url('/file.jar'), fname, segments=1)
+            self.assertNotIn('Range', str(server.requests))
+
+        self.assertDownloaded()
+
+    @quiet
+    @cleanup
+    @patch.object(downloader, 'SEGMENT_THRESHOLD', 1000)
+    def test_segments(self):
+        maketemp()
+
+        with FileServer({'/file.jar': data}) as server, \
+                loadingbar(total=len(data), unit='B') as bar:
+            download(server.url('/file.jar'), fname, bar, len(data), segments=4)
+
+            # The first request and three more segments
+            self.assertEqual(len(server.requests), 4)
+            self.assertEqual(bar.idx, len(data))
+
+        self.assertDownloaded()
+
+    @cleanup
+    @patch.object(downloader, 'SEGMENT_THRESHOLD', 1000)
+    def test_segments_fallback(self):
+        maketemp()
+
+        with FileServer({'/file.jar': data}, accept_ranges=False) as server:
+            download(server.url('/file.jar'), fname, segments=4)
+            self.assertEqual(len(server.requests), 1)
+
+        self.assertDownloaded()
+
+    @cleanup
+    def test_incomplete(self):
+        maketemp()
+        policy = retry_policy(attempts=2, base_delay=0)
+
+        # The rest is requested after the connection closed early
+        with FileServer({'/file.jar': data}, cut=len(data) // 2) as server:
+            download(server.url('/file.jar'), fname, segments=1, policy=policy)
+            self.assertEqual(len(server.requests), 2)
+
+        self.assertDownloaded()
+
+        # Without a complete response, nothing is placed
+        other = path.join(TMPDIR, 'other.jar')
+        with FileServer({'/file.jar': data}, cut=len(data) // 4) as server:
+            server.cut_times = 2
+            with self.assertRaises(ContentTooShortError):
+                download(server.url('/file.jar'), other, segments=1, policy=policy)
+
+        self.assertFalse(path.isfile(other))
+
+    @cleanup
+    def test_cache(self):
+        maketemp()
+
+        with FileServer({'/file.jar': data}) as server, \
+                patch.object(downloader, 'cache', download_cache(path.join(TMPDIR, 'cache'))):
+            download(server.url('/file.jar'), path.join(TMPDIR, 'other.jar'))
+            download(server.url('/file.jar'), fname)
+
+            # The second file is placed from the cache
+            self.assertEqual(len(server.requests), 1)
+
+            # Unless the file at the url can change
+            download(server.url('/file.jar'), path.join(TMPDIR, 'changed.jar'),
+                     immutable=False)
+            self.assertEqual(len(server.requests), 2)
+
+        self.assertDownloaded()
+
+    @cleanup
+    def test_single_flight(self):
+        maketemp()
+        fnames = [path.join(TMPDIR, f'file{i}.jar') for i in range(3)]
+
+        run = download_run()
+
+        with FileServer({'/file.jar': data}, delay=0.001) as server, \
+                ThreadPoolExecutor(max_workers=3) as executor:
+            for future in [executor.submit(download, server.url('/file.jar'), file, run=run)
+                           for file in fnames]:
+                future.result()
+
+            # Later downloads in the run share it as well
+            download(server.url('/file.jar'), fname, run=run)
+            self.assertEqual(len(server.requests), 1)
+
+            # But not the ones in another run
+            download(server.url('/file.jar'), path.join(TMPDIR, 'other.jar'),
+                     run=download_run(), immutable=False)
+            self.assertEqual(len(server.requests), 2)
+
+        self.assertDownloaded()
+        for file in fnames:
+            with open(file, 'rb') as fp:
+                self.assertEqual(fp.read(), data)
+
+    @cleanup
+    def test_hashes(self):
+        maketemp()
+
+        with FileServer({'/file.jar': data}) as server:
+            # Matching hashes
+            download(server.url('/file.jar'), fname, segments=1,
+                     sha1=sha1(data).hexdigest(), sha512=sha512(data).hexdigest())
+            self.assertDownloaded()
+
+            # A mismatch is retried once before failing
+            with self.assertRaises(HashMismatchError):
+                download(server.url('/file.jar'), path.join(TMPDIR, 'other.jar'),
+                         segments=1, sha512='0' * 128)
+
+            self.assertEqual(len(server.requests), 3)
+            self.assertFalse(path.isfile(path.join(TMPDIR, 'other.jar')))
+            self.assertFalse(path.isfile(path.join(TMPDIR, 'other.jar.part')))
@@ -17,6 +17,7 @@
 import unittest
 from ..globalfuncs import quiet
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator
 from src.install.loadingbar import loadingbar
 
@@ -77,3 +78,19 @@ class Loadingbar(unittest.TestCase):
         self.assertIsInstance(bar_3.iterable, Iterator)
         self.assertEqual(bar_3.total, 20)
         self.assertEqual(bar_3.iterator_len, len(abc_list))
+
+    @quiet
+    def test_threaded_bar(self):
+        # Updating from multiple threads at once
+        bar = loadingbar(total=1000, show_desc=True)
+
+        def work(n: int) -> None:
+            for _ in range(10):
+                bar.set_desc(f"Worker {n}")
+                bar.update(10)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(work, n) for n in range(10)]:
+                future.result()
+
+        self.assertEqual(bar.idx, 1000)
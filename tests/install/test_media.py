@@ -18,9 +18,20 @@ import unittest
 from ..config import CURDIR, INSTDIR
 from ..globalfuncs import cleanup, quiet
 from .setup import setup_dirs
+from .server import FileServer
 
-from src.install.media import prepare, download_files
-from os import path
+from src.common.session import session
+from src.common.transport import memory_transport
+from src.install.loadingbar import loadingbar
+from src.install.media import prepare, download_files, lock, probe_size
+from src.install.scheduler import download_scheduler
+from src.install.urls import media_url
+from src.typings import Manifest
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1, sha512
+from json import dump
+from os import makedirs, path
+from unittest.mock import patch
 
 manifest_file = path.join(CURDIR, 'assets', 'manifest.json')
 
@@ -31,11 +42,18 @@ class Media(unittest.TestCase):
         # Create the manifest
         self.manifest = prepare.load_manifest(manifest_file)
 
+        # Serve every file from memory instead of the real hosts
+        files: dict[str, bytes | int] = {
+            media_url(media): media['name'].encode() * 100
+            for media in self.manifest['mods'] + self.manifest['resourcepacks']
+            + self.manifest['shaderpacks']}
+
         # Run all sub tests in order
-        self._test_prepare_client()
-        self._test_prepare_server()
-        self._test_download_client()
-        self._test_download_server()
+        with patch.object(session, 'transport', memory_transport(files)):
+            self._test_prepare_client()
+            self._test_prepare_server()
+            self._test_download_client()
+            self._test_download_server()
 
     @quiet
     @cleanup
@@ -68,3 +86,299 @@ class Media(unittest.TestCase):
         setup_dirs()
         download_files(self.total_size_server,
                        INSTDIR, 'server', self.manifest)
+
+
+class ProbeSize(unittest.TestCase):
+    def test_probe_size(self):
+        files = {'/file.jar': b'a' * 1000}
+
+        # Using a HEAD request
+        with FileServer(files) as server:
+            self.assertEqual(probe_size(server.url('/file.jar')), 1000)
+            self.assertEqual(server.requests, [('HEAD', '/file.jar')])
+
+        # Falling back to a range request
+        with FileServer(files, allow_head=False) as server:
+            self.assertEqual(probe_size(server.url('/file.jar')), 1000)
+            self.assertEqual(server.requests[-1], ('GET', '/file.jar'))
+
+        # Falling back when ranges aren't supported
+        with FileServer(files, allow_head=False, accept_ranges=False) as server:
+            self.assertEqual(probe_size(server.url('/file.jar')), 1000)
+
+
+class ProbeCache(unittest.TestCase):
+    manifest: Manifest = {
+        'minecraft': {'version': '1.20.1', 'modloader': 'fabric-0.14.22'},
+        'mods': [{
+            'type': 'cf',
+            'slug': 'worldedit',
+            'name': 'worldedit-mod-7.2.15.jar',
+            'id': 4586218,
+            'sides': ['client', 'server']
+        }, {
+            'type': 'url',
+            'slug': 'example',
+            'name': 'example.jar',
+            'url': 'https://example.com/example.jar',
+            'sides': ['client', 'server']
+        }],
+        'resourcepacks': [],
+        'shaderpacks': []
+    }
+
+    @quiet
+    @cleanup
+    def test_repeat_prepare(self):
+        setup_dirs()
+
+        files: dict[str, bytes | int] = {
+            media_url(media): b'a' * 1000 for media in self.manifest['mods']}
+        transport = memory_transport(files)
+
+        with patch.object(session, 'transport', transport):
+            self.assertEqual(prepare(INSTDIR, 'client', self.manifest).total_size, 2000)
+            probed = len(transport.requests)
+
+            # An unchanged pack is prepared without any requests
+            self.assertEqual(prepare(INSTDIR, 'client', self.manifest).total_size, 2000)
+            self.assertEqual(len(transport.requests), probed)
+
+            # Only the url media is revalidated once it's expired
+            with patch('src.install.media.REVALIDATE_TTL', 0):
+                prepare(INSTDIR, 'client', self.manifest)
+
+            self.assertEqual(transport.requests[probed:],
+                             [('HEAD', 'https://example.com/example.jar')])
+
+
+class Lock(unittest.TestCase):
+    manifest: Manifest = {
+        'minecraft': ProbeCache.manifest['minecraft'],
+        'mods': [{
+            'type': 'cf',
+            'slug': 'worldedit',
+            'name': 'worldedit-mod-7.2.15.jar',
+            'id': 4586218
+        }, {
+            'type': 'url',
+            'slug': 'example',
+            'name': 'example.jar',
+            'url': 'https://example.com/example.jar'
+        }, {
+            'type': 'url',
+            'slug': 'example-copy',
+            'name': 'example-copy.jar',
+            'url': 'https://example.com/example.jar'
+        }],
+        'resourcepacks': [],
+        'shaderpacks': []
+    }
+
+    @quiet
+    @cleanup
+    def test_lock(self):
+        setup_dirs()
+
+        data = {media_url(media): media['slug'].encode() * 100
+                for media in self.manifest['mods']}
+
+        manifest_file = path.join(INSTDIR, 'manifest.json')
+        with open(manifest_file, 'w') as fp:
+            dump(self.manifest, fp)
+
+        # The same url is downloaded once
+        transport = memory_transport(dict(data))
+        with patch.object(session, 'transport', transport):
+            self.assertEqual(lock(manifest_file), 3)
+
+        self.assertEqual(len([request for request in transport.requests
+                              if request[0] == 'GET']), 2)
+
+        # Only the locked values are added
+        manifest = prepare.load_manifest(manifest_file)
+        for original, media in zip(self.manifest['mods'], manifest['mods']):
+            self.assertEqual(set(media), set(original) | {'size', 'sha1', 'sha512'})
+
+            file = data[media_url(media)]
+            self.assertEqual(media['size'], len(file))
+            self.assertEqual(media['sha1'], sha1(file).hexdigest())
+            self.assertEqual(media['sha512'], sha512(file).hexdigest())
+
+        # Prepare trusts the locked sizes without any requests
+        transport = memory_transport({})
+        with patch.object(session, 'transport', transport):
+            total_size = prepare(INSTDIR, 'client', manifest).total_size
+
+        self.assertEqual(total_size, sum(media['size'] for media in manifest['mods']))
+        self.assertEqual(transport.requests, [])
+
+
+class LocalDownload(unittest.TestCase):
+    files = {f'/mod-{n}.jar': bytes([n]) * 5000 * n for n in range(1, 11)}
+
+    def manifest(self, server: FileServer) -> Manifest:
+        return {
+            'minecraft': {'version': '1.20.1', 'modloader': 'fabric-0.14.22'},
+            'mods': [{
+                'type': 'url',
+                'slug': file[1:-4],
+                'name': file[1:],
+                'url': server.url(file),
+                'sides': ['client', 'server']
+            } for file in self.files],
+            'resourcepacks': [],
+            'shaderpacks': []
+        }
+
+    def assertDownloaded(self):
+        for file, data in self.files.items():
+            with open(path.join(INSTDIR, 'mods', file[1:]), 'rb') as fp:
+                self.assertEqual(fp.read(), data)
+
+    @quiet
+    @cleanup
+    def test_download(self):
+        setup_dirs()
+
+        with FileServer(self.files) as server:
+            manifest = self.manifest(server)
+            total_size = prepare(INSTDIR, 'client', manifest, 4).total_size
+            self.assertEqual(total_size, sum(map(len, self.files.values())))
+
+            download_files(total_size, INSTDIR, 'client', manifest, 4)
+
+        self.assertDownloaded()
+
+    @quiet
+    @cleanup
+    def test_download_pipelined(self):
+        setup_dirs()
+
+        with FileServer(self.files) as server:
+            manifest = self.manifest(server)
+            total_size = prepare(INSTDIR, 'client', manifest, probe=False).total_size
+            self.assertEqual(total_size, 0)
+
+            download_files(total_size, INSTDIR, 'client', manifest, 4)
+
+            # No HEAD requests should be sent
+            self.assertNotIn('HEAD', [method for method, _ in server.requests])
+
+        self.assertDownloaded()
+
+    @quiet
+    @cleanup
+    def test_download_locked_total(self):
+        setup_dirs()
+
+        # Record the total and progress of every bar when it closes
+        bars: list[tuple[int, int]] = []
+        close = loadingbar.__exit__
+
+        def recorded(bar: loadingbar[int], *args) -> bool:
+            bars.append((bar.total, bar.idx))
+            return close(bar, *args)
+
+        with FileServer(self.files) as server, \
+                patch.object(loadingbar, '__exit__', recorded):
+            manifest = self.manifest(server)
+            for media in manifest['mods']:
+                media['size'] = len(self.files['/' + media['name']])
+
+            # Without probing, and again when everything is installed
+            for _ in range(2):
+                download_files(prepare(INSTDIR, 'client', manifest, probe=False).total_size,
+                               INSTDIR, 'client', manifest, 4)
+
+        total = sum(map(len, self.files.values()))
+        self.assertEqual(bars, [(total, total), (total, total)])
+        self.assertDownloaded()
+
+    @quiet
+    @cleanup
+    def test_download_hashes(self):
+        setup_dirs()
+        makedirs(path.join(INSTDIR, 'mods'))
+
+        # Leave an installed file with the wrong contents behind
+        with open(path.join(INSTDIR, 'mods', 'mod-1.jar'), 'wb') as fp:
+            fp.write(b'corrupted')
+
+        with FileServer(self.files) as server:
+            manifest = self.manifest(server)
+            for media in manifest['mods']:
+                media['sha1'] = sha1(self.files['/' + media['name']]).hexdigest()
+
+            prepare(INSTDIR, 'client', manifest, probe=False)
+            download_files(0, INSTDIR, 'client', manifest)
+
+        self.assertDownloaded()
+
+    @quiet
+    @cleanup
+    def test_download_adaptive(self):
+        setup_dirs()
+
+        with FileServer(self.files) as server, \
+                patch('src.install.media.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as executor:
+            manifest = self.manifest(server)
+            prepare(INSTDIR, 'client', manifest, probe=False)
+            download_files(0, INSTDIR, 'client', manifest, 2,
+                           download_scheduler(2, adaptive=True))
+
+        # The scheduler limits the connections instead of the threads
+        executor.assert_called_once_with(max_workers=len(self.files))
+        self.assertDownloaded()
+
+    @quiet
+    @cleanup
+    def test_download_mismatch(self):
+        setup_dirs()
+
+        with FileServer(self.files) as server:
+            manifest = self.manifest(server)
+            manifest['mods'][0]['sha1'] = '0' * 40
+
+            # The other files are still downloaded
+            prepare(INSTDIR, 'client', manifest, probe=False)
+            download_files(0, INSTDIR, 'client', manifest)
+
+        self.assertFalse(path.isfile(path.join(INSTDIR, 'mods', 'mod-1.jar')))
+        self.assertTrue(path.isfile(path.join(INSTDIR, 'mods', 'mod-10.jar')))
+
+    @quiet
+    @cleanup
+    def test_download_resume(self):
+        setup_dirs()
+        makedirs(path.join(INSTDIR, 'mods'))
+
+        # Leave a half downloaded file behind
+        for file, data in self.files.items():
+            with open(path.join(INSTDIR, 'mods', file[1:] + '.part'), 'wb') as fp:
+                fp.write(data[:len(data) // 2])
+
+        with FileServer(self.files) as server:
+            manifest = self.manifest(server)
+            prepare(INSTDIR, 'client', manifest, probe=False)
+            download_files(0, INSTDIR, 'client', manifest)
+
+        self.assertDownloaded()
+        self.assertFalse(path.isfile(path.join(INSTDIR, 'mods', 'mod-1.jar.part')))
+
+    @quiet
+    @cleanup
+    def test_download_restart(self):
+        setup_dirs()
+        makedirs(path.join(INSTDIR, 'mods'))
+
+        # Leave an invalid partial file behind
+        with open(path.join(INSTDIR, 'mods', 'mod-1.jar.part'), 'wb') as fp:
+            fp.write(b'x' * 10000)
+
+        with FileServer(self.files, accept_ranges=False) as server:
+            manifest = self.manifest(server)
+            prepare(INSTDIR, 'client', manifest, probe=False)
+            download_files(0, INSTDIR, 'client', manifest)
+
+        self.assertDownloaded()
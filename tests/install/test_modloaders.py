@@ -15,34 +15,165 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import unittest
+from hashlib import sha1
+from io import BytesIO
+from json import dumps, load
+from os import path
+from unittest.mock import patch
+from zipfile import ZipFile
+
 from ..config import INSTDIR, LAUNDIR
 from ..globalfuncs import cleanup, quiet
 from .setup import setup_dirs
 
+from src.apis import fabric_meta, piston_meta
+from src.common.maven_coords import maven_parse
+from src.common.response_cache import response_cache
+from src.common.session import session
+from src.common.transport import memory_transport
 from src.install.modloaders import forge, fabric
+from src.install.state import install_state
+from src.install.urls import fabric as fabric_urls, forge as forge_urls
+
+
+def jar(files: dict[str, bytes]) -> bytes:
+    "Make a jar file in memory"
+    with BytesIO() as buffer:
+        with ZipFile(buffer, 'w') as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+        return buffer.getvalue()
+
+
+def library(name: str, data: bytes, url: str) -> dict:
+    "Make a library of a version json"
+    file = maven_parse(name).to_file()
+    return {'name': name, 'downloads': {'artifact': {
+        'path': file.replace(path.sep, '/'), 'url': url and url + file.replace(path.sep, '/'),
+        'sha1': sha1(data).hexdigest(), 'size': len(data)
+    }}}
+
+
+# The files of the hosts, served from memory instead of the network
+files: dict[str, bytes | int] = {
+    'https://libraries.minecraft.net/com/mojang/logging/1.1.1/logging-1.1.1.jar': b'logging',
+    'https://piston-data.mojang.com/client.jar': b'client',
+    'https://piston-data.mojang.com/server.jar': b'server'
+}
+
+minecraft_json = dumps({
+    'id': '1.20.1',
+    'downloads': {side: {'url': f'https://piston-data.mojang.com/{side}.jar',
+                         'sha1': sha1(files[f'https://piston-data.mojang.com/{side}.jar']).hexdigest()}
+                  for side in ('client', 'server')},
+    'libraries': [library('com.mojang:logging:1.1.1', b'logging', 'https://libraries.minecraft.net/')]
+}).encode()
+
+files |= {
+    piston_meta.version_manifest_v2: dumps({'latest': {}, 'versions': [{
+        'id': '1.20.1', 'url': 'https://piston-meta.mojang.com/v1/1.20.1.json',
+        'sha1': sha1(minecraft_json).hexdigest()
+    }]}).encode(),
+    'https://piston-meta.mojang.com/v1/1.20.1.json': minecraft_json
+}
+
+# A forge installer without processors, as they need java
+files[forge_urls.MAVEN + 'net/minecraftforge/forge/1.20.1-47.1.0/forge-1.20.1-47.1.0-universal.jar'] = b'universal'
+files[forge_urls.forge_installer_url('1.20.1', '47.1.0')] = jar({
+    'install_profile.json': dumps({'icon': '', 'libraries': [
+        library('net.minecraftforge:forge:1.20.1-47.1.0:universal', b'universal', forge_urls.MAVEN)
+    ]}).encode(),
+    'version.json': dumps({'id': '1.20.1-forge-47.1.0', 'libraries': [
+        library('net.minecraftforge:forge:1.20.1-47.1.0:client', b'client library', '')
+    ]}).encode(),
+    'maven/net/minecraftforge/forge/1.20.1-47.1.0/forge-1.20.1-47.1.0-client.jar': b'client library'
+})
+
+# A fabric loader with one library of its own
+loader_url = 'https://meta.fabricmc.net/v2/versions/loader/1.20.1/0.14.22'
+fabric_libraries = ['net.fabricmc:fabric-loader:0.14.22', 'net.fabricmc:intermediary:1.20.1',
+                    'org.ow2.asm:asm:9.5']
+files |= {
+    loader_url + '/': dumps({
+        'loader': {'maven': fabric_libraries[0]},
+        'intermediary': {'maven': fabric_libraries[1]},
+        'launcherMeta': {'libraries': {'client': [], 'common': [
+            {'name': fabric_libraries[2], 'url': fabric_urls.MAVEN}
+        ], 'server': []}}
+    }).encode(),
+    loader_url + '/profile/json': dumps({'id': 'fabric-loader-0.14.22-1.20.1'}).encode()
+}
+files |= {maven_parse(name).to_url(fabric_urls.MAVEN): name.encode() for name in fabric_libraries}
 
 
+@patch.object(session, 'transport', memory_transport(files))
+@patch.object(piston_meta, 'META_DIR', '')
+@patch.object(piston_meta, 'meta_cache', response_cache(''))
+@patch.object(fabric_meta, 'meta_cache', response_cache(''))
+@patch('src.install.modloaders.check_call')
 class Modloaders(unittest.TestCase):
+    def assertLibraries(self, directory: str, names: list[str], data: list[bytes]):
+        for name, content in zip(names, data):
+            with open(maven_parse(name).to_file(directory, 'libraries'), 'rb') as fp:
+                self.assertEqual(fp.read(), content)
+
     @quiet
     @cleanup
-    def test_forge_client(self):
+    def test_forge_client(self, _):
         setup_dirs()
         forge('1.20.1', '47.1.0', 'client', INSTDIR, LAUNDIR)
 
+        with open(client_jar := path.join(LAUNDIR, 'versions', '1.20.1', '1.20.1.jar'), 'rb') as fp:
+            self.assertEqual(fp.read(), b'client')
+
+        # The minecraft jar is recorded, so it isn't downloaded again
+        with install_state(LAUNDIR) as state:
+            self.assertTrue(state.intact(client_jar, 'https://piston-data.mojang.com/client.jar',
+                                         sha1(b'client').hexdigest()))
+        self.assertTrue(path.isfile(path.join(
+            LAUNDIR, 'versions', '1.20.1-forge-47.1.0', '1.20.1-forge-47.1.0.json')))
+
+        self.assertLibraries(LAUNDIR, [
+            'com.mojang:logging:1.1.1',
+            'net.minecraftforge:forge:1.20.1-47.1.0:universal',
+            'net.minecraftforge:forge:1.20.1-47.1.0:client'
+        ], [b'logging', b'universal', b'client library'])
+
+        with open(path.join(LAUNDIR, 'launcher_profiles.json')) as fp:
+            self.assertEqual(load(fp)['profiles']['forge-1.20.1']['lastVersionId'],
+                             '1.20.1-forge-47.1.0')
+
     @quiet
     @cleanup
-    def test_forge_server(self):
+    def test_forge_server(self, _):
         setup_dirs()
-        forge('1.20.1', '47.1.0', 'server', INSTDIR)
+        installer = forge('1.20.1', '47.1.0', 'server', INSTDIR)
+
+        with open(installer.minecraft_jar, 'rb') as fp:
+            self.assertEqual(fp.read(), b'server')
+
+        self.assertLibraries(INSTDIR, [
+            'com.mojang:logging:1.1.1',
+            'net.minecraftforge:forge:1.20.1-47.1.0:universal'
+        ], [b'logging', b'universal'])
 
     @quiet
     @cleanup
-    def test_fabric_client(self):
+    def test_fabric_client(self, _):
         setup_dirs()
         fabric('1.20.1', '0.14.22', 'client', INSTDIR, LAUNDIR)
 
+        self.assertLibraries(LAUNDIR, fabric_libraries, [name.encode() for name in fabric_libraries])
+        self.assertTrue(path.isfile(path.join(
+            LAUNDIR, 'versions', 'fabric-loader-0.14.22-1.20.1.json')))
+
+        with open(path.join(LAUNDIR, 'launcher_profiles.json')) as fp:
+            self.assertIn('fabric-loader-1.20.1', load(fp)['profiles'])
+
     @quiet
     @cleanup
-    def test_fabric_server(self):
+    def test_fabric_server(self, _):
         setup_dirs()
         fabric('1.20.1', '0.14.22', 'server', INSTDIR)
+
+        self.assertLibraries(INSTDIR, fabric_libraries, [name.encode() for name in fabric_libraries])
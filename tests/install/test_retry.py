@@ -0,0 +1,156 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from email.message import Message
+from os import path
+from unittest.mock import patch
+from urllib import error
+
+from ..config import TMPDIR
+from ..globalfuncs import cleanup
+from .server import FileServer
+from .setup import maketemp
+
+from src.install import mirrors
+from src.install.downloader import download
+from src.install.mirrors import add_mirrors, alternatives, parse_mirror, rank_mirrors
+from src.install.retry import retry, retry_policy
+
+fname = path.join(TMPDIR, 'file.jar')
+data = bytes(range(256)) * 40
+
+
+def http_error(code: int, retry_after: str | None = None) -> error.HTTPError:
+    headers = Message()
+    if retry_after is not None:
+        headers['Retry-After'] = retry_after
+
+    return error.HTTPError('https://example.com/', code, 'error', headers, None)
+
+
+class Retry(unittest.TestCase):
+    def test_policy(self):
+        policy = retry_policy(base_delay=1, max_delay=4)
+
+        self.assertTrue(policy.retryable(http_error(503)))
+        self.assertTrue(policy.retryable(error.URLError('timed out')))
+        self.assertTrue(policy.retryable(TimeoutError()))
+        self.assertFalse(policy.retryable(http_error(404)))
+        self.assertFalse(policy.retryable(ValueError()))
+
+        # The jitter stays below the doubled delay
+        for failures, maximum in ((1, 1), (2, 2), (3, 4), (6, 4)):
+            self.assertLessEqual(policy.delay(failures, http_error(500)), maximum)
+
+        # Retry-After is honoured on 429 and 503
+        self.assertEqual(policy.delay(1, http_error(429, '7')), 7)
+        self.assertEqual(policy.delay(1, http_error(503, 'Thu, 01 Jan 1970 00:00:00 GMT')), 0)
+        self.assertLessEqual(policy.delay(1, http_error(500, '7')), 1)
+
+    def test_retry(self):
+        policy = retry_policy(attempts=3, base_delay=0)
+        calls: list[str] = []
+
+        def flaky(url: str) -> str:
+            calls.append(url)
+            if len(calls) < 3:
+                raise http_error(503)
+            return url
+
+        # Transient errors alternate between the urls
+        self.assertEqual(retry(flaky, ['a', 'b'], policy), 'a')
+        self.assertEqual(calls, ['a', 'b', 'a'])
+
+        # Permanent errors only move on to the next url
+        calls.clear()
+
+        def missing(url: str) -> str:
+            calls.append(url)
+            raise http_error(404)
+
+        with self.assertRaises(error.HTTPError):
+            retry(missing, ['a', 'b'], policy)
+        self.assertEqual(calls, ['a', 'b'])
+
+        # Transient errors give up after the attempts
+        calls.clear()
+
+        def unavailable(url: str) -> str:
+            calls.append(url)
+            raise http_error(503)
+
+        with self.assertRaises(error.HTTPError):
+            retry(unavailable, ['a'], policy)
+        self.assertEqual(calls, ['a'] * 3)
+
+    @patch.dict(mirrors.mirrors, clear=True)
+    def test_mirrors(self):
+        self.assertEqual(parse_mirror('https://a.com/=https://b.com/maven'),
+                         ('https://a.com/', 'https://b.com/maven'))
+        with self.assertRaises(ValueError):
+            parse_mirror('https://a.com/')
+
+        add_mirrors('https://a.com', 'https://b.com/maven', 'https://a.com/')
+        self.assertEqual(alternatives('https://a.com/lib/file.jar'),
+                         ['https://a.com/lib/file.jar', 'https://b.com/maven/lib/file.jar'])
+        self.assertEqual(alternatives('https://c.com/file.jar'), ['https://c.com/file.jar'])
+
+    @cleanup
+    @patch.dict(mirrors.mirrors, clear=True)
+    @patch.dict(mirrors.rankings, clear=True)
+    @patch.object(mirrors, 'RANKINGS_FILE', path.join(TMPDIR, 'mirrors.json'))
+    def test_rank(self):
+        maketemp()
+
+        with FileServer({}) as origin, FileServer({}) as mirror:
+            # The origin is unreachable, so the mirror is ranked first
+            unreachable = origin.url('/')
+            origin.shutdown()
+            origin.server_close()
+
+            add_mirrors(unreachable, mirror.url('/maven/'))
+            rank_mirrors()
+
+            self.assertEqual(alternatives(unreachable + 'file.jar'),
+                             [mirror.url('/maven/file.jar'), unreachable + 'file.jar'])
+
+            # The ranking is stored, and reused until it expires
+            with patch.object(mirrors, 'probe', return_value=0.1) as probe:
+                mirrors.rankings.clear()
+                rank_mirrors()
+                probe.assert_not_called()
+
+                rank_mirrors(force=True)
+                self.assertEqual(probe.call_count, 2)
+
+    @cleanup
+    @patch.dict(mirrors.mirrors, clear=True)
+    def test_failover(self):
+        maketemp()
+
+        with FileServer({}) as origin, FileServer({'/maven/file.jar': data}) as mirror:
+            add_mirrors(origin.url('/'), mirror.url('/maven/'))
+            download(origin.url('/file.jar'), fname)
+
+            self.assertEqual(len(origin.requests), 1)
+
+        with open(fname, 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from os import path
+from time import monotonic
+from unittest.mock import patch
+from urllib.error import URLError
+
+from ..config import TMPDIR
+from ..globalfuncs import cleanup
+from .server import FileServer
+from .setup import maketemp
+
+from src.install import downloader, mirrors, scheduler
+from src.install.downloader import download
+from src.install.mirrors import add_mirrors
+from src.install.scheduler import (
+    download_scheduler, parse_rate, token_bucket, MAX_HOST_CONNECTIONS
+)
+
+fname = path.join(TMPDIR, 'file.jar')
+data = bytes(range(256)) * 400
+
+
+class Scheduler(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('1000'), 1000)
+        self.assertEqual(parse_rate('500K'), 500 * 1024)
+        self.assertEqual(parse_rate('1.5m'), int(1.5 * 1024 ** 2))
+        self.assertEqual(parse_rate('2MB/s'), 2 * 1024 ** 2)
+
+        for rate in ('', 'fast', '5X', '0'):
+            with self.assertRaises(ValueError):
+                parse_rate(rate)
+
+    def test_token_bucket(self):
+        bucket = token_bucket(100_000)
+
+        # The burst is free, the rest waits for the rate
+        start = monotonic()
+        for _ in range(3):
+            bucket.consume(50_000)
+        self.assertAlmostEqual(monotonic() - start, 0.5, delta=0.2)
+
+    def test_host_connections(self):
+        scheduler = download_scheduler(host_connections=2)
+
+        self.assertEqual(scheduler.acquire('https://a.com/1.jar'), 1)
+        self.assertEqual(scheduler.acquire('https://a.com/2.jar', 4, wait=False), 1)
+
+        # Other hosts have their own slots
+        self.assertEqual(scheduler.acquire('https://b.com/1.jar', 2, wait=False), 2)
+        self.assertEqual(scheduler.acquire('https://a.com/3.jar', wait=False), 0)
+
+        scheduler.release('https://a.com/1.jar', 2)
+        self.assertEqual(scheduler.acquire('https://a.com/3.jar', wait=False), 1)
+
+    def test_adaptive(self):
+        adaptive = download_scheduler(host_connections=2, adaptive=True)
+        url = 'https://a.com/file.jar'
+
+        # Every success grows the limit by one divided by the limit
+        for _ in range(6):
+            with adaptive.slot(url):
+                pass
+        self.assertEqual(adaptive.status(url), 'a.com 0/4')
+
+        # Congestion halves it, but only once at a time
+        for _ in range(2):
+            with self.assertRaises(URLError), adaptive.slot(url):
+                raise URLError(ConnectionResetError())
+        self.assertEqual(adaptive.status(url), 'a.com 0/2')
+
+        # Other errors don't change it
+        with self.assertRaises(ValueError), adaptive.slot(url):
+            raise ValueError()
+        self.assertEqual(adaptive.status(url), 'a.com 0/2')
+
+        for _ in range(1000):
+            adaptive.grow(url)
+        self.assertEqual(adaptive.acquire(url, 100, wait=False), MAX_HOST_CONNECTIONS)
+
+    @cleanup
+    def test_bandwidth(self):
+        maketemp()
+
+        with FileServer({'/file.jar': data}) as server:
+            start = monotonic()
+            download(server.url('/file.jar'), fname, segments=1,
+                     scheduler=download_scheduler(bandwidth=len(data) // 2))
+
+        # Half of the file is the burst, the other half takes a second
+        self.assertAlmostEqual(monotonic() - start, 1, delta=0.4)
+
+        with open(fname, 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+
+    @cleanup
+    @patch.object(downloader, 'SEGMENT_THRESHOLD', 1000)
+    def test_segments(self):
+        maketemp()
+
+        # Segments only use the connections that are left
+        with FileServer({'/file.jar': data}) as server:
+            download(server.url('/file.jar'), fname, segments=4,
+                     scheduler=download_scheduler(host_connections=2))
+            self.assertEqual(len(server.requests), 2)
+
+        with open(fname, 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+
+    @patch.object(scheduler, 'HEDGE_DELAY', 1)
+    @patch.object(scheduler, 'HEDGE_MIN_SIZE', 1000)
+    def test_should_hedge(self):
+        hedged = download_scheduler(hedge=True)
+
+        # There's nothing to compare with yet
+        self.assertFalse(hedged.should_hedge(1000, 2, 10_000))
+
+        for _ in range(3):
+            hedged.record_rate(1024 ** 2, 1)
+        self.assertEqual(hedged.expected_rate(), 1024 ** 2)
+
+        self.assertTrue(hedged.should_hedge(1000, 2, 10_000))
+        self.assertFalse(hedged.should_hedge(1000, 0.5, 10_000))
+        self.assertFalse(hedged.should_hedge(1000, 2, 500))
+        self.assertFalse(hedged.should_hedge(1024 ** 2, 2, 10_000))
+
+    @cleanup
+    @patch.dict(mirrors.mirrors, clear=True)
+    @patch.object(scheduler, 'HEDGE_DELAY', 0.2)
+    @patch.object(scheduler, 'HEDGE_MIN_SIZE', 1000)
+    def test_hedge(self):
+        maketemp()
+
+        hedged = download_scheduler(hedge=True)
+        for _ in range(3):
+            hedged.record_rate(1024 ** 3, 1)
+
+        # The origin would take about five seconds, the mirror is instant
+        with FileServer({'/file.jar': data}, delay=0.05) as origin, \
+                FileServer({'/file.jar': data}) as mirror:
+            add_mirrors(origin.url('/'), mirror.url('/'))
+
+            start = monotonic()
+            download(origin.url('/file.jar'), fname, segments=1, scheduler=hedged)
+            self.assertLess(monotonic() - start, 2)
+
+            self.assertEqual(mirror.requests, [('GET', '/file.jar')])
+
+        with open(fname, 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+
+    @cleanup
+    @patch.dict(mirrors.mirrors, clear=True)
+    @patch.object(scheduler, 'HEDGE_DELAY', 0.2)
+    @patch.object(scheduler, 'HEDGE_MIN_SIZE', 1000)
+    def test_hedge_stalled(self):
+        maketemp()
+
+        hedged = download_scheduler(hedge=True)
+        for _ in range(3):
+            hedged.record_rate(1024 ** 3, 1)
+
+        # The origin stops sending, which would only end at the read timeout
+        with FileServer({'/file.jar': data}, stall=30) as origin, \
+                FileServer({'/file.jar': data}) as mirror:
+            add_mirrors(origin.url('/'), mirror.url('/'))
+
+            start = monotonic()
+            download(origin.url('/file.jar'), fname, segments=1, scheduler=hedged)
+            self.assertLess(monotonic() - start, 2)
+
+            self.assertEqual(mirror.requests, [('GET', '/file.jar')])
+
+        with open(fname, 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from os import path
+
+from ..config import INSTDIR
+from ..globalfuncs import cleanup
+from .setup import setup_dirs
+
+from src.install.state import install_state
+
+
+class InstallState(unittest.TestCase):
+    @cleanup
+    def test_state(self):
+        setup_dirs()
+
+        with open(fname := path.join(INSTDIR, 'file.jar'), 'wb') as fp:
+            fp.write(b'file contents')
+
+        with install_state(INSTDIR) as state:
+            self.assertFalse(state.intact(fname))
+
+            # Record the file
+            state.record(fname, 'https://example.com/file.jar', 'AB' * 20)
+            self.assertTrue(state.intact(fname))
+            self.assertTrue(state.intact(fname, 'https://example.com/file.jar', 'ab' * 20))
+            self.assertFalse(state.intact(fname, 'https://example.com/other.jar'))
+            self.assertFalse(state.intact(fname, sha1='cd' * 20))
+
+            self.assertEqual(state.installed(), {
+                'file.jar': ('https://example.com/file.jar', 13, 'ab' * 20)
+            })
+
+        # The index persists, but notices changes
+        with install_state(INSTDIR) as state:
+            self.assertTrue(state.intact(fname))
+
+            with open(fname, 'ab') as fp:
+                fp.write(b'modified')
+            self.assertFalse(state.intact(fname))
+
+            state.forget(fname)
+            self.assertEqual(state.installed(), {})
@@ -0,0 +1,87 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from json import dump
+from os import path
+
+from ..config import INSTDIR, TMPDIR
+from ..globalfuncs import cleanup, quiet
+from .server import FileServer
+from .setup import setup_dirs
+
+from src.install.media import install
+from src.install.update import RECORD_FILE, load_record
+from src.typings import Manifest
+
+manifest_file = path.join(TMPDIR, 'manifest.json')
+
+
+def write_manifest(server: FileServer, files: dict[str, str]) -> None:
+    "Write a manifest with mods named after the keys, served from the values"
+    manifest: Manifest = {
+        'minecraft': {'version': '1.20.1', 'modloader': 'fabric-0.14.22'},
+        'mods': [{
+            'type': 'url',
+            'slug': name[:-4],
+            'name': name,
+            'url': server.url(file),
+            'sides': ['client', 'server']
+        } for name, file in files.items()],
+        'resourcepacks': [],
+        'shaderpacks': []
+    }
+
+    with open(manifest_file, 'w') as fp:
+        dump(manifest, fp)
+
+
+class Update(unittest.TestCase):
+    @quiet
+    @cleanup
+    def test_update(self):
+        setup_dirs()
+
+        files = {f'/{n}.jar': bytes([n]) * 1000 for n in range(5)}
+
+        def mod(name: str) -> str:
+            return path.join(INSTDIR, 'mods', name)
+
+        with FileServer(files) as server:
+            # Install the first version
+            write_manifest(server, {'a.jar': '/0.jar', 'b.jar': '/1.jar', 'c.jar': '/2.jar'})
+            install(manifest_file, INSTDIR, install_modloader=False, confirm=False)
+
+            record = load_record(INSTDIR)
+            self.assertIsNotNone(record)
+            self.assertEqual(len(record['files']) if record else 0, 3)
+
+            # Remove a.jar, change b.jar and add d.jar
+            server.requests.clear()
+            write_manifest(server, {'b.jar': '/3.jar', 'c.jar': '/2.jar', 'd.jar': '/4.jar'})
+            install(manifest_file, INSTDIR, install_modloader=False,
+                    confirm=False, update=True)
+
+            # Only the changed and added files are requested
+            self.assertEqual(sorted(set(file for _, file in server.requests)),
+                             ['/3.jar', '/4.jar'])
+
+        self.assertFalse(path.isfile(mod('a.jar')))
+        for name, file in {'b.jar': '/3.jar', 'c.jar': '/2.jar', 'd.jar': '/4.jar'}.items():
+            with open(mod(name), 'rb') as fp:
+                self.assertEqual(fp.read(), files[file])
+
+        self.assertTrue(path.isfile(path.join(INSTDIR, RECORD_FILE)))
@@ -0,0 +1,53 @@
+# MCM-Manager: Minecraft Modpack Manager
+# Copyright (C) 2023  Tygo Everts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from io import BytesIO
+
+from src.install.writer import stream, MAX_BUFFER_SIZE
+
+data = bytes(range(256)) * (MAX_BUFFER_SIZE // 64)
+
+
+class Writer(unittest.TestCase):
+    def test_stream(self):
+        for write_behind in (False, True):
+            sizes: list[int] = []
+            fp = BytesIO()
+
+            # Copy everything
+            self.assertEqual(stream(BytesIO(data), fp, on_data=lambda part: sizes.append(
+                len(part)), write_behind=write_behind), len(data))
+
+            self.assertEqual(fp.getvalue(), data)
+            self.assertEqual(sum(sizes), len(data))
+
+            # Copy a limited amount of bytes
+            fp = BytesIO()
+            self.assertEqual(stream(BytesIO(data), fp, 1000, write_behind=write_behind), 1000)
+            self.assertEqual(fp.getvalue(), data[:1000])
+
+            # A response that ends early
+            fp = BytesIO()
+            self.assertEqual(stream(BytesIO(data[:10]), fp, 1000, write_behind=write_behind), 10)
+
+    def test_write_error(self):
+        class Full(BytesIO):
+            def write(self, data: bytes) -> int:  # type: ignore
+                raise OSError("No space left on device")
+
+        with self.assertRaises(OSError):
+            stream(BytesIO(data), Full(), write_behind=True)